@@ -0,0 +1,124 @@
+"""
+Cart Serializer Benchmark
+
+Compares the two ways a cart endpoint can turn an Order into response bytes,
+for carts of 1, 50 and 500 line items:
+
+- model: order_to_dict, then the work FastAPI does for response_model=CartSchema
+  (validate the dict, dump it in JSON mode, json.dumps it as JSONResponse does)
+- fast:  cart_serializer.order_to_json
+
+Orders are built in memory (no database), with Decimal prices like rows
+loaded from NUMERIC columns.
+
+Usage:
+    python benchmark.py                          # JSON report to stdout
+    python benchmark.py --items 1 50 500 2000 --iterations 5000 -o run.json
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import platform
+import sys
+import time
+import uuid
+from decimal import Decimal
+
+DEFAULT_ITEM_COUNTS = [1, 50, 500]
+
+
+def summarize(latencies_ns: list[int], elapsed_s: float) -> dict:
+    """Iteration count, latency percentiles in microseconds and throughput for one run."""
+    ordered = sorted(latencies_ns)
+
+    def percentile(p: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))] / 1000.0, 2)
+
+    return {
+        "iterations": len(ordered),
+        "p50_us": percentile(0.50),
+        "p95_us": percentile(0.95),
+        "p99_us": percentile(0.99),
+        "throughput_per_s": round(len(ordered) / elapsed_s, 1) if elapsed_s > 0 else None,
+    }
+
+
+def _order(item_count: int):
+    from models import LineItem, Order
+
+    order = Order(
+        id=1, token=uuid.uuid4(), state="cart", email="shopper@example.com", currency="USD",
+        item_count=item_count, subtotal=Decimal("0.00"), discount_amount=Decimal("5.00"), discount_code="SAVE5",
+        ship_total=Decimal("4.99"), total=Decimal("0.00"),
+    )
+    order.line_items = [
+        LineItem(
+            id=i, order_id=1, product_id=1 + i % 12, variant_id=100 + i, quantity=1 + i % 3,
+            price=Decimal("19.99") + i, name=f"Product {i} (Size: M)", slug=f"product-{i}",
+            image_url=f"/images/product-{i}.jpg",
+        )
+        for i in range(1, item_count + 1)
+    ]
+    return order
+
+
+def _time(fn, order, iterations: int) -> dict:
+    latencies: list[int] = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        t0 = time.perf_counter_ns()
+        fn(order)
+        latencies.append(time.perf_counter_ns() - t0)
+    return summarize(latencies, time.perf_counter() - started)
+
+
+def run(item_counts: list[int], iterations: int) -> dict:
+    from pydantic import TypeAdapter
+
+    from cart_serializer import order_to_json
+    from cart_utils import order_to_dict
+    from schemas import CartSchema
+
+    adapter = TypeAdapter(CartSchema)
+
+    def model_path(order) -> bytes:
+        value = adapter.validate_python(order_to_dict(order))
+        content = adapter.dump_python(value, mode="json")
+        return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode()
+
+    runs = []
+    for count in item_counts:
+        order = _order(count)
+        if json.loads(model_path(order)) != json.loads(order_to_json(order)):
+            raise AssertionError(f"serializers disagree for {count} line items")
+        # Fewer iterations for large carts keep each run to a few seconds.
+        n = max(50, iterations // max(1, count // 10))
+        model = _time(model_path, order, n)
+        fast = _time(order_to_json, order, n)
+        runs.append({
+            "line_items": count,
+            "benchmarks": {"model": model, "fast": fast},
+            "speedup_p50": round(model["p50_us"] / fast["p50_us"], 2) if fast["p50_us"] else None,
+        })
+    return {"python": platform.python_version(), "runs": runs}
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark cart response serialization.")
+    parser.add_argument("--items", type=int, nargs="+", default=DEFAULT_ITEM_COUNTS, help="line items per cart")
+    parser.add_argument("--iterations", type=int, default=2000, help="serializations per cart size")
+    parser.add_argument("-o", "--output", help="write the JSON report to this file")
+    args = parser.parse_args(argv)
+
+    report = json.dumps(run(args.items, args.iterations), indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report + "\n")
+    else:
+        print(report)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,162 @@
+"""
+Batch Cart Mutations
+
+POST /cart/items/batch applies a list of add / set_quantity / remove
+operations in one transaction, for reorders, saved-cart restores and load
+tests:
+
+1. Variants for every add are resolved and priced concurrently, before any
+   row lock is taken.
+2. The cart's line items are read once and the operations are folded, in
+   order, into a final quantity per variant.
+3. Changes are written set-based: one INSERT ... ON CONFLICT (order_id,
+   variant_id) upsert for new variants, one bulk UPDATE for changed
+   quantities and one DELETE for removed items.
+4. Totals are recomputed once with a single aggregate UPDATE that only
+   applies if the order is still at the version read with the request, then
+   committed. If another write got in between, steps 2-4 are retried.
+
+Carts held in the Redis store (ephemeral_carts) get the same fold, applied
+to the cart hash in one optimistic Redis transaction.
+"""
+from __future__ import annotations
+
+import asyncio
+
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from cart_concurrency import run_with_retry_async
+import ephemeral_carts
+from cart_utils import increment_line_items, recalculate_totals_async, to_money
+from models import LineItem, Order
+from pricing_client import fetch_adjusted_price
+from schemas import BatchOperation
+from variant_cache import CachedVariant, CatalogUnavailable, get_variant
+
+
+async def _resolve_variants(variant_ids: list[int], headers: dict) -> dict[int, CachedVariant]:
+    try:
+        found = await asyncio.gather(*(get_variant(vid, headers) for vid in variant_ids))
+    except CatalogUnavailable:
+        raise HTTPException(status_code=503, detail="Catalog service unavailable")
+    missing = [vid for vid, variant in zip(variant_ids, found) if variant is None]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Variants not found in catalog: {missing}")
+    return dict(zip(variant_ids, found))
+
+
+async def _price_variants(variants: dict[int, CachedVariant], cart_total: float, parent_span) -> dict[int, float]:
+    prices = await asyncio.gather(*(
+        fetch_adjusted_price(
+            variant_id=vid, base_price=variant.price, cart_total=cart_total, parent_span=parent_span,
+        )
+        for vid, variant in variants.items()
+    ))
+    return dict(zip(variants, prices))
+
+
+def _fold(operations: list[BatchOperation], current: dict[int, tuple[int, int]]) -> dict[int, int]:
+    """Apply operations in order; return the final quantity of every touched variant.
+
+    current maps variant_id -> (line_item_id, quantity) for the cart's line items.
+    """
+    variant_by_item = {line_item_id: vid for vid, (line_item_id, _) in current.items()}
+    final: dict[int, int] = {}
+
+    def quantity_of(vid: int) -> int:
+        if vid in final:
+            return final[vid]
+        return current[vid][1] if vid in current else 0
+
+    for op in operations:
+        if op.op == "add":
+            final[op.variant_id] = quantity_of(op.variant_id) + op.quantity
+            continue
+        if op.line_item_id is not None:
+            vid = variant_by_item.get(op.line_item_id)
+        else:
+            vid = op.variant_id
+        if vid is None or quantity_of(vid) == 0:
+            target = op.line_item_id if op.line_item_id is not None else f"variant {op.variant_id}"
+            raise HTTPException(status_code=404, detail=f"Line item not found: {target}")
+        final[vid] = 0 if op.op == "remove" else op.quantity
+    return final
+
+
+def _line_values(order_id: int, vid: int, quantity: int, variant: CachedVariant, price: float) -> dict:
+    return {
+        "order_id": order_id,
+        "product_id": variant.product_id,
+        "variant_id": vid,
+        "quantity": quantity,
+        "price": to_money(price),
+        "name": variant.name,
+        "slug": variant.slug,
+        "image_url": variant.image_url,
+    }
+
+
+async def _variants_and_prices(operations: list[BatchOperation], cart_total: float, headers: dict,
+                               parent_span) -> tuple[dict[int, CachedVariant], dict[int, float]]:
+    add_ids = list(dict.fromkeys(op.variant_id for op in operations if op.op == "add"))
+    variants = await _resolve_variants(add_ids, headers) if add_ids else {}
+    prices = await _price_variants(variants, cart_total, parent_span) if variants else {}
+    return variants, prices
+
+
+async def apply_batch(order: Order, operations: list[BatchOperation], db: AsyncSession, headers: dict,
+                      parent_span=None) -> None:
+    """Apply operations to order and commit once. Raises HTTPException on unknown variants or line items."""
+    variants, prices = await _variants_and_prices(operations, float(order.total), headers, parent_span)
+
+    async def attempt() -> None:
+        rows = await db.execute(
+            select(LineItem.id, LineItem.variant_id, LineItem.quantity).where(LineItem.order_id == order.id)
+        )
+        current = {vid: (line_item_id, quantity) for line_item_id, vid, quantity in rows}
+
+        final = _fold(operations, current)
+
+        inserts, updates, deletes = [], [], []
+        for vid, quantity in final.items():
+            if vid in current:
+                line_item_id, before = current[vid]
+                if quantity == 0:
+                    deletes.append(line_item_id)
+                elif quantity != before:
+                    updates.append({"id": line_item_id, "quantity": quantity})
+            elif quantity > 0:
+                inserts.append(_line_values(order.id, vid, quantity, variants[vid], prices[vid]))
+
+        if inserts:
+            await db.execute(increment_line_items(inserts))
+        if updates:
+            await db.execute(update(LineItem), updates)
+        if deletes:
+            await db.execute(delete(LineItem).where(LineItem.id.in_(deletes)))
+
+        # Every cart write bumps the version, so a change made after the line
+        # items were read makes this update miss and the attempt is retried.
+        await recalculate_totals_async(order, db, expected_version=order.version)
+        await db.commit()
+
+    await run_with_retry_async(db, order, attempt)
+
+
+async def apply_batch_ephemeral(token: str, cart: Order, operations: list[BatchOperation], headers: dict,
+                                parent_span=None) -> Order | None:
+    """apply_batch for a cart held in the Redis store; returns the updated cart (None if it left the store)."""
+    variants, prices = await _variants_and_prices(operations, float(cart.total), headers, parent_span)
+
+    def change(order: Order) -> None:
+        current = {li.variant_id: (li.id, li.quantity) for li in order.line_items}
+        for vid, quantity in _fold(operations, current).items():
+            if vid in current:
+                ephemeral_carts.set_line_quantity(order, current[vid][0], quantity)
+            elif quantity > 0:
+                order.line_items.append(LineItem(**_line_values(order.id, vid, quantity, variants[vid], prices[vid])))
+
+    return await run_in_threadpool(ephemeral_carts.mutate, token, change)
@@ -0,0 +1,155 @@
+"""
+Cart Response Cache
+
+GET /cart is the frontend's most frequent cart call. Its serialized response
+is cached in process, keyed by order token, together with an ETag (a digest
+of the body):
+
+- A hit returns the cached body, or 304 when the request's If-None-Match
+  carries the ETag, without opening a database connection.
+- Every mutating endpoint invalidates the token after it commits.
+- A miss loads and serializes the order (cart_serializer), then caches it, unless the token
+  was invalidated while it was loading (so a slow read can never cache a
+  cart that was changed underneath it).
+
+Entries expire after CART_CACHE_TTL_S, which also bounds how stale a cart can
+be when several cart processes serve the same token. A TTL of 0 disables
+caching; responses still carry an ETag.
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable
+
+CACHE_TTL_S = float(os.environ.get("CART_CACHE_TTL_S", "30"))
+
+# Least recently used carts are evicted beyond this many entries.
+CACHE_MAX_ENTRIES = int(os.environ.get("CART_CACHE_MAX_ENTRIES", "10000"))
+
+
+def _etag(body: bytes) -> str:
+    return '"' + hashlib.sha1(body).hexdigest()[:20] + '"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """True if an If-None-Match header value matches etag (weak comparison)."""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+class CartCache:
+    """LRU of serialized carts by token, with invalidation-safe fills."""
+
+    def __init__(self, ttl_s: float, max_entries: int) -> None:
+        self.ttl_s = ttl_s
+        self.max_entries = max(1, max_entries)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        self._entries: OrderedDict[str, tuple[str, bytes, float]] = OrderedDict()
+        # token -> [fills in progress, invalidations seen while filling]
+        self._filling: dict[str, list[int]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.discarded_fills = 0
+        self.evictions = 0
+
+    def read_through(self, token: str, load: Callable[[], bytes]) -> tuple[str, bytes]:
+        """Return (etag, body) for token, calling load() for the cart's JSON body on a miss.
+
+        Exceptions from load() (e.g. a 404 HTTPException) propagate and nothing is cached.
+        """
+        if self.ttl_s <= 0:
+            body = load()
+            return _etag(body), body
+
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is not None and entry[2] > now:
+                self._entries.move_to_end(token)
+                self.hits += 1
+                return entry[0], entry[1]
+            self.misses += 1
+            filling = self._filling.setdefault(token, [0, 0])
+            filling[0] += 1
+            seen = filling[1]
+
+        try:
+            body = load()
+        except BaseException:
+            with self._lock:
+                self._end_fill(token)
+            raise
+        etag = _etag(body)
+        with self._lock:
+            if self._end_fill(token) == seen:
+                self._store(token, etag, body, now + self.ttl_s)
+            else:
+                self.discarded_fills += 1
+        return etag, body
+
+    def _end_fill(self, token: str) -> int:
+        """Finish one fill of token; return the invalidations seen since fills began."""
+        filling = self._filling[token]
+        filling[0] -= 1
+        if filling[0] == 0:
+            del self._filling[token]
+        return filling[1]
+
+    def _store(self, token: str, etag: str, body: bytes, expires: float) -> None:
+        self._entries[token] = (etag, body, expires)
+        self._entries.move_to_end(token)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, token: str) -> None:
+        with self._lock:
+            self._entries.pop(token, None)
+            filling = self._filling.get(token)
+            if filling is not None:
+                filling[1] += 1
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "ttl_s": self.ttl_s,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "discarded_fills": self.discarded_fills,
+                "evictions": self.evictions,
+            }
+
+
+_cache = CartCache(CACHE_TTL_S, CACHE_MAX_ENTRIES)
+
+
+def get_cart_response(token: str, load: Callable[[], bytes]) -> tuple[str, bytes]:
+    """Return (etag, JSON body) for a cart, from the cache or by calling load()."""
+    return _cache.read_through(token, load)
+
+
+def invalidate_cart(token: str) -> None:
+    """Drop a cart from the cache; call after committing any change to it."""
+    _cache.invalidate(token)
+
+
+def get_cart_cache_stats() -> dict:
+    """Return cache size and hit/invalidation counters for observability."""
+    return _cache.stats()
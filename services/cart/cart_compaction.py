@@ -0,0 +1,435 @@
+"""
+Abandoned Cart Compaction
+
+Nothing else ever removes a cart that is never checked out, so cart.orders,
+cart.line_items and their indexes (the token lookup, ix_orders_state) would
+grow without bound. A background job in each cart process runs every
+CART_COMPACTION_INTERVAL_S and removes carts in the `cart` state that have
+been idle (no write since orders.updated_at, or created_at for older rows)
+for longer than CART_ABANDONED_AFTER_H:
+
+- Carts are removed in batches of CART_COMPACTION_BATCH_SIZE, one short
+  transaction each: a single statement selects the batch through the partial
+  index ix_orders_cart_idle with FOR UPDATE SKIP LOCKED (carts being written
+  are skipped, never waited for) and deletes its line items and orders.
+- With CART_COMPACTION_ARCHIVE=true the deleted rows are copied to
+  cart.orders_archive / cart.line_items_archive in the same statement.
+- A Postgres advisory lock makes sure only one process compacts at a time.
+
+Optional partitioning: with CART_ORDERS_PARTITIONED=true a new database
+gets cart.orders range-partitioned by created_at, one partition per month
+(orders_pYYYYMM) plus a default partition. The job keeps the next months'
+partitions created and, when CART_PARTITION_RETENTION_MONTHS is set,
+detaches partitions older than that: their line items are moved to
+cart.line_items_archive in batches and the partition is detached, which is
+a metadata change rather than a mass delete. The detached table stays in the
+cart schema as the archive of those orders. A partitioned cart.orders cannot
+be the target of a foreign key, so line_items is created without one; line
+items are always deleted explicitly, and each run also sweeps line items
+whose order no longer exists (e.g. written while their cart was being
+removed). An existing unpartitioned cart.orders is left as it is.
+
+Each run's rows reclaimed and duration are logged and served at
+GET /health/compaction. The job can also be run once from the command line:
+
+    python cart_compaction.py --abandoned-after-h 720 --batch-size 500
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import re
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+
+logger = logging.getLogger(__name__)
+
+# 0 disables the background job; the command line still works.
+COMPACTION_INTERVAL_S = float(os.environ.get("CART_COMPACTION_INTERVAL_S", "3600"))
+ABANDONED_AFTER_H = float(os.environ.get("CART_ABANDONED_AFTER_H", "720"))
+COMPACTION_BATCH_SIZE = int(os.environ.get("CART_COMPACTION_BATCH_SIZE", "500"))
+COMPACTION_ARCHIVE = os.environ.get("CART_COMPACTION_ARCHIVE", "false").lower() == "true"
+ORDERS_PARTITIONED = os.environ.get("CART_ORDERS_PARTITIONED", "false").lower() == "true"
+# 0 keeps every partition attached.
+PARTITION_RETENTION_MONTHS = int(os.environ.get("CART_PARTITION_RETENTION_MONTHS", "0"))
+
+_PARTITION_MONTHS_AHEAD = 3
+# Pause between batches so compaction never monopolizes the database.
+_BATCH_PAUSE_S = 0.01
+_ADVISORY_LOCK_KEY = 0x63617274  # "cart"
+_PARTITION_NAME = re.compile(r"^orders_p(\d{4})(\d{2})$")
+
+_COMPACT_BATCH = """
+WITH victims AS (
+    SELECT id FROM cart.orders
+    WHERE state = 'cart' AND coalesce(updated_at, created_at) < :cutoff
+    ORDER BY coalesce(updated_at, created_at)
+    LIMIT :batch_size
+    FOR UPDATE SKIP LOCKED
+), items AS (
+    DELETE FROM cart.line_items li USING victims v WHERE li.order_id = v.id RETURNING li.*
+), orders AS (
+    DELETE FROM cart.orders o USING victims v WHERE o.id = v.id RETURNING o.*
+){archive}
+SELECT (SELECT count(*) FROM orders) AS orders, (SELECT count(*) FROM items) AS line_items
+"""
+
+_ARCHIVE_CTES = """, archived_items AS (
+    INSERT INTO cart.line_items_archive SELECT * FROM items
+), archived_orders AS (
+    INSERT INTO cart.orders_archive SELECT * FROM orders
+)"""
+
+_SWEEP_ORPHANS = """
+WITH orphans AS (
+    SELECT li.id FROM cart.line_items li
+    WHERE NOT EXISTS (SELECT 1 FROM cart.orders o WHERE o.id = li.order_id)
+    LIMIT :batch_size
+    FOR UPDATE SKIP LOCKED
+), items AS (
+    DELETE FROM cart.line_items li USING orphans WHERE li.id = orphans.id RETURNING li.*
+){archive}
+SELECT count(*) FROM items
+"""
+
+_ARCHIVE_ORPHANS_CTE = """, archived_items AS (
+    INSERT INTO cart.line_items_archive SELECT * FROM items
+)"""
+
+_MOVE_PARTITION_ITEMS = """
+WITH moved AS (
+    DELETE FROM cart.line_items WHERE id IN (
+        SELECT li.id FROM cart.line_items li JOIN cart.{partition} o ON o.id = li.order_id
+        LIMIT :batch_size
+    )
+    RETURNING *
+), archived AS (
+    INSERT INTO cart.line_items_archive SELECT * FROM moved
+)
+SELECT count(*) FROM moved
+"""
+
+_PARTITIONED_TABLES = """
+CREATE TABLE cart.orders (
+    id serial,
+    token uuid NOT NULL DEFAULT gen_random_uuid(),
+    state varchar(50) DEFAULT 'cart',
+    email varchar(255),
+    subtotal numeric(10, 2) DEFAULT 0,
+    discount_amount numeric(10, 2) DEFAULT 0,
+    discount_code varchar(64),
+    ship_total numeric(10, 2) DEFAULT 0,
+    total numeric(10, 2) DEFAULT 0,
+    currency varchar(3) DEFAULT 'USD',
+    item_count integer DEFAULT 0,
+    ship_address jsonb,
+    bill_address jsonb,
+    payment_method_id integer,
+    created_at timestamp NOT NULL DEFAULT now(),
+    completed_at timestamp,
+    version integer NOT NULL DEFAULT 0,
+    updated_at timestamp DEFAULT now(),
+    CONSTRAINT orders_pkey PRIMARY KEY (id, created_at),
+    CONSTRAINT uq_orders_token UNIQUE (token, created_at),
+    CONSTRAINT ck_orders_total_positive CHECK (total >= 0)
+) PARTITION BY RANGE (created_at);
+CREATE INDEX ix_orders_state ON cart.orders (state);
+CREATE INDEX ix_orders_cart_idle ON cart.orders (coalesce(updated_at, created_at)) WHERE state = 'cart';
+CREATE TABLE cart.orders_default PARTITION OF cart.orders DEFAULT;
+CREATE TABLE cart.line_items (
+    id serial PRIMARY KEY,
+    order_id integer NOT NULL,
+    product_id integer NOT NULL,
+    variant_id integer NOT NULL,
+    quantity integer NOT NULL,
+    price numeric(10, 2) NOT NULL,
+    name varchar(255) NOT NULL,
+    slug varchar(255),
+    image_url varchar(500),
+    CONSTRAINT ck_line_items_quantity_positive CHECK (quantity > 0),
+    CONSTRAINT ck_line_items_price_positive CHECK (price >= 0),
+    CONSTRAINT uq_line_items_order_variant UNIQUE (order_id, variant_id)
+);
+CREATE INDEX ix_line_items_order_id ON cart.line_items (order_id);
+"""
+
+
+def _month_start(moment: datetime, months: int = 0) -> datetime:
+    month = moment.year * 12 + moment.month - 1 + months
+    return datetime(month // 12, month % 12 + 1, 1)
+
+
+def _partition_name(month: datetime) -> str:
+    return f"orders_p{month:%Y%m}"
+
+
+def _now() -> datetime:
+    # created_at / updated_at are naive timestamps from the database clock (UTC in the containers).
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def create_partitioned_tables(conn: Connection) -> bool:
+    """Create cart.orders partitioned by month (and cart.line_items) if the tables do not exist yet.
+
+    Returns False, and changes nothing, when cart.orders already exists.
+    """
+    if conn.execute(text("SELECT to_regclass('cart.orders')")).scalar() is not None:
+        return False
+    for statement in _PARTITIONED_TABLES.split(";"):
+        if statement.strip():
+            conn.execute(text(statement))
+    ensure_partitions(conn)
+    return True
+
+
+def ensure_partitions(conn: Connection, now: datetime | None = None) -> list[str]:
+    """Create the partitions for the current and next months; returns the ones created."""
+    now = now or _now()
+    created = []
+    for ahead in range(_PARTITION_MONTHS_AHEAD + 1):
+        start = _month_start(now, ahead)
+        name = _partition_name(start)
+        if conn.execute(text(f"SELECT to_regclass('cart.{name}')")).scalar() is not None:
+            continue
+        conn.execute(text(
+            f"CREATE TABLE cart.{name} PARTITION OF cart.orders"
+            f" FOR VALUES FROM ('{start:%Y-%m-%d}') TO ('{_month_start(start, 1):%Y-%m-%d}')"
+        ))
+        created.append(name)
+    return created
+
+
+def _is_partitioned(conn: Connection) -> bool:
+    return bool(conn.execute(text(
+        "SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass('cart.orders')"
+    )).scalar())
+
+
+def _ensure_archive_tables(conn: Connection) -> None:
+    conn.execute(text("CREATE TABLE IF NOT EXISTS cart.orders_archive (LIKE cart.orders)"))
+    conn.execute(text("CREATE TABLE IF NOT EXISTS cart.line_items_archive (LIKE cart.line_items)"))
+
+
+def compact(engine: Engine, cutoff: datetime, batch_size: int = COMPACTION_BATCH_SIZE,
+            archive: bool = COMPACTION_ARCHIVE, orphans: bool = False) -> dict:
+    """Remove carts idle since before cutoff, one batch per transaction; returns the counts.
+
+    With orphans (line_items without a foreign key, i.e. partitioned orders),
+    line items whose order is gone are removed as well.
+    """
+    if archive:
+        with engine.begin() as conn:
+            _ensure_archive_tables(conn)
+    statement = text(_COMPACT_BATCH.format(archive=_ARCHIVE_CTES if archive else ""))
+    orders = line_items = batches = 0
+    while True:
+        with engine.begin() as conn:
+            row = conn.execute(statement, {"cutoff": cutoff, "batch_size": batch_size}).one()
+        batches += 1
+        orders += row.orders
+        line_items += row.line_items
+        if row.orders < batch_size:
+            break
+        time.sleep(_BATCH_PAUSE_S)
+    result = {"orders": orders, "line_items": line_items, "batches": batches}
+    if orphans:
+        result["orphan_line_items"] = _sweep_orphans(engine, batch_size, archive)
+    return result
+
+
+def _sweep_orphans(engine: Engine, batch_size: int, archive: bool) -> int:
+    statement = text(_SWEEP_ORPHANS.format(archive=_ARCHIVE_ORPHANS_CTE if archive else ""))
+    removed = 0
+    while True:
+        with engine.begin() as conn:
+            count = conn.execute(statement, {"batch_size": batch_size}).scalar()
+        removed += count
+        if count < batch_size:
+            return removed
+        time.sleep(_BATCH_PAUSE_S)
+
+
+def detach_old_partitions(engine: Engine, before: datetime, batch_size: int = COMPACTION_BATCH_SIZE) -> dict:
+    """Detach monthly partitions that end on or before `before`, archiving their line items first."""
+    with engine.begin() as conn:
+        _ensure_archive_tables(conn)
+        names = conn.execute(text(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid"
+            " WHERE i.inhparent = 'cart.orders'::regclass ORDER BY c.relname"
+        )).scalars().all()
+    detached, line_items = [], 0
+    for name in names:
+        match = _PARTITION_NAME.match(name)
+        if not match or _month_start(datetime(int(match[1]), int(match[2]), 1), 1) > before:
+            continue
+        move = text(_MOVE_PARTITION_ITEMS.format(partition=name))
+        while True:
+            with engine.begin() as conn:
+                moved = conn.execute(move, {"batch_size": batch_size}).scalar()
+            line_items += moved
+            if moved < batch_size:
+                break
+            time.sleep(_BATCH_PAUSE_S)
+        with engine.begin() as conn:
+            # Detaching needs a brief exclusive lock on cart.orders; give up rather
+            # than queue cart requests behind it, and retry on the next run.
+            conn.execute(text("SET LOCAL lock_timeout = '2s'"))
+            conn.execute(text(f"ALTER TABLE cart.orders DETACH PARTITION cart.{name}"))
+        detached.append(name)
+    return {"partitions": detached, "line_items": line_items}
+
+
+def run_compaction(engine: Engine, abandoned_after_h: float = ABANDONED_AFTER_H,
+                   batch_size: int = COMPACTION_BATCH_SIZE, archive: bool = COMPACTION_ARCHIVE,
+                   retention_months: int = PARTITION_RETENTION_MONTHS) -> dict:
+    """One compaction pass; returns what was reclaimed and how long it took."""
+    started = time.perf_counter()
+    now = _now()
+    report: dict = {"started_at": now.isoformat(), "archive": archive}
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as lock_conn:
+        # Session-level lock held for the whole run by this otherwise idle connection.
+        if not lock_conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": _ADVISORY_LOCK_KEY}).scalar():
+            report["skipped"] = "another process is compacting"
+            return report
+        try:
+            with engine.begin() as conn:
+                partitioned = _is_partitioned(conn)
+            report["removed"] = compact(
+                engine, now - timedelta(hours=abandoned_after_h), batch_size, archive, orphans=partitioned
+            )
+            if partitioned:
+                with engine.begin() as conn:
+                    report["partitions_created"] = ensure_partitions(conn, now)
+            if partitioned and retention_months > 0:
+                report["detached"] = detach_old_partitions(engine, _month_start(now, -retention_months), batch_size)
+        finally:
+            lock_conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": _ADVISORY_LOCK_KEY})
+    report["duration_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return report
+
+
+class CompactionJob:
+    """Runs run_compaction every interval_s in a worker thread and keeps the totals."""
+
+    def __init__(self, interval_s: float) -> None:
+        self.interval_s = interval_s
+        self.engine: Engine | None = None
+        self._task: asyncio.Task | None = None
+        self.runs = 0
+        self.failures = 0
+        self.orders_removed = 0
+        self.line_items_removed = 0
+        self.last_run: dict | None = None
+        self.last_error: str | None = None
+
+    def start(self, engine: Engine) -> None:
+        self.engine = engine
+        if self.interval_s > 0 and self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval_s)
+            await self.run_once()
+
+    async def run_once(self) -> dict | None:
+        try:
+            report = await asyncio.to_thread(run_compaction, self.engine)
+        except Exception as exc:
+            self.failures += 1
+            self.last_error = str(exc)
+            logger.warning("Cart compaction failed: %s", exc)
+            return None
+        self.runs += 1
+        self.last_run = report
+        self.last_error = None
+        removed = report.get("removed")
+        if removed:
+            self.orders_removed += removed["orders"]
+            self.line_items_removed += removed["line_items"] + removed.get("orphan_line_items", 0)
+            logger.info(
+                "Cart compaction removed %d carts and %d line items in %d batches (%.1f ms)",
+                removed["orders"], removed["line_items"], removed["batches"], report["duration_ms"],
+            )
+        return report
+
+    def stats(self) -> dict:
+        return {
+            "interval_s": self.interval_s,
+            "abandoned_after_h": ABANDONED_AFTER_H,
+            "batch_size": COMPACTION_BATCH_SIZE,
+            "archive": COMPACTION_ARCHIVE,
+            "partitioned": ORDERS_PARTITIONED,
+            "runs": self.runs,
+            "failures": self.failures,
+            "orders_removed": self.orders_removed,
+            "line_items_removed": self.line_items_removed,
+            "last_run": self.last_run,
+            "last_error": self.last_error,
+        }
+
+
+_job = CompactionJob(COMPACTION_INTERVAL_S)
+
+
+def prepare_tables(engine: Engine) -> None:
+    """With CART_ORDERS_PARTITIONED, create partitioned tables for a new database (before create_all)."""
+    if not ORDERS_PARTITIONED:
+        return
+    with engine.begin() as conn:
+        if create_partitioned_tables(conn):
+            logger.info("Created cart.orders partitioned by month of created_at")
+        elif not _is_partitioned(conn):
+            logger.warning("CART_ORDERS_PARTITIONED is set but cart.orders already exists unpartitioned; leaving it")
+
+
+def start_compaction(engine: Engine) -> None:
+    """Start the background compaction job (no-op when CART_COMPACTION_INTERVAL_S is 0)."""
+    _job.start(engine)
+
+
+async def stop_compaction() -> None:
+    await _job.stop()
+
+
+def get_compaction_stats() -> dict:
+    """Return the job settings, totals reclaimed so far and the last run's report."""
+    return _job.stats()
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Remove abandoned carts once and print a JSON report.")
+    parser.add_argument("--abandoned-after-h", type=float, default=ABANDONED_AFTER_H,
+                        help="remove carts idle for longer than this many hours")
+    parser.add_argument("--batch-size", type=int, default=COMPACTION_BATCH_SIZE, help="carts per transaction")
+    parser.add_argument("--archive", action="store_true", default=COMPACTION_ARCHIVE,
+                        help="copy removed rows to cart.orders_archive / cart.line_items_archive")
+    parser.add_argument("--retention-months", type=int, default=PARTITION_RETENTION_MONTHS,
+                        help="detach monthly partitions older than this (partitioned tables only; 0 = never)")
+    args = parser.parse_args(argv)
+
+    from database import engine
+
+    report = run_compaction(engine, args.abandoned_after_h, args.batch_size, args.archive, args.retention_months)
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,139 @@
+"""
+Optimistic Concurrency for Cart Mutations
+
+Cart mutations do not lock rows while they work. Each one is written so a
+concurrent change to the same cart is either absorbed or detected:
+
+- Adding an item is a single INSERT ... ON CONFLICT upsert that increments
+  the quantity in place (quantity = quantity + :n), and totals change by a
+  delta UPDATE. Concurrent adds compose and never conflict.
+- set_quantity / remove_line_item write the line item only if it still holds
+  the quantity that was read (compare-and-swap on the row).
+- Order-level read-modify-writes (coupons, batch recalculation, checkout
+  transitions) compare-and-swap on Order.version, which every cart write
+  increments.
+
+A detected conflict (or a Postgres deadlock / serialization failure) rolls
+the attempt back, refreshes the order and runs the attempt again, up to
+CART_CAS_MAX_ATTEMPTS times with a short jittered backoff. After that the
+request fails with 409.
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import random
+import time
+
+from fastapi import HTTPException
+from sqlalchemy.exc import DBAPIError, IntegrityError, InvalidRequestError, NoResultFound
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.exc import StaleDataError
+
+CAS_MAX_ATTEMPTS = max(1, int(os.environ.get("CART_CAS_MAX_ATTEMPTS", "5")))
+
+# serialization_failure, deadlock_detected
+_RETRYABLE_SQLSTATES = {"40001", "40P01"}
+_FOREIGN_KEY_VIOLATION = "23503"
+
+_stats = {"mutations": 0, "conflicts": 0, "exhausted": 0}
+
+
+class CartConflict(Exception):
+    """A compare-and-swap write found the order or line item changed since it was read."""
+
+
+def _is_conflict(exc: Exception) -> bool:
+    if isinstance(exc, (CartConflict, StaleDataError)):
+        return True
+    if isinstance(exc, DBAPIError):
+        return getattr(exc.orig, "pgcode", None) in _RETRYABLE_SQLSTATES
+    return False
+
+
+def _is_cart_gone(exc: Exception) -> bool:
+    # The order was deleted under the write (e.g. by compaction): a line item
+    # insert fails its foreign key, or the totals UPDATE finds no row.
+    if isinstance(exc, NoResultFound):
+        return True
+    return isinstance(exc, IntegrityError) and getattr(exc.orig, "pgcode", None) == _FOREIGN_KEY_VIOLATION
+
+
+def _backoff_s(attempt: int) -> float:
+    # Full jitter: 0-2 ms after the first conflict, doubling per attempt.
+    return random.uniform(0, 0.002 * 2 ** attempt)
+
+
+def _exhausted() -> HTTPException:
+    _stats["exhausted"] += 1
+    return HTTPException(status_code=409, detail="Cart was modified concurrently, please retry")
+
+
+def _cart_gone() -> HTTPException:
+    return HTTPException(status_code=404, detail="Cart not found")
+
+
+def run_with_retry(db: Session, order, attempt):
+    """Run attempt() (which must commit) until it does not conflict; return its result.
+
+    order, if given, is refreshed before each retry.
+    """
+    _stats["mutations"] += 1
+    for n in range(CAS_MAX_ATTEMPTS):
+        try:
+            return attempt()
+        except Exception as exc:
+            if _is_cart_gone(exc):
+                db.rollback()
+                raise _cart_gone() from exc
+            if not _is_conflict(exc):
+                raise
+            db.rollback()
+            _stats["conflicts"] += 1
+        if n + 1 == CAS_MAX_ATTEMPTS:
+            break
+        time.sleep(_backoff_s(n))
+        if order is None:
+            continue
+        try:
+            db.refresh(order)
+        except InvalidRequestError:
+            raise _cart_gone()
+    raise _exhausted()
+
+
+async def run_with_retry_async(db: AsyncSession, order, attempt):
+    """run_with_retry for an AsyncSession; attempt is a coroutine function."""
+    _stats["mutations"] += 1
+    for n in range(CAS_MAX_ATTEMPTS):
+        try:
+            return await attempt()
+        except Exception as exc:
+            if _is_cart_gone(exc):
+                await db.rollback()
+                raise _cart_gone() from exc
+            if not _is_conflict(exc):
+                raise
+            await db.rollback()
+            _stats["conflicts"] += 1
+        if n + 1 == CAS_MAX_ATTEMPTS:
+            break
+        await asyncio.sleep(_backoff_s(n))
+        if order is None:
+            continue
+        # Rollback expired the order; lazy loads are not possible on an AsyncSession.
+        try:
+            await db.refresh(order)
+        except InvalidRequestError:
+            raise _cart_gone()
+    raise _exhausted()
+
+
+def get_conflict_stats() -> dict:
+    mutations = _stats["mutations"]
+    return {
+        "max_attempts": CAS_MAX_ATTEMPTS,
+        **_stats,
+        "conflicts_per_mutation": round(_stats["conflicts"] / mutations, 3) if mutations else 0.0,
+    }
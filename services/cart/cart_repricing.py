@@ -0,0 +1,144 @@
+"""
+Bulk Repricing of Open Carts
+
+Line item prices are frozen when an item is added. When catalog prices
+change, POST /cart/reprice takes the batch of (variant_id, price) changes and
+brings every open cart (state `cart`) in line in one query, without loading
+any order:
+
+1. One UPDATE of cart.line_items joined against the changes (passed as two
+   arrays and unnested) sets the new price on every matching line item whose
+   price differs, returning each line's order and amount delta
+   ((new price - old price) x quantity).
+2. A second UPDATE, fed by the first one's RETURNING, adds the summed deltas
+   to each affected order's subtotal and total and increments its version.
+
+Totals change by delta, like every other line item write (cart_utils), so a
+concurrent add_item composes with the repricing instead of being
+overwritten. A set_quantity that read the old price fails its
+compare-and-swap on (quantity, price) and retries, and the version bump
+makes batch and coupon compare-and-swaps retry. Repricings are serialized
+by an advisory lock; a deadlock with another cart write retries the whole
+statement, as other cart writes do. updated_at is left alone, so a
+repricing does not make an abandoned cart look active to compaction.
+
+Afterwards the repriced carts are dropped from the cart response cache and
+the new prices are written into the variant cache, so later adds use them
+without waiting for a catalog reload.
+
+Carts held in the Redis store (CART_STORE=redis) are not repriced; they keep
+their prices until checkout.
+
+The endpoint is internal: callers must send the CART_REPRICE_TOKEN secret in
+an X-Reprice-Token header, it is disabled (404) while the secret is unset, and
+nginx does not proxy it.
+"""
+from __future__ import annotations
+
+import hmac
+import logging
+import os
+import time
+from decimal import Decimal
+
+from fastapi import HTTPException
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from cart_cache import invalidate_cart
+from cart_concurrency import run_with_retry_async
+from variant_cache import update_variant_prices
+
+logger = logging.getLogger(__name__)
+
+_ADVISORY_LOCK_KEY = 0x72657072  # "repr"
+
+REPRICE_TOKEN = os.environ.get("CART_REPRICE_TOKEN", "")
+
+_REPRICE = text("""
+WITH changes AS (
+    SELECT variant_id, price
+    FROM unnest(CAST(:variant_ids AS integer[]), CAST(:prices AS numeric[])) AS c (variant_id, price)
+), repriced AS (
+    UPDATE cart.line_items AS li
+    SET price = c.price
+    FROM changes AS c, cart.line_items AS old, cart.orders AS o
+    WHERE li.variant_id = c.variant_id
+      AND li.price <> c.price
+      AND old.id = li.id
+      AND o.id = li.order_id
+      AND o.state = 'cart'
+    RETURNING li.order_id, (li.price - old.price) * li.quantity AS amount_delta
+), deltas AS (
+    SELECT order_id, sum(amount_delta) AS amount_delta, count(*) AS line_items
+    FROM repriced
+    GROUP BY order_id
+)
+UPDATE cart.orders AS o
+SET subtotal = o.subtotal + d.amount_delta,
+    total = greatest(0, o.subtotal + d.amount_delta - o.discount_amount + o.ship_total),
+    version = o.version + 1
+FROM deltas AS d
+WHERE o.id = d.order_id
+RETURNING o.token, d.line_items
+""")
+
+_stats = {"runs": 0, "orders_repriced": 0, "line_items_repriced": 0, "conflicts": 0}
+_last_run: dict | None = None
+
+
+def check_reprice_token(token: str | None) -> None:
+    """Raise 404 while repricing is disabled and 403 unless token matches CART_REPRICE_TOKEN."""
+    if not REPRICE_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if token is None or not hmac.compare_digest(token.encode(), REPRICE_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Invalid reprice token")
+
+
+async def reprice_open_carts(db: AsyncSession, prices: dict[int, Decimal]) -> dict:
+    """Set new prices on the line items of open carts and adjust their totals; returns a report.
+
+    prices maps variant_id to its new price, already rounded to cents.
+    """
+    global _last_run
+    started = time.perf_counter()
+    params = {"variant_ids": list(prices), "prices": list(prices.values())}
+    attempts = 0
+
+    async def attempt():
+        nonlocal attempts
+        attempts += 1
+        await db.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": _ADVISORY_LOCK_KEY})
+        rows = (await db.execute(_REPRICE, params)).all()
+        await db.commit()
+        return rows
+
+    try:
+        rows = await run_with_retry_async(db, None, attempt)
+    except HTTPException:
+        # Every attempt conflicted
+        _stats["conflicts"] += attempts
+        raise
+    _stats["conflicts"] += attempts - 1
+
+    for row in rows:
+        invalidate_cart(str(row.token))
+    update_variant_prices(prices)
+
+    report = {
+        "variants": len(prices),
+        "orders": len(rows),
+        "line_items": sum(row.line_items for row in rows),
+        "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+    _stats["runs"] += 1
+    _stats["orders_repriced"] += report["orders"]
+    _stats["line_items_repriced"] += report["line_items"]
+    _last_run = report
+    logger.info("Repriced %d line items in %d open carts for %d variants in %.1f ms",
+                report["line_items"], report["orders"], report["variants"], report["duration_ms"])
+    return report
+
+
+def get_repricing_stats() -> dict:
+    return {**_stats, "last_run": _last_run}
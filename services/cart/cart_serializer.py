@@ -0,0 +1,116 @@
+"""
+Cart Serializer
+
+Turns an Order straight into the CartSchema JSON bytes. The default path of
+order_to_dict followed by FastAPI's response_model validation and JSON
+encoding walks every line item twice. Here the field reads are precompiled
+with operator getters, and the resulting dict goes directly to orjson
+(or to the stdlib json encoder when orjson is not installed).
+
+CART_FAST_SERIALIZER=false keeps the original path: endpoints return
+order_to_dict and FastAPI validates the dict against CartSchema.
+"""
+from __future__ import annotations
+
+import json
+import os
+from operator import attrgetter, itemgetter
+
+from fastapi.responses import Response
+
+from cart_utils import order_to_dict
+from models import Order
+from schemas import CartSchema
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to the stdlib encoder
+    orjson = None
+
+FAST_SERIALIZER = os.environ.get("CART_FAST_SERIALIZER", "true").lower() == "true"
+
+_ORDER_FIELDS = (
+    "id", "token", "state", "email", "currency", "item_count",
+    "subtotal", "discount_amount", "discount_code", "ship_total", "total",
+)
+_LINE_ITEM_FIELDS = ("id", "product_id", "variant_id", "quantity", "price", "name", "slug", "image_url")
+
+# Loaded column values live in the instance __dict__; reading them there skips
+# SQLAlchemy's attribute instrumentation, which otherwise dominates the cost.
+# Instances with expired or unloaded columns fall back to normal attribute access.
+_order_loaded = itemgetter(*_ORDER_FIELDS)
+_order_attrs = attrgetter(*_ORDER_FIELDS)
+_line_item_loaded = itemgetter(*_LINE_ITEM_FIELDS)
+_line_item_attrs = attrgetter(*_LINE_ITEM_FIELDS)
+
+
+def _order_fields(order: Order) -> tuple:
+    try:
+        return _order_loaded(order.__dict__)
+    except KeyError:
+        return _order_attrs(order)
+
+
+def _line_item_fields(li) -> tuple:
+    try:
+        return _line_item_loaded(li.__dict__)
+    except KeyError:
+        return _line_item_attrs(li)
+
+
+def _dumps(data: dict) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(",", ":")).encode()
+
+
+def order_to_json(order: Order) -> bytes:
+    """Serialize an Order to CartSchema JSON, with monetary values rounded to cents."""
+    (order_id, token, state, email, currency, item_count,
+     subtotal, discount_amount, discount_code, ship_total, total) = _order_fields(order)
+    return _dumps({
+        "id": str(order_id),
+        "token": str(token),
+        "state": state,
+        "email": email,
+        "currency": currency,
+        "item_count": item_count,
+        "subtotal": round(float(subtotal), 2),
+        "discount_amount": round(float(discount_amount), 2),
+        "discount_code": discount_code,
+        "ship_total": round(float(ship_total), 2),
+        "total": round(float(total), 2),
+        "line_items": [
+            {
+                "id": li_id,
+                "product_id": product_id,
+                "variant_id": variant_id,
+                "quantity": quantity,
+                "price": round(float(price), 2),
+                "name": name,
+                "slug": slug,
+                "image_url": image_url,
+            }
+            for li_id, product_id, variant_id, quantity, price, name, slug, image_url
+            in map(_line_item_fields, order.line_items)
+        ],
+    })
+
+
+def order_to_bytes(order: Order) -> bytes:
+    """CartSchema JSON bytes for an Order, through whichever path CART_FAST_SERIALIZER selects."""
+    if FAST_SERIALIZER:
+        return order_to_json(order)
+    return CartSchema.model_validate(order_to_dict(order)).model_dump_json().encode()
+
+
+def cart_response(order: Order):
+    """Response for an endpoint declared with response_model=CartSchema.
+
+    The fast path returns ready-made JSON, which FastAPI passes through
+    without validating. Otherwise it returns the dict for FastAPI to validate
+    and encode as before.
+    """
+    if FAST_SERIALIZER:
+        return Response(content=order_to_json(order), media_type="application/json")
+    return order_to_dict(order)
@@ -1,11 +1,212 @@
+from decimal import ROUND_HALF_UP, Decimal
+
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
 
+from cart_concurrency import CartConflict
 from models import LineItem, Order
 
+_CENT = Decimal("0.01")
+
+
+def to_money(value) -> Decimal:
+    """Round a price to cents the way NUMERIC(10,2) stores it."""
+    return Decimal(str(value)).quantize(_CENT, rounding=ROUND_HALF_UP)
+
 
 def recalculate_order(order: Order, db: Session) -> None:
     """Recalculate cart totals (item_count, subtotal, total) from line items."""
     items = db.query(LineItem).filter(LineItem.order_id == order.id).all()
+    apply_totals(order, items)
+
+
+async def recalculate_order_async(order: Order, db: AsyncSession) -> None:
+    """recalculate_order for an AsyncSession."""
+    result = await db.execute(select(LineItem).where(LineItem.order_id == order.id))
+    apply_totals(order, result.scalars().all())
+
+
+def apply_line_delta(order: Order, db: Session, quantity_delta: int, amount_delta: Decimal) -> None:
+    """Apply a line-item change to the order totals in place, without reading line items.
+
+    quantity_delta and amount_delta (quantity x unit price, in cents precision)
+    are added to item_count and subtotal by a single UPDATE ... RETURNING, so
+    concurrent mutations of the same order compose instead of overwriting
+    each other. The caller must have changed the line item atomically (an
+    upsert increment or a compare-and-swap on its quantity) so the delta is
+    exact. The order's version is incremented.
+    """
+    row = db.execute(_delta_statement(order.id, quantity_delta, amount_delta)).one()
+    _set_totals(order, row)
+
+
+async def apply_line_delta_async(order: Order, db: AsyncSession, quantity_delta: int, amount_delta: Decimal) -> None:
+    """apply_line_delta for an AsyncSession."""
+    row = (await db.execute(_delta_statement(order.id, quantity_delta, amount_delta))).one()
+    _set_totals(order, row)
+
+
+async def add_line_item_async(order: Order, db: AsyncSession, values: dict) -> None:
+    """Insert a line item, or add values["quantity"] to the order's line for the same variant, and adjust totals.
+
+    The increment happens inside one INSERT ... ON CONFLICT statement, so
+    concurrent adds of one variant need no lock. An existing line keeps its price.
+    """
+    price = (await db.execute(increment_line_items(values).returning(LineItem.price))).scalar_one()
+    await apply_line_delta_async(order, db, values["quantity"], values["quantity"] * price)
+
+
+def increment_line_items(values):
+    """INSERT line items; a variant already in the order has its quantity incremented instead."""
+    stmt = insert(LineItem).values(values)
+    return stmt.on_conflict_do_update(
+        constraint="uq_line_items_order_variant",
+        set_={"quantity": LineItem.quantity + stmt.excluded.quantity},
+    )
+
+
+def change_line_quantity(order: Order, db: Session, line_item_id: int, quantity: int) -> bool:
+    """Set a line item's quantity (0 deletes it) and adjust the totals, without locking.
+
+    The line item is written only if it still holds the quantity and price
+    that were read; otherwise CartConflict is raised. Checking the price too
+    keeps the totals exact when a repricing lands between the read and the
+    write. Returns False if the order has no such line item.
+    """
+    row = db.execute(
+        select(LineItem.quantity, LineItem.price).where(LineItem.id == line_item_id, LineItem.order_id == order.id)
+    ).first()
+    if row is None:
+        return False
+    if quantity > 0:
+        stmt = update(LineItem).values(quantity=quantity)
+    else:
+        stmt = delete(LineItem)
+    stmt = stmt.where(LineItem.id == line_item_id, LineItem.quantity == row.quantity, LineItem.price == row.price)
+    if db.execute(stmt.execution_options(synchronize_session=False)).rowcount != 1:
+        raise CartConflict(f"line item {line_item_id} changed")
+    quantity_delta = quantity - row.quantity
+    apply_line_delta(order, db, quantity_delta, quantity_delta * row.price)
+    return True
+
+
+def empty_order(order: Order, db: Session) -> None:
+    """Delete every line item and clear the discount; totals drop by exactly what was deleted."""
+    removed = db.execute(
+        delete(LineItem)
+        .where(LineItem.order_id == order.id)
+        .returning(LineItem.quantity, LineItem.price)
+        .execution_options(synchronize_session=False)
+    ).all()
+    quantity = sum(q for q, _ in removed)
+    amount = sum((q * price for q, price in removed), Decimal(0))
+    row = db.execute(_delta_statement(order.id, -quantity, -amount, clear_discount=True)).one()
+    _set_totals(order, row)
+    set_committed_value(order, "discount_amount", Decimal(0))
+    set_committed_value(order, "discount_code", None)
+
+
+async def apply_discount_async(order: Order, db: AsyncSession, discount_code: str, discount_amount: Decimal,
+                               ship_total: Decimal) -> None:
+    """Store a discount and the resulting total if the order is still at the version it was read at.
+
+    Raises CartConflict when another write changed the order in between.
+    """
+    stmt = (
+        update(Order)
+        .where(Order.id == order.id, Order.version == order.version)
+        .values(
+            discount_code=discount_code,
+            discount_amount=discount_amount,
+            ship_total=ship_total,
+            total=func.greatest(0, Order.subtotal - discount_amount + ship_total),
+            version=Order.version + 1,
+        )
+        .returning(Order.item_count, Order.subtotal, Order.total, Order.version)
+        .execution_options(synchronize_session=False)
+    )
+    row = (await db.execute(stmt)).one_or_none()
+    if row is None:
+        raise CartConflict(f"order {order.id} changed")
+    _set_totals(order, row)
+    set_committed_value(order, "discount_code", discount_code)
+    set_committed_value(order, "discount_amount", discount_amount)
+    set_committed_value(order, "ship_total", ship_total)
+
+
+async def recalculate_totals_async(order: Order, db: AsyncSession, expected_version: int | None = None) -> None:
+    """Recompute the order totals from its line items in one UPDATE ... FROM aggregate.
+
+    Used after bulk changes, where per-item deltas are unknown. With
+    expected_version the update only applies if no other write has touched
+    the order since that version was read, so the aggregate cannot miss a
+    concurrent change; otherwise CartConflict is raised.
+    """
+    row = (await db.execute(_aggregate_statement(order.id, expected_version))).one_or_none()
+    if row is None:
+        raise CartConflict(f"order {order.id} changed")
+    _set_totals(order, row)
+
+
+def _aggregate_statement(order_id: int, expected_version: int | None = None):
+    sums = (
+        select(
+            func.coalesce(func.sum(LineItem.quantity), 0).label("item_count"),
+            func.coalesce(func.sum(LineItem.price * LineItem.quantity), 0).label("subtotal"),
+        )
+        .where(LineItem.order_id == order_id)
+        .subquery()
+    )
+    stmt = update(Order).where(Order.id == order_id)
+    if expected_version is not None:
+        stmt = stmt.where(Order.version == expected_version)
+    return (
+        stmt.values(
+            item_count=sums.c.item_count,
+            subtotal=sums.c.subtotal,
+            total=func.greatest(0, sums.c.subtotal - Order.discount_amount + Order.ship_total),
+            version=Order.version + 1,
+        )
+        .returning(Order.item_count, Order.subtotal, Order.total, Order.version)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def _delta_statement(order_id: int, quantity_delta: int, amount_delta: Decimal, clear_discount: bool = False):
+    values = {
+        "item_count": Order.item_count + quantity_delta,
+        "subtotal": Order.subtotal + amount_delta,
+        "total": func.greatest(0, Order.subtotal + amount_delta - Order.discount_amount + Order.ship_total),
+        "version": Order.version + 1,
+    }
+    if clear_discount:
+        values.update(
+            discount_amount=0,
+            discount_code=None,
+            total=func.greatest(0, Order.subtotal + amount_delta + Order.ship_total),
+        )
+    return (
+        update(Order)
+        .where(Order.id == order_id)
+        .values(**values)
+        .returning(Order.item_count, Order.subtotal, Order.total, Order.version)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def _set_totals(order: Order, row) -> None:
+    # The database already holds these values; record them without marking the order dirty.
+    set_committed_value(order, "item_count", row.item_count)
+    set_committed_value(order, "subtotal", row.subtotal)
+    set_committed_value(order, "total", row.total)
+    set_committed_value(order, "version", row.version)
+
+
+def apply_totals(order: Order, items: list[LineItem]) -> None:
+    """Set item_count, subtotal and total on order from items, without touching the database."""
     order.item_count = sum(li.quantity for li in items)
     order.subtotal = round(sum(float(li.price) * li.quantity for li in items), 2)
     order.total = max(
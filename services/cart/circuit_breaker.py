@@ -0,0 +1,179 @@
+"""
+Upstream Circuit Breakers and Request Deadline
+
+Every upstream call made through http_clients passes through two guards, so
+a degraded catalog, discounts service or pricing engine cannot stall each
+cart request for its full timeout:
+
+- Request deadline: a cart request gets CART_REQUEST_DEADLINE_MS for all of
+  its upstream calls together. Each call's timeouts are capped at the time
+  remaining, and a call made after the deadline fails immediately.
+- Circuit breaker (one per upstream): outcomes are kept in a rolling window
+  of CART_BREAKER_WINDOW_S. Once the window holds CART_BREAKER_MIN_REQUESTS
+  calls and the share of errors (transport errors and 5xx) or of calls
+  slower than CART_BREAKER_SLOW_CALL_MS crosses its threshold, the circuit
+  opens. Calls are then rejected without touching the network for
+  CART_BREAKER_OPEN_S. After that one probe call is let through (half-open):
+  success closes the circuit, failure opens it again.
+
+Rejected and deadline-expired calls raise httpx.RequestError subclasses, so
+callers take their existing fallbacks: the catalog price, a 503 for coupons,
+or a cached variant.
+"""
+from __future__ import annotations
+
+import contextvars
+import os
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import httpx
+
+REQUEST_DEADLINE_MS = float(os.environ.get("CART_REQUEST_DEADLINE_MS", "5000"))
+
+BREAKER_WINDOW_S = float(os.environ.get("CART_BREAKER_WINDOW_S", "30"))
+BREAKER_MIN_REQUESTS = int(os.environ.get("CART_BREAKER_MIN_REQUESTS", "10"))
+BREAKER_ERROR_RATE = float(os.environ.get("CART_BREAKER_ERROR_RATE", "0.5"))
+# 0 disables the slow-call trigger.
+BREAKER_SLOW_CALL_MS = float(os.environ.get("CART_BREAKER_SLOW_CALL_MS", "3000"))
+BREAKER_SLOW_CALL_RATE = float(os.environ.get("CART_BREAKER_SLOW_CALL_RATE", "0.8"))
+BREAKER_OPEN_S = float(os.environ.get("CART_BREAKER_OPEN_S", "10"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(httpx.RequestError):
+    """Raised instead of calling an upstream whose circuit is open."""
+
+
+class DeadlineExceeded(httpx.TimeoutException):
+    """Raised when a request's upstream time budget is already spent."""
+
+
+_deadline: contextvars.ContextVar[float | None] = contextvars.ContextVar("cart_upstream_deadline", default=None)
+
+
+@contextmanager
+def request_deadline(budget_ms: float = REQUEST_DEADLINE_MS):
+    """Give upstream calls made inside the block budget_ms in total (0 = no deadline)."""
+    token = _deadline.set(time.monotonic() + budget_ms / 1000.0 if budget_ms > 0 else None)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def clear_deadline() -> None:
+    """Detach the current context (e.g. a background task) from the request deadline."""
+    _deadline.set(None)
+
+
+def remaining_s() -> float | None:
+    """Seconds left in the current request's budget, or None when there is no deadline."""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+class CircuitBreaker:
+    """Rolling-window error/latency breaker with a single half-open probe."""
+
+    def __init__(self, name: str, window_s: float = BREAKER_WINDOW_S, min_requests: int = BREAKER_MIN_REQUESTS,
+                 error_rate: float = BREAKER_ERROR_RATE, slow_call_ms: float = BREAKER_SLOW_CALL_MS,
+                 slow_call_rate: float = BREAKER_SLOW_CALL_RATE, open_s: float = BREAKER_OPEN_S) -> None:
+        self.name = name
+        self.window_s = window_s
+        self.min_requests = max(1, min_requests)
+        self.error_rate = error_rate
+        self.slow_call_ms = slow_call_ms
+        self.slow_call_rate = slow_call_rate
+        self.open_s = open_s
+        self.state = CLOSED
+        # (finished_at, failed, slow, latency_ms) per call, oldest first, with
+        # running failure/slow counts so each call updates the rates in O(1)
+        self._window: deque[tuple[float, bool, bool, float]] = deque()
+        self._failures = 0
+        self._slow = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self.times_opened = 0
+        self.rejected = 0
+
+    def before_call(self) -> bool:
+        """Admit a call or raise CircuitOpenError; returns True if the call is the half-open probe."""
+        if self.state == OPEN and time.monotonic() - self._opened_at >= self.open_s:
+            self.state = HALF_OPEN
+            self._probing = False
+        if self.state == HALF_OPEN and not self._probing:
+            self._probing = True
+            return True
+        if self.state != CLOSED:
+            self.rejected += 1
+            raise CircuitOpenError(f"{self.name} circuit is {self.state}")
+        return False
+
+    def record(self, ok: bool, latency_ms: float, probe: bool = False) -> None:
+        """Record the outcome of an admitted call."""
+        now = time.monotonic()
+        slow = self.slow_call_ms > 0 and latency_ms >= self.slow_call_ms
+        if probe:
+            self._probing = False
+            if ok and not slow:
+                self.state = CLOSED
+                self._window.clear()
+                self._failures = self._slow = 0
+            else:
+                self._open(now)
+            return
+        self._window.append((now, not ok, slow, latency_ms))
+        self._failures += not ok
+        self._slow += slow
+        self._prune(now)
+        if self.state == CLOSED and self._should_open():
+            self._open(now)
+
+    def abandon(self, probe: bool) -> None:
+        """An admitted call ended without an outcome (e.g. cancelled); let another call probe."""
+        if probe:
+            self._probing = False
+
+    def _open(self, now: float) -> None:
+        self.state = OPEN
+        self._opened_at = now
+        self.times_opened += 1
+
+    def _prune(self, now: float) -> None:
+        while self._window and now - self._window[0][0] > self.window_s:
+            _, failed, slow, _ = self._window.popleft()
+            self._failures -= failed
+            self._slow -= slow
+
+    def _rates(self) -> tuple[float, float]:
+        calls = len(self._window)
+        if not calls:
+            return 0.0, 0.0
+        return self._failures / calls, self._slow / calls
+
+    def _should_open(self) -> bool:
+        if len(self._window) < self.min_requests:
+            return False
+        errors, slow = self._rates()
+        return errors >= self.error_rate or slow >= self.slow_call_rate
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        self._prune(now)
+        errors, slow = self._rates()
+        latencies = sorted(entry[3] for entry in self._window)
+        return {
+            "state": self.state,
+            "window_calls": len(latencies),
+            "error_rate": round(errors, 3),
+            "slow_call_rate": round(slow, 3),
+            "p95_ms": round(latencies[int(0.95 * (len(latencies) - 1))], 2) if latencies else None,
+            "times_opened": self.times_opened,
+            "rejected": self.rejected,
+            "open_for_s": round(max(0.0, self.open_s - (now - self._opened_at)), 2) if self.state == OPEN else None,
+        }
@@ -0,0 +1,170 @@
+"""
+Cart Write Contention Benchmark
+
+Runs concurrent writers (50 by default) against one cart of a running cart
+service and reports latency, throughput, response codes and the optimistic
+concurrency retries the service made (from GET /health/cart-conflicts):
+
+- add_same_variant:      every writer adds the same variant (upsert increments)
+- add_distinct_variants: writers add different variants to the same cart
+- set_quantity:          writers overwrite the quantities of 3 shared line
+                         items (compare-and-swap on the line item)
+- mixed:                 adds and set_quantity calls interleaved
+
+Each scenario uses a fresh cart. Afterwards the cart is checked for lost
+updates: item_count and subtotal must equal the sums over its line items, and
+for the add scenarios the quantities must equal the number of successful adds.
+
+Variants are taken from the catalog's GET /products. Run it where the cart
+and catalog are reachable, e.g. inside the cart container:
+
+    docker compose exec store-cart python contention_benchmark.py
+    docker compose exec store-cart python contention_benchmark.py --writers 50 --ops 40 -o contention.json
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from collections import Counter
+from decimal import Decimal
+
+import httpx
+
+from benchmark import summarize
+
+SCENARIOS = ["add_same_variant", "add_distinct_variants", "set_quantity", "mixed"]
+
+
+async def _variant_ids(client: httpx.AsyncClient, catalog_url: str, count: int) -> list[int]:
+    resp = await client.get(f"{catalog_url}/products", params={"per_page": 100})
+    resp.raise_for_status()
+    ids = [v["id"] for p in resp.json()["products"] for v in p["variants"]]
+    if not ids:
+        raise SystemExit("catalog has no variants")
+    return ids[:count]
+
+
+async def _new_cart(client: httpx.AsyncClient, cart_url: str) -> dict:
+    resp = await client.post(f"{cart_url}/cart")
+    resp.raise_for_status()
+    return {"X-Spree-Order-Token": resp.json()["token"]}
+
+
+async def _add(client, cart_url, headers, variant_id: int) -> httpx.Response:
+    return await client.post(f"{cart_url}/cart/add_item", json={"variant_id": variant_id, "quantity": 1},
+                             headers=headers)
+
+
+async def _set(client, cart_url, headers, line_item_id: int) -> httpx.Response:
+    return await client.patch(f"{cart_url}/cart/set_quantity",
+                              json={"line_item_id": line_item_id, "quantity": random.randint(1, 9)},
+                              headers=headers)
+
+
+def _check(cart: dict) -> dict:
+    quantity = sum(li["quantity"] for li in cart["line_items"])
+    subtotal = sum(Decimal(str(li["price"])) * li["quantity"] for li in cart["line_items"])
+    return {
+        "item_count": cart["item_count"],
+        "line_quantity_sum": quantity,
+        "subtotal": cart["subtotal"],
+        "line_subtotal_sum": float(subtotal),
+        "consistent": cart["item_count"] == quantity and Decimal(str(cart["subtotal"])) == subtotal,
+    }
+
+
+async def _run_scenario(client, cart_url: str, name: str, variants: list[int], writers: int, ops: int) -> dict:
+    headers = await _new_cart(client, cart_url)
+    shared: list[int] = []
+    if name in ("set_quantity", "mixed"):
+        for vid in variants[:3]:
+            resp = await _add(client, cart_url, headers, vid)
+            resp.raise_for_status()
+        shared = [li["id"] for li in resp.json()["line_items"]]
+
+    latencies: list[int] = []
+    statuses: Counter = Counter()
+    adds = Counter()
+
+    async def writer(n: int) -> None:
+        for i in range(ops):
+            if name == "add_same_variant":
+                kind, target = "add", variants[0]
+            elif name == "add_distinct_variants":
+                kind, target = "add", variants[(n + i) % len(variants)]
+            elif name == "set_quantity":
+                kind, target = "set", random.choice(shared)
+            else:
+                kind, target = ("add", variants[i % len(variants)]) if (n + i) % 2 else ("set", random.choice(shared))
+            t0 = time.perf_counter_ns()
+            if kind == "add":
+                resp = await _add(client, cart_url, headers, target)
+            else:
+                resp = await _set(client, cart_url, headers, target)
+            latencies.append(time.perf_counter_ns() - t0)
+            statuses[resp.status_code] += 1
+            if kind == "add" and resp.status_code == 200:
+                adds[target] += 1
+
+    before = (await client.get(f"{cart_url}/health/cart-conflicts")).json()
+    started = time.perf_counter()
+    await asyncio.gather(*(writer(n) for n in range(writers)))
+    elapsed = time.perf_counter() - started
+    after = (await client.get(f"{cart_url}/health/cart-conflicts")).json()
+
+    cart = (await client.get(f"{cart_url}/cart", headers=headers)).json()
+    check = _check(cart)
+    if name.startswith("add_"):
+        got = {li["variant_id"]: li["quantity"] for li in cart["line_items"]}
+        check["adds_preserved"] = all(got.get(vid) == count for vid, count in adds.items())
+    await client.request("DELETE", f"{cart_url}/cart", headers=headers)
+
+    mutations = after["mutations"] - before["mutations"]
+    conflicts = after["conflicts"] - before["conflicts"]
+    return {
+        "scenario": name,
+        "requests": summarize(latencies, elapsed),
+        "status_codes": {str(code): count for code, count in sorted(statuses.items())},
+        "conflict_retries": conflicts,
+        "retries_per_mutation": round(conflicts / mutations, 3) if mutations else 0.0,
+        "gave_up_409": after["exhausted"] - before["exhausted"],
+        "check": check,
+    }
+
+
+async def run(cart_url: str, catalog_url: str, scenarios: list[str], writers: int, ops: int) -> dict:
+    limits = httpx.Limits(max_connections=writers, max_keepalive_connections=writers)
+    async with httpx.AsyncClient(limits=limits, timeout=60.0) as client:
+        variants = await _variant_ids(client, catalog_url, writers)
+        runs = [await _run_scenario(client, cart_url, name, variants, writers, ops) for name in scenarios]
+    return {"writers": writers, "ops_per_writer": ops, "runs": runs}
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark concurrent writes to a single cart.")
+    parser.add_argument("--cart-url", default=os.environ.get("CART_URL", "http://localhost:8001"))
+    parser.add_argument("--catalog-url", default=os.environ.get("CATALOG_URL", "http://localhost:8000"))
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--writers", type=int, default=50, help="concurrent writers on the cart")
+    parser.add_argument("--ops", type=int, default=20, help="requests per writer")
+    parser.add_argument("-o", "--output", help="write the JSON report to this file")
+    args = parser.parse_args(argv)
+
+    result = asyncio.run(run(args.cart_url.rstrip("/"), args.catalog_url.rstrip("/"), args.scenarios,
+                             args.writers, args.ops))
+    report = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report + "\n")
+    else:
+        print(report)
+    return 0 if all(r["check"]["consistent"] and r["check"].get("adds_preserved", True) for r in result["runs"]) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,7 @@
 import os
 
 from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 
 DB_USERNAME = os.environ.get('POSTGRES_USER', 'postgres')
@@ -16,6 +17,16 @@ engine = create_engine(DATABASE_URL, pool_pre_ping=True, pool_size=10, max_overf
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# Async endpoints use the same database through asyncpg, so queries and row
+# locks never block the event loop. Sync handlers keep using SessionLocal.
+ASYNC_DATABASE_URL = os.environ.get(
+    'ASYNC_DATABASE_URL',
+    DATABASE_URL.replace('postgresql://', 'postgresql+asyncpg://', 1),
+)
+
+_async_engine: AsyncEngine | None = None
+_async_sessionmaker: async_sessionmaker[AsyncSession] | None = None
+
 
 def get_db():
     db = SessionLocal()
@@ -29,7 +40,89 @@ def get_db():
         db.close()
 
 
+def get_async_engine() -> AsyncEngine:
+    """Return the async engine, creating it on first use."""
+    global _async_engine, _async_sessionmaker
+    if _async_engine is None:
+        _async_engine = create_async_engine(ASYNC_DATABASE_URL, pool_pre_ping=True, pool_size=10, max_overflow=20)
+        # expire_on_commit=False: attributes stay loaded after commit, since
+        # lazy loads are not possible on an AsyncSession.
+        _async_sessionmaker = async_sessionmaker(_async_engine, autoflush=False, expire_on_commit=False)
+    return _async_engine
+
+
+async def get_async_db():
+    get_async_engine()
+    async with _async_sessionmaker() as db:
+        try:
+            yield db
+        except Exception:
+            # H13: rollback on any unhandled exception so the session is clean
+            await db.rollback()
+            raise
+
+
+async def dispose_async_engine():
+    global _async_engine, _async_sessionmaker
+    if _async_engine is not None:
+        await _async_engine.dispose()
+        _async_engine = None
+        _async_sessionmaker = None
+
+
 def ensure_schema():
     with engine.connect() as conn:
         conn.execute(text("CREATE SCHEMA IF NOT EXISTS cart"))
         conn.commit()
+
+
+# Schema changes take an ACCESS EXCLUSIVE lock on cart.orders; fail startup
+# rather than queue every cart request behind a long-running transaction.
+_DDL_LOCK_TIMEOUT = "5s"
+
+
+def _order_columns(conn) -> dict[str, str | None]:
+    """Column name -> default expression for cart.orders."""
+    rows = conn.execute(text(
+        "SELECT column_name, column_default FROM information_schema.columns"
+        " WHERE table_schema = 'cart' AND table_name = 'orders'"
+    ))
+    return {name: default for name, default in rows}
+
+
+def upgrade_schema():
+    """Add columns and indexes introduced after the tables were first created (create_all never alters tables).
+
+    Only the changes that are missing are applied, so a restart of an
+    up-to-date database takes no table locks.
+    """
+    with engine.begin() as conn:
+        columns = _order_columns(conn)
+        changes = []
+        if "version" not in columns:
+            changes.append("ADD COLUMN IF NOT EXISTS version integer NOT NULL DEFAULT 0")
+        if "updated_at" not in columns:
+            # Existing rows keep NULL (idle since created_at) instead of all looking fresh.
+            changes.append("ADD COLUMN IF NOT EXISTS updated_at timestamp")
+        if "now()" not in (columns.get("updated_at") or ""):
+            changes.append("ALTER COLUMN updated_at SET DEFAULT now()")
+        if changes:
+            conn.execute(text(f"SET LOCAL lock_timeout = '{_DDL_LOCK_TIMEOUT}'"))
+            for change in changes:
+                conn.execute(text(f"ALTER TABLE cart.orders {change}"))
+        partitioned = conn.execute(text("SELECT relkind = 'p' FROM pg_class WHERE oid = 'cart.orders'::regclass")).scalar()
+        idle_index_valid = conn.execute(text(
+            "SELECT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid"
+            " WHERE c.oid = to_regclass('cart.ix_orders_cart_idle')"
+        )).scalar()
+    if partitioned or idle_index_valid:
+        return  # partitioned tables get their indexes from cart_compaction.create_partitioned_tables
+    # Built without blocking cart writes on a large table (CONCURRENTLY needs autocommit).
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        if idle_index_valid is False:
+            # Left INVALID by an interrupted build; IF NOT EXISTS would keep it forever.
+            conn.execute(text("DROP INDEX CONCURRENTLY IF EXISTS cart.ix_orders_cart_idle"))
+        conn.execute(text(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_orders_cart_idle"
+            " ON cart.orders (coalesce(updated_at, created_at)) WHERE state = 'cart'"
+        ))
@@ -0,0 +1,337 @@
+"""
+Ephemeral Cart Store (Redis)
+
+With CART_STORE=redis, carts in the `cart` state are kept in Redis instead of
+cart.orders / cart.line_items. Most carts are abandoned; this way they never
+cost a Postgres write, WAL, index entries or vacuum work. A cart is written
+to Postgres once, when update_checkout moves it past `cart`. The API is
+unchanged: every endpoint looks the token up in Redis first and then in
+Postgres.
+
+Layout: one hash per order, key cart:{token}, refreshed to CART_REDIS_TTL_S
+on every write (abandoned carts simply expire):
+
+    id, state, email, currency, discount_amount, discount_code, ship_total,
+    created_at, next_line_id    order fields ("" for NULL)
+    li:{line_item_id}           one JSON object per line item
+
+Totals are not stored; they are computed from the line items on every load.
+Order ids come from the cart.orders sequence, so a cart keeps its id when it
+is persisted. Line item ids are per cart and are reassigned by Postgres at
+persistence.
+
+Writes are optimistic transactions (WATCH, read, change in memory,
+MULTI/HSET/HDEL/EXEC), retried on a concurrent change up to
+CART_CAS_MAX_ATTEMPTS times like the Postgres writes. The store uses the
+synchronous redis client; async endpoints call it through the threadpool.
+
+A cart being persisted is marked with the time the checkout claimed it. The
+Postgres commit and the removal of the Redis copy cannot be atomic, so a
+request that finds the mark checks whether the order is already in
+cart.orders: if so it finishes the removal and goes to Postgres; if the
+mark is older than _PERSIST_STALE_S and the order is not there, the
+checkout died before committing and the mark is cleared.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Callable
+
+from fastapi import HTTPException
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from cart_concurrency import CAS_MAX_ATTEMPTS
+from cart_utils import apply_totals
+from database import engine
+from models import LineItem, Order
+
+try:
+    import redis
+except ImportError:  # redis is optional; without it carts stay in Postgres
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+CART_STORE = os.environ.get("CART_STORE", "postgres").lower()
+REDIS_URL = os.environ.get("CART_REDIS_URL", "redis://redis:6379/1")
+REDIS_TTL_S = int(os.environ.get("CART_REDIS_TTL_S", "604800"))
+
+_KEY_PREFIX = "cart:"
+_LINE_PREFIX = "li:"
+# Set while update_checkout copies the cart to Postgres; writes are refused meanwhile.
+_PERSISTING = "persisting"
+# A persisting mark this old (seconds) without the order in Postgres was left by a failed checkout.
+_PERSIST_STALE_S = 30.0
+_LINE_FIELDS = ("product_id", "variant_id", "quantity", "price", "name", "slug", "image_url")
+
+_client = None
+
+ENABLED = CART_STORE == "redis" and redis is not None
+if CART_STORE == "redis" and not ENABLED:
+    logger.warning("CART_STORE=redis but the redis package is not installed; carts are stored in Postgres")
+
+
+def _get_client():
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(REDIS_URL, decode_responses=True)
+    return _client
+
+
+def close_store() -> None:
+    global _client
+    if _client is not None:
+        _client.close()
+        _client = None
+
+
+@contextmanager
+def _redis_errors():
+    try:
+        yield
+    except redis.RedisError as exc:
+        logger.warning("Cart store unavailable: %s", exc)
+        raise HTTPException(status_code=503, detail="Cart store unavailable")
+
+
+def _key(token: str) -> str:
+    return _KEY_PREFIX + token
+
+
+def _in_postgres(order_id: int) -> bool:
+    with engine.connect() as conn:
+        return conn.execute(text("SELECT 1 FROM cart.orders WHERE id = :id"), {"id": order_id}).first() is not None
+
+
+def _settle(key: str, fields: dict[str, str]) -> str:
+    """Resolve the persisting mark on a cart hash.
+
+    Returns "persisted" when the order is committed to Postgres (the Redis
+    copy is removed), "cleared" when the mark was left by a checkout that
+    died before committing (the mark is removed), else "persisting".
+    """
+    if _in_postgres(int(fields["id"])):
+        _get_client().delete(key)
+        return "persisted"
+    try:
+        claimed_at = float(fields[_PERSISTING])
+    except ValueError:
+        claimed_at = 0.0
+    if time.time() - claimed_at < _PERSIST_STALE_S:
+        return "persisting"
+    logger.warning("Clearing stale checkout mark on %s", key)
+    _get_client().hdel(key, _PERSISTING)
+    return "cleared"
+
+
+def _to_order(token: str, fields: dict[str, str]) -> Order:
+    """Build a transient Order (with line items and totals) from a cart hash."""
+    order = Order(
+        id=int(fields["id"]),
+        token=uuid.UUID(token),
+        state=fields["state"],
+        email=fields.get("email") or None,
+        currency=fields["currency"],
+        discount_amount=Decimal(fields["discount_amount"]),
+        discount_code=fields.get("discount_code") or None,
+        ship_total=Decimal(fields["ship_total"]),
+        created_at=datetime.fromisoformat(fields["created_at"]),
+    )
+    lines = sorted(
+        (int(name[len(_LINE_PREFIX):]), json.loads(value))
+        for name, value in fields.items() if name.startswith(_LINE_PREFIX)
+    )
+    order.line_items = [
+        LineItem(id=line_item_id, order_id=order.id, **{**data, "price": Decimal(data["price"])})
+        for line_item_id, data in lines
+    ]
+    apply_totals(order, order.line_items)
+    return order
+
+
+def _to_fields(order: Order, next_line_id: int) -> dict[str, str]:
+    """Flatten an Order into cart hash fields; line items without an id get the next ids."""
+    fields = {
+        "id": str(order.id),
+        "state": order.state,
+        "email": order.email or "",
+        "currency": order.currency,
+        "discount_amount": str(order.discount_amount),
+        "discount_code": order.discount_code or "",
+        "ship_total": str(order.ship_total),
+        "created_at": order.created_at.isoformat(),
+    }
+    for li in order.line_items:
+        if li.id is None:
+            li.id = next_line_id
+            next_line_id += 1
+        data = {name: getattr(li, name) for name in _LINE_FIELDS}
+        data["price"] = str(data["price"])
+        fields[_LINE_PREFIX + str(li.id)] = json.dumps(data)
+    fields["next_line_id"] = str(next_line_id)
+    return fields
+
+
+def create(db: Session) -> Order:
+    """Start a cart in Redis; only its id is drawn from Postgres (a sequence value, no row)."""
+    order_id = db.execute(text("SELECT nextval('cart.orders_id_seq')")).scalar_one()
+    token = str(uuid.uuid4())
+    order = Order(
+        id=order_id, token=uuid.UUID(token), state="cart", email=None, currency="USD",
+        discount_amount=Decimal("0.00"), discount_code=None, ship_total=Decimal("0.00"),
+        created_at=datetime.now(timezone.utc).replace(tzinfo=None),
+    )
+    order.line_items = []
+    apply_totals(order, order.line_items)
+    with _redis_errors():
+        _get_client().pipeline().hset(_key(token), mapping=_to_fields(order, 1)).expire(
+            _key(token), REDIS_TTL_S
+        ).execute()
+    return order
+
+
+def load(token: str) -> Order | None:
+    """The cart for token if it is held in Redis, else None (look in Postgres)."""
+    with _redis_errors():
+        fields = _get_client().hgetall(_key(token))
+        if fields.get(_PERSISTING) and _settle(_key(token), fields) == "persisted":
+            return None
+    return _to_order(token, fields) if fields else None
+
+
+def mutate(token: str, change: Callable[[Order], None]) -> Order | None:
+    """Apply change to the Redis cart in an optimistic transaction; None if the cart is not in Redis.
+
+    change edits the Order in place: new line items are appended with id None,
+    removed ones dropped from order.line_items. HTTPExceptions it raises
+    abort the write.
+    """
+    key = _key(token)
+    with _redis_errors(), _get_client().pipeline() as pipe:
+        for _ in range(CAS_MAX_ATTEMPTS):
+            try:
+                pipe.watch(key)
+                before = pipe.hgetall(key)
+                if not before:
+                    return None
+                if before.get(_PERSISTING):
+                    state = _settle(key, before)
+                    if state == "persisted":
+                        return None
+                    if state == "persisting":
+                        raise HTTPException(status_code=409, detail="Cart is being checked out, please retry")
+                    continue  # the mark was cleared; start over on the changed key
+                order = _to_order(token, before)
+                change(order)
+                apply_totals(order, order.line_items)
+                after = _to_fields(order, int(before["next_line_id"]))
+                removed = [name for name in before if name.startswith(_LINE_PREFIX) and name not in after]
+                pipe.multi()
+                pipe.hset(key, mapping=after)
+                if removed:
+                    pipe.hdel(key, *removed)
+                pipe.expire(key, REDIS_TTL_S)
+                pipe.execute()
+                return order
+            except redis.WatchError:
+                continue
+            finally:
+                pipe.reset()
+    raise HTTPException(status_code=409, detail="Cart was modified concurrently, please retry")
+
+
+def delete(token: str) -> bool:
+    """Drop the Redis cart; False if token is not held in Redis."""
+    with _redis_errors():
+        return bool(_get_client().delete(_key(token)))
+
+
+def persist(token: str, db: Session, change: Callable[[Order], None]) -> Order | None:
+    """Move a Redis cart into cart.orders / cart.line_items; None if the cart is not in Redis.
+
+    change is applied to the cart first (e.g. checkout fields and the state
+    transition) and may raise to abort. The cart is marked while it is copied,
+    so concurrent writes get 409 rather than being lost, and the Redis copy is
+    removed once the Postgres transaction has committed (or, if that removal
+    fails, by the next request that finds the mark; see _settle).
+    """
+    key = _key(token)
+    with _redis_errors():
+        client = _get_client()
+        with client.pipeline() as pipe:
+            for _ in range(CAS_MAX_ATTEMPTS):
+                try:
+                    pipe.watch(key)
+                    fields = pipe.hgetall(key)
+                    if not fields:
+                        return None
+                    if fields.get(_PERSISTING):
+                        state = _settle(key, fields)
+                        if state == "persisted":
+                            return None
+                        if state == "persisting":
+                            raise HTTPException(status_code=409, detail="Cart is being checked out, please retry")
+                        continue  # the mark was cleared; start over on the changed key
+                    pipe.multi()
+                    pipe.hset(key, _PERSISTING, str(time.time()))
+                    pipe.execute()
+                    break
+                except redis.WatchError:
+                    continue
+                finally:
+                    pipe.reset()
+            else:
+                raise HTTPException(status_code=409, detail="Cart was modified concurrently, please retry")
+
+        try:
+            order = _to_order(token, fields)
+            change(order)
+            for li in order.line_items:
+                li.id = None
+            db.add(order)
+            db.commit()
+        except BaseException:
+            client.hdel(key, _PERSISTING)
+            raise
+        try:
+            client.delete(key)
+        except redis.RedisError as exc:
+            # The order is committed; the next request for the cart finds it in Postgres and drops this copy.
+            logger.warning("Persisted cart %s is still in Redis: %s", token, exc)
+    db.refresh(order)
+    return order
+
+
+def add_line(order: Order, values: dict) -> None:
+    """add_item on a Redis cart: increment the variant's line, or append a new one."""
+    for li in order.line_items:
+        if li.variant_id == values["variant_id"]:
+            li.quantity += values["quantity"]
+            return
+    order.line_items.append(LineItem(**values))
+
+
+def set_line_quantity(order: Order, line_item_id: int, quantity: int) -> bool:
+    """Set a line item's quantity (0 removes it); False if the cart has no such line item."""
+    for li in order.line_items:
+        if li.id == line_item_id:
+            if quantity > 0:
+                li.quantity = quantity
+            else:
+                order.line_items.remove(li)
+            return True
+    return False
+
+
+def empty(order: Order) -> None:
+    order.line_items.clear()
+    order.discount_amount = Decimal("0.00")
+    order.discount_code = None  # H3: clear discount code when emptying cart
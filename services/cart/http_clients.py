@@ -0,0 +1,214 @@
+"""
+Upstream HTTP Clients
+
+One long-lived httpx.AsyncClient per upstream (catalog, discounts, pricing),
+created in the FastAPI lifespan and shared by every request, so cart
+mutations reuse keep-alive connections instead of opening a new TCP
+connection per call. Each upstream has its own timeout; connection limits and
+HTTP/2 are configured from the environment.
+
+Pool metrics are collected per upstream by a thin transport wrapper and
+httpcore's trace hook: requests in flight (each holding a connection),
+connections opened, and the time each request waited for a pooled connection
+before its headers were sent. The same wrapper applies the per-upstream
+circuit breaker and the request deadline (see circuit_breaker).
+"""
+import logging
+import os
+import time
+
+import httpx
+
+from circuit_breaker import CircuitBreaker, DeadlineExceeded, remaining_s
+
+logger = logging.getLogger(__name__)
+
+# Per-upstream request timeouts in seconds.
+UPSTREAM_TIMEOUTS = {
+    "catalog": float(os.environ.get("CATALOG_TIMEOUT_S", "5.0")),
+    "discounts": float(os.environ.get("DISCOUNTS_TIMEOUT_S", "5.0")),
+    "pricing": float(os.environ.get("PRICING_ENGINE_TIMEOUT_S", "10.0")),
+}
+
+HTTP_MAX_CONNECTIONS = int(os.environ.get("CART_HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.environ.get("CART_HTTP_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_EXPIRY_S = float(os.environ.get("CART_HTTP_KEEPALIVE_EXPIRY_S", "30"))
+# HTTP/2 needs the optional h2 package; without it clients fall back to HTTP/1.1.
+HTTP2_ENABLED = os.environ.get("CART_HTTP2", "false").lower() == "true"
+
+# Trace events that mark the end of a request's wait for a pooled connection.
+_CONNECTION_ACQUIRED = (
+    "connection.connect_tcp.started",
+    "http11.send_request_headers.started",
+    "http2.send_request_headers.started",
+)
+
+
+class _PoolMetrics:
+    """Request, connection and pool-wait counters for one upstream."""
+
+    def __init__(self) -> None:
+        self.requests = 0
+        self.in_flight = 0
+        self.connections_opened = 0
+        self.wait_total_ms = 0.0
+        self.wait_max_ms = 0.0
+
+    def trace_for_request(self):
+        started = time.perf_counter()
+        waiting = True
+
+        async def trace(event_name: str, info: dict) -> None:
+            nonlocal waiting
+            if event_name == "connection.connect_tcp.complete":
+                self.connections_opened += 1
+            if waiting and event_name in _CONNECTION_ACQUIRED:
+                waiting = False
+                waited = (time.perf_counter() - started) * 1000.0
+                self.wait_total_ms += waited
+                self.wait_max_ms = max(self.wait_max_ms, waited)
+
+        return trace
+
+    def snapshot(self) -> dict:
+        return {
+            "requests": self.requests,
+            "in_flight": self.in_flight,
+            "connections_opened": self.connections_opened,
+            "pool_wait_avg_ms": round(self.wait_total_ms / self.requests, 3) if self.requests else 0.0,
+            "pool_wait_max_ms": round(self.wait_max_ms, 3),
+        }
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class _MeteredTransport(httpx.AsyncBaseTransport):
+    """Wraps the pooled transport with the circuit breaker, request deadline and pool metrics."""
+
+    def __init__(self, inner: httpx.AsyncBaseTransport, metrics: _PoolMetrics, breaker: CircuitBreaker) -> None:
+        self._inner = inner
+        self._metrics = metrics
+        self._breaker = breaker
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        remaining = remaining_s()
+        # Set when the request deadline, not the upstream's own timeout, bounds this call.
+        capped = False
+        if remaining is not None:
+            if remaining <= 0:
+                raise DeadlineExceeded("request deadline exceeded before calling upstream", request=request)
+            timeouts = request.extensions.get("timeout", {})
+            capped = any(value is None or remaining < value for value in timeouts.values())
+            request.extensions["timeout"] = {
+                key: remaining if value is None else min(value, remaining) for key, value in timeouts.items()
+            }
+        probe = self._breaker.before_call()
+
+        self._metrics.requests += 1
+        self._metrics.in_flight += 1
+        request.extensions["trace"] = self._metrics.trace_for_request()
+        started = time.perf_counter()
+        try:
+            response = await self._inner.handle_async_request(request)
+        except Exception as exc:
+            # A timeout caused by the request's own budget, or a wait for one of
+            # our pooled connections, says nothing about the upstream's health.
+            if isinstance(exc, httpx.PoolTimeout) or (capped and isinstance(exc, httpx.TimeoutException)):
+                self._breaker.abandon(probe)
+            else:
+                self._breaker.record(False, (time.perf_counter() - started) * 1000.0, probe)
+            raise
+        except BaseException:
+            self._breaker.abandon(probe)
+            raise
+        finally:
+            self._metrics.in_flight -= 1
+        self._breaker.record(response.status_code < 500, (time.perf_counter() - started) * 1000.0, probe)
+        return response
+
+    async def aclose(self) -> None:
+        await self._inner.aclose()
+
+
+def _build_client(name: str, metrics: _PoolMetrics, breaker: CircuitBreaker) -> httpx.AsyncClient:
+    http2 = HTTP2_ENABLED and _http2_available()
+    if HTTP2_ENABLED and not http2:
+        logger.warning("CART_HTTP2 is set but the h2 package is not installed; using HTTP/1.1")
+
+    transport = httpx.AsyncHTTPTransport(
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY_S,
+        ),
+        http2=http2,
+    )
+    return httpx.AsyncClient(timeout=UPSTREAM_TIMEOUTS[name], transport=_MeteredTransport(transport, metrics, breaker))
+
+
+class _ClientRegistry:
+    def __init__(self) -> None:
+        self._clients: dict[str, httpx.AsyncClient] = {}
+        self._metrics: dict[str, _PoolMetrics] = {}
+        self._breakers: dict[str, CircuitBreaker] = {}
+
+    def get(self, name: str) -> httpx.AsyncClient:
+        client = self._clients.get(name)
+        if client is None or client.is_closed:
+            metrics = self._metrics.setdefault(name, _PoolMetrics())
+            breaker = self._breakers.setdefault(name, CircuitBreaker(name))
+            client = self._clients[name] = _build_client(name, metrics, breaker)
+        return client
+
+    async def aclose(self) -> None:
+        clients, self._clients = self._clients, {}
+        for client in clients.values():
+            await client.aclose()
+
+    def stats(self) -> dict:
+        return {
+            name: {"timeout_s": UPSTREAM_TIMEOUTS[name], **metrics.snapshot()}
+            for name, metrics in self._metrics.items()
+        }
+
+    def circuit_stats(self) -> dict:
+        return {name: breaker.stats() for name, breaker in self._breakers.items()}
+
+
+_registry = _ClientRegistry()
+
+
+def start_clients() -> None:
+    """Create the shared client for every upstream."""
+    for name in UPSTREAM_TIMEOUTS:
+        _registry.get(name)
+
+
+async def close_clients() -> None:
+    """Close every shared client and its pooled connections."""
+    await _registry.aclose()
+
+
+def get_client(name: str) -> httpx.AsyncClient:
+    """Return the shared client for an upstream ("catalog", "discounts" or "pricing").
+
+    Clients are normally created in the lifespan; one is created on first use
+    otherwise.
+    """
+    return _registry.get(name)
+
+
+def get_client_stats() -> dict:
+    """Return timeout and pool metrics for every upstream."""
+    return _registry.stats()
+
+
+def get_circuit_stats() -> dict:
+    """Return circuit breaker state and rolling-window rates for every upstream."""
+    return _registry.circuit_stats()
@@ -1,32 +1,48 @@
 import bootstrap  # noqa: F401 — must be first for dd-trace
 
 import logging
-import os
 from contextlib import asynccontextmanager
 from datetime import datetime, timezone
 
-import httpx
 from ddtrace import tracer
 from ddtrace.propagation.http import HTTPPropagator
-from fastapi import Depends, FastAPI, Header, HTTPException
-from fastapi.responses import JSONResponse
-from sqlalchemy import text
-from sqlalchemy.orm import Session
-
-from cart_utils import order_to_dict, recalculate_order
-from database import Base, engine, ensure_schema, get_db
-from models import LineItem, Order
+from fastapi import Depends, FastAPI, Header, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, Response
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, selectinload
+
+import ephemeral_carts
+from cart_batch import apply_batch, apply_batch_ephemeral
+from cart_compaction import get_compaction_stats, prepare_tables, start_compaction, stop_compaction
+from cart_cache import etag_matches, get_cart_cache_stats, get_cart_response, invalidate_cart
+from cart_serializer import cart_response, order_to_bytes
+from cart_concurrency import get_conflict_stats, run_with_retry, run_with_retry_async
+from cart_repricing import check_reprice_token, get_repricing_stats, reprice_open_carts
+from cart_utils import add_line_item_async, change_line_quantity, empty_order, to_money
+from database import Base, dispose_async_engine, engine, ensure_schema, get_async_db, get_db, upgrade_schema
+from circuit_breaker import request_deadline
+from http_clients import close_clients, get_circuit_stats, get_client_stats, start_clients
+from models import Order
 from pricing_client import PRICING_ENGINE_ENABLED, fetch_adjusted_price
-from promotions import apply_coupon
+from promotions import apply_coupon, discount_for, fetch_discount
 from schemas import (
     AddItemRequest,
     ApplyCouponRequest,
+    BatchItemsRequest,
     CartSchema,
     CheckoutUpdateRequest,
+    RepriceRequest,
     SetQuantityRequest,
 )
-
-CATALOG_URL = os.environ.get("CATALOG_URL", "http://localhost:8000")
+from variant_cache import (
+    CatalogUnavailable,
+    close_variant_cache,
+    get_variant,
+    get_variant_cache_stats,
+    warm_variant_cache,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -34,14 +50,33 @@ logger = logging.getLogger(__name__)
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     ensure_schema()
+    prepare_tables(engine)
     Base.metadata.create_all(bind=engine)
+    upgrade_schema()
+    start_clients()
+    await warm_variant_cache()
+    start_compaction(engine)
     yield
+    await stop_compaction()
+    await close_variant_cache()
+    await close_clients()
+    await dispose_async_engine()
+    ephemeral_carts.close_store()
 
 
 from gateway_middleware import register_middleware
 
 app = FastAPI(title="Store Cart", lifespan=lifespan)
 
+
+# Registered before the gateway middleware so it runs inside it: simulated
+# gateway latency does not consume the upstream budget.
+@app.middleware("http")
+async def upstream_deadline(request: Request, call_next):
+    with request_deadline():
+        return await call_next(request)
+
+
 register_middleware(app)
 
 
@@ -52,6 +87,35 @@ def _get_order(token: str, db: Session) -> Order:
     return order
 
 
+async def _get_order_async(token: str, db: AsyncSession, with_items: bool = False) -> Order:
+    query = select(Order).where(Order.token == token)
+    if with_items:
+        # Line items cannot be lazy-loaded on an AsyncSession, so reload them
+        # (and the order's columns) for serialization.
+        query = query.options(selectinload(Order.line_items)).execution_options(populate_existing=True)
+    order = (await db.execute(query)).scalars().first()
+    if not order:
+        raise HTTPException(status_code=404, detail="Cart not found")
+    return order
+
+
+def _ephemeral_cart(token: str) -> Order | None:
+    """The cart for token if it is held in the Redis store (CART_STORE=redis), else None."""
+    return ephemeral_carts.load(token) if ephemeral_carts.ENABLED else None
+
+
+def _mutate_ephemeral(token: str, change) -> Order | None:
+    """Apply change to the Redis cart for token; None if the cart is not held in Redis."""
+    return ephemeral_carts.mutate(token, change) if ephemeral_carts.ENABLED else None
+
+
+def _found(cart: Order | None) -> Order:
+    # A Redis cart can expire or be checked out between the lookup and the write.
+    if cart is None:
+        raise HTTPException(status_code=404, detail="Cart not found")
+    return cart
+
+
 def _require_token(x_spree_order_token: str | None) -> str:
     if not x_spree_order_token:
         raise HTTPException(status_code=401, detail="Missing X-Spree-Order-Token")
@@ -73,26 +137,69 @@ def health(db: Session = Depends(get_db)):
         )
 
 
+@app.get("/health/upstreams")
+def upstream_health():
+    return get_client_stats()
+
+
+@app.get("/health/circuits")
+def circuit_health():
+    return get_circuit_stats()
+
+
+@app.get("/health/cart-conflicts")
+def cart_conflict_health():
+    return get_conflict_stats()
+
+
+@app.get("/health/compaction")
+def compaction_health():
+    return get_compaction_stats()
+
+
+@app.get("/health/repricing")
+def repricing_health():
+    return get_repricing_stats()
+
+
+@app.get("/health/cart-cache")
+def cart_cache_health():
+    return get_cart_cache_stats()
+
+
+@app.get("/health/variant-cache")
+def variant_cache_health():
+    return get_variant_cache_stats()
+
+
 # --- Cart ---
 
 
 @app.post("/cart")
 def create_cart(db: Session = Depends(get_db)):
+    if ephemeral_carts.ENABLED:
+        return cart_response(ephemeral_carts.create(db))
     order = Order()
     db.add(order)
     db.commit()
     db.refresh(order)
-    return order_to_dict(order)
+    return cart_response(order)
 
 
 @app.get("/cart", response_model=CartSchema)
 def get_cart(
     x_spree_order_token: str | None = Header(None),
+    if_none_match: str | None = Header(None),
     db: Session = Depends(get_db),
 ):
     token = _require_token(x_spree_order_token)
-    order = _get_order(token, db)
-    return order_to_dict(order)
+    # Served from the cart cache when possible; the session only connects on a miss.
+    etag, body = get_cart_response(
+        token, lambda: order_to_bytes(_ephemeral_cart(token) or _get_order(token, db))
+    )
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(content=body, media_type="application/json", headers={"ETag": etag})
 
 
 @app.delete("/cart")
@@ -101,9 +208,17 @@ def delete_cart(
     db: Session = Depends(get_db),
 ):
     token = _require_token(x_spree_order_token)
+    if ephemeral_carts.ENABLED and ephemeral_carts.delete(token):
+        invalidate_cart(token)
+        return {"message": "Cart deleted"}
     order = _get_order(token, db)
-    db.delete(order)
-    db.commit()
+
+    def attempt():
+        db.delete(order)
+        db.commit()
+
+    run_with_retry(db, order, attempt)
+    invalidate_cart(token)
     return {"message": "Cart deleted"}
 
 
@@ -113,26 +228,32 @@ def empty_cart(
     db: Session = Depends(get_db),
 ):
     token = _require_token(x_spree_order_token)
+    cart = _mutate_ephemeral(token, ephemeral_carts.empty)
+    if cart is not None:
+        invalidate_cart(token)
+        return cart_response(cart)
     order = _get_order(token, db)
-    db.query(LineItem).filter(LineItem.order_id == order.id).delete()
-    order.item_count = 0
-    order.subtotal = 0
-    order.discount_amount = 0
-    order.discount_code = None  # H3: clear discount code when emptying cart
-    order.total = float(order.ship_total)
-    db.commit()
+
+    def attempt():
+        # H3: clears the discount code too
+        empty_order(order, db)
+        db.commit()
+
+    run_with_retry(db, order, attempt)
+    invalidate_cart(token)
     db.refresh(order)
-    return order_to_dict(order)
+    return cart_response(order)
 
 
 @app.post("/cart/add_item", response_model=CartSchema)
 async def add_item(
     body: AddItemRequest,
     x_spree_order_token: str | None = Header(None),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     token = _require_token(x_spree_order_token)
-    order = _get_order(token, db)
+    cart = await run_in_threadpool(_ephemeral_cart, token)
+    order = cart if cart is not None else await _get_order_async(token, db)
 
     # H2: inject Datadog trace context for distributed tracing
     prop_headers: dict = {}
@@ -140,95 +261,94 @@ async def add_item(
     if ctx:
         HTTPPropagator.inject(ctx, prop_headers)
 
-    # H1: fetch all products to find the variant.
-    # TODO: replace with a direct GET /variants/{id} endpoint once catalog supports it.
+    # H1: look the variant up in the cart's variant cache instead of scanning catalog pages.
     try:
-        async with httpx.AsyncClient() as client:
-            resp = await client.get(
-                f"{CATALOG_URL}/products",
-                params={"per_page": 100},
-                headers=prop_headers,
-                timeout=5.0,
-            )
-        if resp.status_code != 200:
-            raise HTTPException(status_code=503, detail="Catalog service unavailable")
-        data = resp.json()
-    except httpx.RequestError:
+        variant = await get_variant(body.variant_id, prop_headers)
+    except CatalogUnavailable:
         raise HTTPException(status_code=503, detail="Catalog service unavailable")
-
-    # Find the variant across all products
-    variant_data = None
-    product_data = None
-    for p in data["products"]:
-        for v in p["variants"]:
-            if v["id"] == body.variant_id:
-                variant_data = v
-                product_data = p
-                break
-        if variant_data:
-            break
-
-    if not variant_data:
-        raise HTTPException(
-            status_code=404,
-            detail=(
-                f"Variant {body.variant_id} not found in catalog "
-                f"(searched {len(data['products'])} products)"
-            ),
-        )
+    if variant is None:
+        raise HTTPException(status_code=404, detail=f"Variant {body.variant_id} not found in catalog")
 
     # Dynamic pricing: call pricing engine if enabled
     adjusted_price = await fetch_adjusted_price(
         variant_id=body.variant_id,
-        base_price=float(variant_data["price"]),
+        base_price=variant.price,
         cart_total=float(order.total),
         parent_span=tracer.current_span(),
     )
 
-    # C2: use SELECT FOR UPDATE to prevent race conditions on concurrent add_item
-    existing = db.query(LineItem).filter(
-        LineItem.order_id == order.id,
-        LineItem.variant_id == body.variant_id,
-    ).with_for_update().first()
-
-    if existing:
-        existing.quantity += body.quantity
+    values = {
+        "order_id": order.id,
+        "product_id": variant.product_id,
+        "variant_id": body.variant_id,
+        "quantity": body.quantity,
+        "price": to_money(adjusted_price),
+        "name": variant.name,
+        "slug": variant.slug,
+        "image_url": variant.image_url,
+    }
+
+    if cart is not None:
+        order = _found(await run_in_threadpool(
+            ephemeral_carts.mutate, token, lambda o: ephemeral_carts.add_line(o, values)
+        ))
+        invalidate_cart(token)
     else:
-        name = product_data["name"]
-        if variant_data.get("options_text"):
-            name += f" ({variant_data['options_text']})"
-
-        image_url = variant_data.get("image_url")
-        if not image_url and product_data.get("images"):
-            image_url = product_data["images"][0].get("url")
-
-        li = LineItem(
-            order_id=order.id,
-            product_id=product_data["id"],
-            variant_id=body.variant_id,
-            quantity=body.quantity,
-            price=adjusted_price,
-            name=name,
-            slug=product_data.get("slug"),
-            image_url=image_url,
-        )
-        db.add(li)
-        db.flush()  # C3: flush so the new row is visible to recalculate_order
+        # C2: an atomic quantity = quantity + :n upsert on uq_line_items_order_variant
+        # lets concurrent add_item calls for one variant compose without a row lock.
+        async def attempt():
+            await add_line_item_async(order, db, values)
+            await db.commit()
 
-    recalculate_order(order, db)
-    db.commit()
-    db.refresh(order)
+        await run_with_retry_async(db, order, attempt)
+        invalidate_cart(token)
+        order = await _get_order_async(token, db, with_items=True)
 
     span = tracer.current_span()
     if span:
         span.set_tag("cart.variant_id", body.variant_id)
-        span.set_tag("cart.product.name", product_data.get("name", ""))
-        span.set_tag("cart.item.price", float(variant_data.get("price", 0)))
+        span.set_tag("cart.product.name", variant.product_name)
+        span.set_tag("cart.item.price", variant.price)
         span.set_tag("cart.total", float(order.total))
         span.set_tag("cart.item_count", order.item_count)
         span.set_tag("pricing.enabled", PRICING_ENGINE_ENABLED)
 
-    return order_to_dict(order)
+    return cart_response(order)
+
+
+@app.post("/cart/items/batch", response_model=CartSchema)
+async def batch_items(
+    body: BatchItemsRequest,
+    x_spree_order_token: str | None = Header(None),
+    db: AsyncSession = Depends(get_async_db),
+):
+    token = _require_token(x_spree_order_token)
+    cart = await run_in_threadpool(_ephemeral_cart, token)
+
+    prop_headers: dict = {}
+    ctx = tracer.current_trace_context()
+    if ctx:
+        HTTPPropagator.inject(ctx, prop_headers)
+
+    if cart is not None:
+        order = _found(await apply_batch_ephemeral(
+            token, cart, body.operations, prop_headers, parent_span=tracer.current_span()
+        ))
+        invalidate_cart(token)
+    else:
+        order = await _get_order_async(token, db)
+        await apply_batch(order, body.operations, db, prop_headers, parent_span=tracer.current_span())
+        invalidate_cart(token)
+        order = await _get_order_async(token, db, with_items=True)
+
+    span = tracer.current_span()
+    if span:
+        span.set_tag("cart.batch.operations", len(body.operations))
+        span.set_tag("cart.total", float(order.total))
+        span.set_tag("cart.item_count", order.item_count)
+        span.set_tag("pricing.enabled", PRICING_ENGINE_ENABLED)
+
+    return cart_response(order)
 
 
 @app.delete("/cart/remove_line_item/{line_item_id}", response_model=CartSchema)
@@ -238,19 +358,26 @@ def remove_line_item(
     db: Session = Depends(get_db),
 ):
     token = _require_token(x_spree_order_token)
+
+    def remove(cart: Order) -> None:
+        if not ephemeral_carts.set_line_quantity(cart, line_item_id, 0):
+            raise HTTPException(status_code=404, detail="Line item not found")
+
+    cart = _mutate_ephemeral(token, remove)
+    if cart is not None:
+        invalidate_cart(token)
+        return cart_response(cart)
     order = _get_order(token, db)
-    li = db.query(LineItem).filter(
-        LineItem.id == line_item_id,
-        LineItem.order_id == order.id,
-    ).first()
-    if not li:
-        raise HTTPException(status_code=404, detail="Line item not found")
-    db.delete(li)
-    db.flush()  # ensure deleted item is excluded from recalculate query
-    recalculate_order(order, db)
-    db.commit()
+
+    def attempt():
+        if not change_line_quantity(order, db, line_item_id, 0):
+            raise HTTPException(status_code=404, detail="Line item not found")
+        db.commit()
+
+    run_with_retry(db, order, attempt)
+    invalidate_cart(token)
     db.refresh(order)
-    return order_to_dict(order)
+    return cart_response(order)
 
 
 @app.patch("/cart/set_quantity", response_model=CartSchema)
@@ -260,40 +387,74 @@ def set_quantity(
     db: Session = Depends(get_db),
 ):
     token = _require_token(x_spree_order_token)
+
+    def set_quantity_of(cart: Order) -> None:
+        if not ephemeral_carts.set_line_quantity(cart, body.line_item_id, max(body.quantity, 0)):
+            raise HTTPException(status_code=404, detail="Line item not found")
+
+    cart = _mutate_ephemeral(token, set_quantity_of)
+    if cart is not None:
+        invalidate_cart(token)
+        return cart_response(cart)
     order = _get_order(token, db)
-    li = db.query(LineItem).filter(
-        LineItem.id == body.line_item_id,
-        LineItem.order_id == order.id,
-    ).first()
-    if not li:
-        raise HTTPException(status_code=404, detail="Line item not found")
-    if body.quantity <= 0:
-        db.delete(li)
-    else:
-        li.quantity = body.quantity
-    db.flush()  # ensure delete/update is visible to recalculate query
-    recalculate_order(order, db)
-    db.commit()
+
+    def attempt():
+        if not change_line_quantity(order, db, body.line_item_id, max(body.quantity, 0)):
+            raise HTTPException(status_code=404, detail="Line item not found")
+        db.commit()
+
+    run_with_retry(db, order, attempt)
+    invalidate_cart(token)
     db.refresh(order)
-    return order_to_dict(order)
+    return cart_response(order)
 
 
 @app.patch("/cart/apply_coupon_code", response_model=CartSchema)
 async def apply_coupon_code(
     body: ApplyCouponRequest,
     x_spree_order_token: str | None = Header(None),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     token = _require_token(x_spree_order_token)
-    order = _get_order(token, db)
+    cart = await run_in_threadpool(_ephemeral_cart, token)
     span = tracer.current_span()
     if span:
         span.set_tag("discount.code", body.coupon_code)
-    order = await apply_coupon(order, body.coupon_code, db)
+    if cart is not None:
+        discount = await fetch_discount(body.coupon_code)
+
+        def change(o: Order) -> None:
+            o.discount_amount, o.ship_total = discount_for(o, discount)
+            o.discount_code = body.coupon_code
+
+        order = _found(await run_in_threadpool(ephemeral_carts.mutate, token, change))
+        invalidate_cart(token)
+    else:
+        order = await _get_order_async(token, db)
+        await apply_coupon(order, body.coupon_code, db)
+        invalidate_cart(token)
+        order = await _get_order_async(token, db, with_items=True)
     if span:
         span.set_tag("cart.discount_amount", float(order.discount_amount))
         span.set_tag("cart.total", float(order.total))
-    return order_to_dict(order)
+    return cart_response(order)
+
+
+@app.post("/cart/reprice")
+async def reprice_carts(
+    body: RepriceRequest,
+    x_reprice_token: str | None = Header(None),
+    db: AsyncSession = Depends(get_async_db),
+):
+    check_reprice_token(x_reprice_token)
+    prices = {change.variant_id: to_money(change.price) for change in body.changes}
+    report = await reprice_open_carts(db, prices)
+    span = tracer.current_span()
+    if span:
+        span.set_tag("cart.reprice.variants", report["variants"])
+        span.set_tag("cart.reprice.orders", report["orders"])
+        span.set_tag("cart.reprice.line_items", report["line_items"])
+    return report
 
 
 # --- Checkout ---
@@ -317,15 +478,7 @@ STATE_MACHINE = {
 }
 
 
-@app.patch("/checkout", response_model=CartSchema)
-def update_checkout(
-    body: CheckoutUpdateRequest,
-    x_spree_order_token: str | None = Header(None),
-    db: Session = Depends(get_db),
-):
-    token = _require_token(x_spree_order_token)
-    order = _get_order(token, db)
-
+def _advance_checkout(order: Order, body: CheckoutUpdateRequest) -> None:
     if body.email is not None:
         order.email = body.email
     if body.ship_address is not None:
@@ -347,9 +500,32 @@ def update_checkout(
     if order.state in STATE_MACHINE:
         order.state = STATE_MACHINE[order.state]
 
-    db.commit()
+
+@app.patch("/checkout", response_model=CartSchema)
+def update_checkout(
+    body: CheckoutUpdateRequest,
+    x_spree_order_token: str | None = Header(None),
+    db: Session = Depends(get_db),
+):
+    token = _require_token(x_spree_order_token)
+    if ephemeral_carts.ENABLED:
+        # Leaving the cart state moves a Redis cart into cart.orders / cart.line_items.
+        order = ephemeral_carts.persist(token, db, lambda cart: _advance_checkout(cart, body))
+        if order is not None:
+            invalidate_cart(token)
+            return cart_response(order)
+    order = _get_order(token, db)
+
+    # The flush checks Order.version, so a transition computed from a stale
+    # state is retried against the current one.
+    def attempt():
+        _advance_checkout(order, body)
+        db.commit()
+
+    run_with_retry(db, order, attempt)
+    invalidate_cart(token)
     db.refresh(order)
-    return order_to_dict(order)
+    return cart_response(order)
 
 
 @app.patch("/checkout/complete", response_model=CartSchema)
@@ -358,18 +534,23 @@ def checkout_complete(
     db: Session = Depends(get_db),
 ):
     token = _require_token(x_spree_order_token)
-    order = _get_order(token, db)
+    # A cart still held in Redis is in the cart state, so the guard below rejects it.
+    order = _ephemeral_cart(token) or _get_order(token, db)
+
+    def attempt():
+        # C1: guard — only orders in "payment" state can be completed
+        if order.state != "payment":
+            raise HTTPException(
+                status_code=422,
+                detail="Order must be in 'payment' state to complete checkout",
+            )
 
-    # C1: guard — only orders in "payment" state can be completed
-    if order.state != "payment":
-        raise HTTPException(
-            status_code=422,
-            detail="Order must be in 'payment' state to complete checkout",
-        )
+        order.state = "complete"
+        order.completed_at = datetime.now(timezone.utc)  # H10: utcnow() is deprecated
+        db.commit()
 
-    order.state = "complete"
-    order.completed_at = datetime.now(timezone.utc)  # H10: utcnow() is deprecated
-    db.commit()
+    run_with_retry(db, order, attempt)
+    invalidate_cart(token)
     db.refresh(order)
 
     # Datadog span tags
@@ -379,4 +560,4 @@ def checkout_complete(
         span.set_tag("cart.total", float(order.total))
         span.set_tag("cart.item_count", order.item_count)
 
-    return order_to_dict(order)
+    return cart_response(order)
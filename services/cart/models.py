@@ -43,9 +43,25 @@ class Order(Base):
     payment_method_id = Column(Integer)
     created_at = Column(DateTime, server_default=func.now())
     completed_at = Column(DateTime, nullable=True)
+    # Incremented by every cart write; compare-and-swap target for optimistic
+    # concurrency (see cart_concurrency.py). ORM flushes of an Order check it too.
+    version = Column(Integer, nullable=False, server_default=text("0"))
+    # Last change to the cart (NULL for rows older than the column: use created_at).
+    # Core UPDATEs of the table set it too, through onupdate.
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
 
     line_items = relationship("LineItem", back_populates="order", cascade="all, delete-orphan")
 
+    __mapper_args__ = {"version_id_col": version}
+
+
+# Carts by idleness, for abandoned-cart compaction (cart_compaction.py).
+Index(
+    "ix_orders_cart_idle",
+    func.coalesce(Order.updated_at, Order.created_at),
+    postgresql_where=Order.state == "cart",
+)
+
 
 class LineItem(Base):
     __tablename__ = "line_items"
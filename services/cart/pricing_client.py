@@ -8,10 +8,11 @@ import logging
 import os
 from typing import Optional
 
-import httpx
 from ddtrace import tracer
 from ddtrace.propagation.http import HTTPPropagator
 
+from http_clients import get_client
+
 PRICING_ENGINE_ENABLED: bool = os.getenv("FEATURE_FLAG_DYNAMIC_PRICING", "false").lower() == "true"
 PRICING_ENGINE_URL: str = os.getenv("PRICING_ENGINE_URL", "http://store-pricing-engine:8002")
 
@@ -40,17 +41,15 @@ async def fetch_adjusted_price(
         if ctx:
             HTTPPropagator.inject(ctx, pricing_headers)
 
-        async with httpx.AsyncClient() as client:
-            resp = await client.post(
-                f"{PRICING_ENGINE_URL}/price",
-                json={
-                    "variant_id": variant_id,
-                    "base_price": base_price,
-                    "cart_total": cart_total,
-                },
-                headers=pricing_headers,
-                timeout=10.0,
-            )
+        resp = await get_client("pricing").post(
+            f"{PRICING_ENGINE_URL}/price",
+            json={
+                "variant_id": variant_id,
+                "base_price": base_price,
+                "cart_total": cart_total,
+            },
+            headers=pricing_headers,
+        )
 
         adjusted_price = base_price
         if resp.status_code == 200:
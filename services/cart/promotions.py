@@ -1,51 +1,60 @@
 import os
+from decimal import Decimal
 
 import httpx
 from ddtrace import tracer
 from ddtrace.propagation.http import HTTPPropagator
 from fastapi import HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from cart_utils import recalculate_order
+from cart_concurrency import run_with_retry_async
+from cart_utils import apply_discount_async, to_money
+from http_clients import get_client
 
 DISCOUNTS_URL = os.environ.get("DISCOUNTS_URL", "http://localhost:2814")
 
 
-async def apply_coupon(order, coupon_code: str, db: Session):
+async def fetch_discount(coupon_code: str) -> dict:
+    """Look a coupon up in the discounts service; 400 if it is invalid, 503 if the service is down."""
     # H2: inject Datadog trace context for distributed tracing
     prop_headers: dict = {}
     ctx = tracer.current_trace_context()
     if ctx:
         HTTPPropagator.inject(ctx, prop_headers)
 
-    # H11: perform status check inside the async with block
-    async with httpx.AsyncClient() as client:
-        try:
-            resp = await client.get(
-                f"{DISCOUNTS_URL}/discount-code",
-                params={"discount_code": coupon_code},
-                headers=prop_headers,
-                timeout=5.0,
-            )
-        except httpx.RequestError:
-            raise HTTPException(status_code=503, detail="Discounts service unavailable")
+    try:
+        resp = await get_client("discounts").get(
+            f"{DISCOUNTS_URL}/discount-code",
+            params={"discount_code": coupon_code},
+            headers=prop_headers,
+        )
+    except httpx.RequestError:
+        raise HTTPException(status_code=503, detail="Discounts service unavailable")
 
-        if resp.status_code != 200:
-            raise HTTPException(status_code=400, detail=f"Invalid coupon code: {coupon_code}")
+    if resp.status_code != 200:
+        raise HTTPException(status_code=400, detail=f"Invalid coupon code: {coupon_code}")
 
-    discount = resp.json()
+    return resp.json()
 
+
+def discount_for(order, discount: dict) -> tuple[Decimal, Decimal]:
+    """The (discount_amount, ship_total) a discount gives order at its current subtotal."""
     if discount.get("tier") == "free_shipping":
-        order.ship_total = 0
-        order.discount_amount = 0
-    else:
-        # H12: avoid `or` which treats 0 as falsy
-        value = discount["discount_value"] if "discount_value" in discount else discount.get("value", 0)
-        order.discount_amount = float(order.subtotal) * (float(value) / 100)
-
-    order.discount_code = coupon_code
-    # H7: use shared recalculate_order instead of duplicating the formula
-    recalculate_order(order, db)
-    db.commit()
-    db.refresh(order)
+        return to_money(0), to_money(0)
+    # H12: avoid `or` which treats 0 as falsy
+    value = discount["discount_value"] if "discount_value" in discount else discount.get("value", 0)
+    return to_money(float(order.subtotal) * (float(value) / 100)), order.ship_total
+
+
+async def apply_coupon(order, coupon_code: str, db: AsyncSession):
+    discount = await fetch_discount(coupon_code)
+
+    async def attempt() -> None:
+        # Read-modify-write of the order: the discount depends on the current
+        # subtotal, so it is stored only if the order has not changed since.
+        discount_amount, ship_total = discount_for(order, discount)
+        await apply_discount_async(order, db, coupon_code, discount_amount, ship_total)
+        await db.commit()
+
+    await run_with_retry_async(db, order, attempt)
     return order
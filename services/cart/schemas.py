@@ -1,4 +1,6 @@
-from pydantic import BaseModel, Field
+from typing import Literal
+
+from pydantic import BaseModel, Field, model_validator
 
 
 class LineItemSchema(BaseModel):
@@ -43,6 +45,45 @@ class SetQuantityRequest(BaseModel):
     quantity: int = Field(ge=0)
 
 
+class BatchOperation(BaseModel):
+    op: Literal["add", "set_quantity", "remove"]
+    variant_id: int | None = None
+    # set_quantity and remove may name the line item instead of the variant
+    line_item_id: int | None = None
+    # add defaults to 1; set_quantity must name the quantity; remove ignores it
+    quantity: int | None = Field(default=None, ge=0)
+
+    @model_validator(mode="after")
+    def _check_target(self):
+        if self.op == "add":
+            if self.variant_id is None:
+                raise ValueError("add requires variant_id")
+            if self.quantity is None:
+                self.quantity = 1
+            elif self.quantity < 1:
+                raise ValueError("add requires quantity >= 1")
+        elif self.variant_id is None and self.line_item_id is None:
+            raise ValueError(f"{self.op} requires variant_id or line_item_id")
+        elif self.op == "set_quantity" and self.quantity is None:
+            raise ValueError("set_quantity requires quantity")
+        return self
+
+
+class BatchItemsRequest(BaseModel):
+    operations: list[BatchOperation] = Field(min_length=1, max_length=200)
+
+
+class PriceChange(BaseModel):
+    # cart.line_items.variant_id is an integer column
+    variant_id: int = Field(ge=0, lt=2**31)
+    price: float = Field(ge=0)
+
+
+class RepriceRequest(BaseModel):
+    # A later change for the same variant wins
+    changes: list[PriceChange] = Field(min_length=1, max_length=10000)
+
+
 class ApplyCouponRequest(BaseModel):
     coupon_code: str
 
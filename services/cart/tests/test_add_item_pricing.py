@@ -53,7 +53,7 @@ class TestPricingEngineDisabled:
         mock_client = _make_mock_client(response=_make_pricing_response(24.99, 10000, 42))
 
         with patch("pricing_client.PRICING_ENGINE_ENABLED", False), \
-             patch("pricing_client.httpx.AsyncClient", return_value=mock_client):
+             patch("pricing_client.get_client", return_value=mock_client):
             import pricing_client
             result = await pricing_client.fetch_adjusted_price(
                 variant_id=1, base_price=29.99, cart_total=60.0
@@ -80,7 +80,7 @@ class TestPricingEngineEnabled:
 
         with patch("pricing_client.PRICING_ENGINE_ENABLED", True), \
              patch("pricing_client.PRICING_ENGINE_URL", "http://store-pricing-engine:8002"), \
-             patch("pricing_client.httpx.AsyncClient", return_value=mock_client), \
+             patch("pricing_client.get_client", return_value=mock_client), \
              patch("pricing_client.tracer", mock_tracer):
             import pricing_client
             result = await pricing_client.fetch_adjusted_price(
@@ -108,7 +108,7 @@ class TestPricingEngineEnabled:
         mock_tracer.current_trace_context.return_value = None
 
         with patch("pricing_client.PRICING_ENGINE_ENABLED", True), \
-             patch("pricing_client.httpx.AsyncClient", return_value=mock_client), \
+             patch("pricing_client.get_client", return_value=mock_client), \
              patch("pricing_client.tracer", mock_tracer):
             import pricing_client
             result = await pricing_client.fetch_adjusted_price(
@@ -134,7 +134,7 @@ class TestPricingEngineGracefulDegradation:
         mock_tracer.current_trace_context.return_value = None
 
         with patch("pricing_client.PRICING_ENGINE_ENABLED", True), \
-             patch("pricing_client.httpx.AsyncClient", return_value=mock_client), \
+             patch("pricing_client.get_client", return_value=mock_client), \
              patch("pricing_client.tracer", mock_tracer):
             import pricing_client
             result = await pricing_client.fetch_adjusted_price(
@@ -161,7 +161,7 @@ class TestPricingSpanTags:
 
         with patch("pricing_client.PRICING_ENGINE_ENABLED", True), \
              patch("pricing_client.PRICING_ENGINE_URL", "http://store-pricing-engine:8002"), \
-             patch("pricing_client.httpx.AsyncClient", return_value=mock_client), \
+             patch("pricing_client.get_client", return_value=mock_client), \
              patch("pricing_client.tracer", mock_tracer):
             import pricing_client
             await pricing_client.fetch_adjusted_price(
@@ -185,7 +185,7 @@ class TestPricingSpanTags:
         mock_tracer.current_trace_context.return_value = None
 
         with patch("pricing_client.PRICING_ENGINE_ENABLED", True), \
-             patch("pricing_client.httpx.AsyncClient", return_value=mock_client), \
+             patch("pricing_client.get_client", return_value=mock_client), \
              patch("pricing_client.tracer", mock_tracer):
             import pricing_client
             await pricing_client.fetch_adjusted_price(
@@ -0,0 +1,132 @@
+"""
+Tests for batch cart mutations (cart_batch.py) and the batch request schema.
+"""
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from fastapi import HTTPException
+from pydantic import ValidationError
+from sqlalchemy.dialects import postgresql
+
+from cart_batch import _fold, apply_batch
+from cart_concurrency import CartConflict
+from schemas import BatchItemsRequest, BatchOperation
+from variant_cache import CachedVariant
+
+
+def _ops(*ops):
+    return [BatchOperation(**op) for op in ops]
+
+
+class TestBatchSchema:
+    def test_add_requires_variant_and_positive_quantity(self):
+        with pytest.raises(ValidationError):
+            BatchOperation(op="add", line_item_id=3)
+        with pytest.raises(ValidationError):
+            BatchOperation(op="add", variant_id=3, quantity=0)
+
+    def test_set_and_remove_need_a_target(self):
+        with pytest.raises(ValidationError):
+            BatchOperation(op="remove")
+        assert BatchOperation(op="set_quantity", line_item_id=1, quantity=0).quantity == 0
+
+    def test_quantity_defaults_only_for_add(self):
+        assert BatchOperation(op="add", variant_id=3).quantity == 1
+        assert BatchOperation(op="remove", line_item_id=1).quantity is None
+        with pytest.raises(ValidationError):
+            BatchOperation(op="set_quantity", line_item_id=1)
+
+    def test_operations_must_not_be_empty(self):
+        with pytest.raises(ValidationError):
+            BatchItemsRequest(operations=[])
+
+
+class TestFold:
+    def test_operations_apply_in_order(self):
+        current = {10: (1, 2), 20: (2, 1)}
+        final = _fold(_ops(
+            {"op": "add", "variant_id": 10, "quantity": 3},
+            {"op": "add", "variant_id": 30},
+            {"op": "set_quantity", "variant_id": 30, "quantity": 4},
+            {"op": "remove", "line_item_id": 2},
+            {"op": "add", "variant_id": 10},
+        ), current)
+
+        assert final == {10: 6, 30: 4, 20: 0}
+
+    def test_unknown_line_item_is_404(self):
+        with pytest.raises(HTTPException) as exc:
+            _fold(_ops({"op": "set_quantity", "line_item_id": 99, "quantity": 2}), {10: (1, 2)})
+        assert exc.value.status_code == 404
+
+    def test_removed_item_cannot_be_updated_later_in_batch(self):
+        with pytest.raises(HTTPException):
+            _fold(_ops(
+                {"op": "remove", "variant_id": 10},
+                {"op": "set_quantity", "variant_id": 10, "quantity": 2},
+            ), {10: (1, 2)})
+
+
+class TestApplyBatch:
+    @pytest.mark.asyncio
+    async def test_writes_set_based_without_locking_and_commits_once(self):
+        order = SimpleNamespace(id=5, total=Decimal("40.00"), version=3)
+        variant = CachedVariant(variant_id=30, product_id=3, product_name="Tee", price=15.0,
+                                options_text=None, slug="tee", image_url=None)
+        rows = [(1, 10, 2), (2, 20, 1)]
+        db = MagicMock()
+        db.execute = AsyncMock(side_effect=[rows, MagicMock(), MagicMock(), MagicMock()])
+        db.commit = AsyncMock()
+
+        with patch("cart_batch.get_variant", AsyncMock(return_value=variant)) as get_variant, \
+             patch("cart_batch.fetch_adjusted_price", AsyncMock(return_value=14.994)), \
+             patch("cart_batch.recalculate_totals_async", AsyncMock()) as recalculate:
+            await apply_batch(order, _ops(
+                {"op": "add", "variant_id": 30, "quantity": 2},
+                {"op": "set_quantity", "line_item_id": 1, "quantity": 5},
+                {"op": "remove", "variant_id": 20},
+            ), db, headers={})
+
+        get_variant.assert_awaited_once_with(30, {})
+        statements = [call.args[0] for call in db.execute.await_args_list]
+        assert "FOR UPDATE" not in str(statements[0].compile(dialect=postgresql.dialect()))
+        upsert = str(statements[1].compile(dialect=postgresql.dialect()))
+        assert "ON CONFLICT ON CONSTRAINT uq_line_items_order_variant DO UPDATE" in upsert
+        assert statements[1].compile().params["price_m0"] == Decimal("14.99")
+        assert db.execute.await_args_list[2].args[1] == [{"id": 1, "quantity": 5}]
+        assert "DELETE FROM cart.line_items" in str(statements[3].compile(dialect=postgresql.dialect()))
+        recalculate.assert_awaited_once_with(order, db, expected_version=3)
+        db.commit.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    async def test_version_conflict_rereads_and_retries(self):
+        order = SimpleNamespace(id=5, total=Decimal("40.00"), version=3)
+        db = MagicMock()
+        db.execute = AsyncMock(side_effect=[[(1, 10, 2)], MagicMock(), [(1, 10, 4)], MagicMock()])
+        db.commit = AsyncMock()
+        db.rollback = AsyncMock()
+        db.refresh = AsyncMock()
+
+        with patch("cart_batch.recalculate_totals_async", AsyncMock(side_effect=[CartConflict("changed"), None])), \
+             patch("cart_concurrency._backoff_s", return_value=0):
+            await apply_batch(order, _ops({"op": "set_quantity", "line_item_id": 1, "quantity": 5}), db, headers={})
+
+        db.rollback.assert_awaited_once()
+        db.refresh.assert_awaited_once_with(order)
+        assert db.execute.await_count == 4
+        db.commit.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    async def test_unknown_variant_fails_before_locking(self):
+        db = MagicMock()
+        db.execute = AsyncMock()
+
+        with patch("cart_batch.get_variant", AsyncMock(return_value=None)):
+            with pytest.raises(HTTPException) as exc:
+                await apply_batch(SimpleNamespace(id=5, total=0), _ops({"op": "add", "variant_id": 99}),
+                                  db, headers={})
+
+        assert exc.value.status_code == 404
+        db.execute.assert_not_awaited()
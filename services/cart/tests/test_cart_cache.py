@@ -0,0 +1,116 @@
+"""
+Tests for the GET /cart response cache (cart_cache.py) and its ETag handling.
+"""
+import json
+import threading
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from cart_cache import CartCache, etag_matches
+
+
+def _cart(total=10.0):
+    return json.dumps({"id": "1", "token": "tok", "total": total, "line_items": []}, separators=(",", ":")).encode()
+
+
+class TestCartCache:
+    def test_hit_skips_load(self):
+        cache = CartCache(ttl_s=60, max_entries=10)
+        load = MagicMock(return_value=_cart())
+
+        first = cache.read_through("tok", load)
+        second = cache.read_through("tok", load)
+
+        assert first == second
+        assert load.call_count == 1
+        assert cache.stats()["hits"] == 1
+
+    def test_invalidate_forces_reload_with_new_etag(self):
+        cache = CartCache(ttl_s=60, max_entries=10)
+        etag, _ = cache.read_through("tok", lambda: _cart(10.0))
+
+        cache.invalidate("tok")
+        new_etag, body = cache.read_through("tok", lambda: _cart(25.0))
+
+        assert new_etag != etag
+        assert b'"total":25.0' in body
+
+    def test_fill_invalidated_while_loading_is_not_cached(self):
+        cache = CartCache(ttl_s=60, max_entries=10)
+        loading = threading.Event()
+        release = threading.Event()
+
+        def slow_load():
+            loading.set()
+            release.wait(5)
+            return _cart(10.0)
+
+        reader = threading.Thread(target=cache.read_through, args=("tok", slow_load))
+        reader.start()
+        loading.wait(5)
+        cache.invalidate("tok")
+        release.set()
+        reader.join(5)
+
+        assert cache.stats()["entries"] == 0
+        assert cache.stats()["discarded_fills"] == 1
+
+    def test_load_error_is_not_cached(self):
+        cache = CartCache(ttl_s=60, max_entries=10)
+
+        def missing():
+            raise LookupError("Cart not found")
+
+        with pytest.raises(LookupError):
+            cache.read_through("tok", missing)
+        assert cache.stats()["entries"] == 0
+        assert cache._filling == {}
+
+    def test_least_recently_used_cart_evicted(self):
+        cache = CartCache(ttl_s=60, max_entries=2)
+        for token in ("a", "b", "c"):
+            cache.read_through(token, _cart)
+
+        assert list(cache._entries) == ["b", "c"]
+        assert cache.stats()["evictions"] == 1
+
+    def test_etag_matches(self):
+        assert etag_matches('"abc"', '"abc"')
+        assert etag_matches('W/"abc", "def"', '"abc"')
+        assert etag_matches("*", '"abc"')
+        assert not etag_matches('"def"', '"abc"')
+        assert not etag_matches(None, '"abc"')
+
+
+class TestGetCartEndpoint:
+    def test_if_none_match_returns_304_without_loading_order(self):
+        from fastapi.testclient import TestClient
+
+        import cart_cache
+        import main
+        from database import get_db
+
+        order = SimpleNamespace(
+            id=1, token="tok-304", state="cart", email=None, currency="USD", item_count=0,
+            subtotal=0, discount_amount=0, discount_code=None, ship_total=0, total=0, line_items=[],
+        )
+        main.app.dependency_overrides[get_db] = lambda: MagicMock()
+        try:
+            with patch.object(cart_cache, "_cache", CartCache(ttl_s=60, max_entries=10)), \
+                 patch("main._get_order", return_value=order) as get_order:
+                client = TestClient(main.app)
+                first = client.get("/cart", headers={"X-Spree-Order-Token": "tok-304"})
+                second = client.get(
+                    "/cart",
+                    headers={"X-Spree-Order-Token": "tok-304", "If-None-Match": first.headers["etag"]},
+                )
+        finally:
+            main.app.dependency_overrides.clear()
+
+        assert first.status_code == 200
+        assert first.json()["token"] == "tok-304"
+        assert second.status_code == 304
+        assert second.headers["etag"] == first.headers["etag"]
+        assert get_order.call_count == 1
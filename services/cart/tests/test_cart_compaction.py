@@ -0,0 +1,100 @@
+"""
+Tests for abandoned-cart compaction and order partitions (cart_compaction.py).
+"""
+from datetime import datetime
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+import cart_compaction
+from cart_compaction import CompactionJob, _month_start, compact, ensure_partitions
+
+
+def _engine(*batches):
+    """An engine whose batch statement returns (orders, line_items) per transaction, in order."""
+    conn = MagicMock()
+    conn.execute.return_value.one.side_effect = [
+        SimpleNamespace(orders=orders, line_items=line_items) for orders, line_items in batches
+    ]
+    engine = MagicMock()
+    engine.begin.return_value.__enter__.return_value = conn
+    return engine, conn
+
+
+class TestCompact:
+    def test_batches_until_a_short_batch(self):
+        engine, conn = _engine((2, 5), (2, 3), (1, 0))
+
+        with patch("cart_compaction.time.sleep"):
+            result = compact(engine, datetime(2026, 1, 1), batch_size=2, archive=False)
+
+        assert result == {"orders": 5, "line_items": 8, "batches": 3}
+        sql = str(conn.execute.call_args.args[0])
+        assert "FOR UPDATE SKIP LOCKED" in sql
+        assert "archive" not in sql
+        assert conn.execute.call_args.args[1] == {"cutoff": datetime(2026, 1, 1), "batch_size": 2}
+
+    def test_orphan_line_items_are_swept_when_requested(self):
+        engine, conn = _engine((0, 0))
+        conn.execute.return_value.scalar.side_effect = [2, 1]
+
+        result = compact(engine, datetime(2026, 1, 1), batch_size=2, archive=False, orphans=True)
+
+        assert result["orphan_line_items"] == 3
+        sql = str(conn.execute.call_args.args[0])
+        assert "NOT EXISTS (SELECT 1 FROM cart.orders o WHERE o.id = li.order_id)" in sql
+
+    def test_archive_copies_deleted_rows_in_the_same_statement(self):
+        engine, conn = _engine((0, 0))
+
+        compact(engine, datetime(2026, 1, 1), batch_size=10, archive=True)
+
+        statements = [str(c.args[0]) for c in conn.execute.call_args_list]
+        assert any("CREATE TABLE IF NOT EXISTS cart.orders_archive" in s for s in statements)
+        assert "INSERT INTO cart.orders_archive SELECT * FROM orders" in statements[-1]
+
+
+class TestPartitions:
+    def test_month_arithmetic(self):
+        assert _month_start(datetime(2026, 11, 17), 2) == datetime(2027, 1, 1)
+        assert _month_start(datetime(2026, 1, 5), -1) == datetime(2025, 12, 1)
+
+    def test_creates_missing_months_ahead(self):
+        conn = MagicMock()
+        # cart.orders_p202611 already exists
+        conn.execute.side_effect = lambda stmt, *a: MagicMock(
+            scalar=MagicMock(return_value="x" if "orders_p202611'" in str(stmt) else None)
+        )
+
+        created = ensure_partitions(conn, datetime(2026, 10, 17))
+
+        assert created == ["orders_p202610", "orders_p202612", "orders_p202701"]
+        ddl = [str(c.args[0]) for c in conn.execute.call_args_list if "CREATE TABLE" in str(c.args[0])]
+        assert ddl[-1].endswith("FOR VALUES FROM ('2027-01-01') TO ('2027-02-01')")
+
+
+class TestCompactionJob:
+    @pytest.mark.asyncio
+    async def test_run_once_accumulates_totals(self):
+        job = CompactionJob(interval_s=0)
+        job.engine = MagicMock()
+        report = {"removed": {"orders": 3, "line_items": 7, "batches": 1}, "duration_ms": 4.2}
+
+        with patch.object(cart_compaction, "run_compaction", return_value=report):
+            await job.run_once()
+            await job.run_once()
+
+        stats = job.stats()
+        assert (stats["runs"], stats["orders_removed"], stats["line_items_removed"]) == (2, 6, 14)
+        assert stats["last_run"] == report
+
+    @pytest.mark.asyncio
+    async def test_failure_is_recorded(self):
+        job = CompactionJob(interval_s=0)
+
+        with patch.object(cart_compaction, "run_compaction", side_effect=RuntimeError("db down")):
+            assert await job.run_once() is None
+
+        assert job.failures == 1
+        assert job.last_error == "db down"
@@ -0,0 +1,89 @@
+"""
+Tests for optimistic-concurrency retries (cart_concurrency.py).
+"""
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy.exc import IntegrityError, NoResultFound, OperationalError
+
+import cart_concurrency
+from cart_concurrency import CartConflict, run_with_retry, run_with_retry_async
+
+
+@pytest.fixture(autouse=True)
+def no_backoff():
+    with patch("cart_concurrency._backoff_s", return_value=0):
+        yield
+
+
+def _deadlock():
+    orig = Exception("deadlock detected")
+    orig.pgcode = "40P01"
+    return OperationalError("UPDATE cart.orders ...", {}, orig)
+
+
+class TestRunWithRetry:
+    def test_conflict_rolls_back_refreshes_and_retries(self):
+        db, order = MagicMock(), object()
+        attempt = MagicMock(side_effect=[CartConflict("changed"), _deadlock(), "ok"])
+
+        assert run_with_retry(db, order, attempt) == "ok"
+
+        assert attempt.call_count == 3
+        assert db.rollback.call_count == 2
+        db.refresh.assert_called_with(order)
+
+    def test_gives_up_with_409(self):
+        db = MagicMock()
+        attempt = MagicMock(side_effect=CartConflict("changed"))
+
+        with patch.object(cart_concurrency, "CAS_MAX_ATTEMPTS", 3):
+            with pytest.raises(HTTPException) as exc:
+                run_with_retry(db, object(), attempt)
+
+        assert exc.value.status_code == 409
+        assert attempt.call_count == 3
+        assert db.refresh.call_count == 2
+
+    def test_other_errors_are_not_retried(self):
+        db = MagicMock()
+        attempt = MagicMock(side_effect=HTTPException(status_code=404))
+
+        with pytest.raises(HTTPException):
+            run_with_retry(db, object(), attempt)
+
+        attempt.assert_called_once()
+        db.rollback.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_async_variant(self):
+        db, order = MagicMock(), object()
+        db.rollback = AsyncMock()
+        db.refresh = AsyncMock()
+        attempt = AsyncMock(side_effect=[CartConflict("changed"), None])
+
+        await run_with_retry_async(db, order, attempt)
+
+        assert attempt.await_count == 2
+        db.refresh.assert_awaited_once_with(order)
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("error", ["foreign_key", "no_row"])
+    async def test_cart_deleted_under_the_write_is_404(self, error):
+        if error == "foreign_key":
+            orig = Exception("violates foreign key constraint")
+            orig.pgcode = "23503"
+            exc = IntegrityError("INSERT INTO cart.line_items ...", {}, orig)
+        else:
+            exc = NoResultFound("No row was found when one was required")
+        db = MagicMock()
+        db.rollback = AsyncMock()
+        attempt = AsyncMock(side_effect=exc)
+
+        with pytest.raises(HTTPException) as raised:
+            await run_with_retry_async(db, object(), attempt)
+
+        assert raised.value.status_code == 404
+        attempt.assert_awaited_once()
+        db.rollback.assert_awaited_once()
@@ -0,0 +1,140 @@
+"""
+Tests for bulk repricing of open carts (cart_repricing.py).
+"""
+import uuid
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy.exc import DBAPIError
+
+import cart_concurrency
+import cart_repricing
+from cart_repricing import check_reprice_token, reprice_open_carts
+from schemas import PriceChange
+
+PRICES = {10: Decimal("12.50"), 20: Decimal("3.00")}
+
+
+def _db(*results):
+    """An AsyncSession whose reprice statement returns each of results in turn (rows, or an exception)."""
+    db = MagicMock()
+    db.commit = AsyncMock()
+    db.rollback = AsyncMock()
+    outcomes = iter(results)
+
+    async def execute(stmt, params=None):
+        if "pg_advisory_xact_lock" in str(stmt):
+            return MagicMock()
+        outcome = next(outcomes)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return MagicMock(all=MagicMock(return_value=outcome))
+
+    db.execute = AsyncMock(side_effect=execute)
+    return db
+
+
+def _deadlock():
+    return DBAPIError("UPDATE", {}, SimpleNamespace(pgcode="40P01"))
+
+
+class TestRepriceOpenCarts:
+    @pytest.mark.asyncio
+    async def test_one_statement_and_cache_updates(self):
+        tokens = [uuid.uuid4(), uuid.uuid4()]
+        db = _db([SimpleNamespace(token=tokens[0], line_items=2), SimpleNamespace(token=tokens[1], line_items=1)])
+
+        with patch.object(cart_repricing, "invalidate_cart") as invalidate, \
+                patch.object(cart_repricing, "update_variant_prices") as update_prices:
+            report = await reprice_open_carts(db, PRICES)
+
+        assert (report["variants"], report["orders"], report["line_items"]) == (2, 2, 3)
+        stmt, params = db.execute.call_args.args
+        assert params == {"variant_ids": [10, 20], "prices": [Decimal("12.50"), Decimal("3.00")]}
+        sql = str(stmt)
+        assert "o.state = 'cart'" in sql and "version = o.version + 1" in sql
+        assert "updated_at" not in sql
+        db.commit.assert_awaited_once()
+        assert [c.args[0] for c in invalidate.call_args_list] == [str(t) for t in tokens]
+        update_prices.assert_called_once_with(PRICES)
+
+    @pytest.mark.asyncio
+    async def test_deadlock_is_retried(self):
+        db = _db(_deadlock(), [])
+        conflicts = cart_repricing.get_repricing_stats()["conflicts"]
+
+        with patch("cart_concurrency._backoff_s", return_value=0), \
+                patch.object(cart_repricing, "update_variant_prices"):
+            report = await reprice_open_carts(db, PRICES)
+
+        assert report["orders"] == 0
+        assert cart_repricing.get_repricing_stats()["conflicts"] == conflicts + 1
+        db.rollback.assert_awaited_once()
+        db.commit.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    async def test_gives_up_with_409(self):
+        db = _db(*[_deadlock() for _ in range(cart_concurrency.CAS_MAX_ATTEMPTS)])
+
+        with patch("cart_concurrency._backoff_s", return_value=0), \
+                patch.object(cart_repricing, "update_variant_prices") as update_prices:
+            with pytest.raises(HTTPException) as exc:
+                await reprice_open_carts(db, PRICES)
+
+        assert exc.value.status_code == 409
+        update_prices.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_other_errors_propagate(self):
+        db = _db(DBAPIError("UPDATE", {}, SimpleNamespace(pgcode="42P01")))
+
+        with pytest.raises(DBAPIError):
+            await reprice_open_carts(db, PRICES)
+
+        db.rollback.assert_not_awaited()
+
+
+class TestRepriceAccess:
+    def test_disabled_without_a_token(self):
+        with patch.object(cart_repricing, "REPRICE_TOKEN", ""):
+            with pytest.raises(HTTPException) as exc:
+                check_reprice_token("anything")
+
+        assert exc.value.status_code == 404
+
+    @pytest.mark.parametrize("token", [None, "", "wrong"])
+    def test_wrong_token_is_forbidden(self, token):
+        with patch.object(cart_repricing, "REPRICE_TOKEN", "s3cret"):
+            with pytest.raises(HTTPException) as exc:
+                check_reprice_token(token)
+
+        assert exc.value.status_code == 403
+
+    def test_matching_token_passes(self):
+        with patch.object(cart_repricing, "REPRICE_TOKEN", "s3cret"):
+            check_reprice_token("s3cret")
+
+    def test_endpoint_checks_the_token_before_touching_the_database(self):
+        from fastapi.testclient import TestClient
+
+        import main
+        from database import get_async_db
+
+        body = {"changes": [{"variant_id": 10, "price": 0}]}
+        main.app.dependency_overrides[get_async_db] = lambda: MagicMock()
+        try:
+            with patch.object(cart_repricing, "REPRICE_TOKEN", "s3cret"), \
+                    patch("main.reprice_open_carts", new_callable=AsyncMock) as reprice:
+                response = TestClient(main.app).post("/cart/reprice", json=body)
+        finally:
+            main.app.dependency_overrides.clear()
+
+        assert response.status_code == 403
+        reprice.assert_not_awaited()
+
+    def test_variant_id_must_fit_the_column(self):
+        with pytest.raises(ValueError):
+            PriceChange(variant_id=2**31, price=1)
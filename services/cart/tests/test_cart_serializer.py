@@ -0,0 +1,68 @@
+"""
+Tests for the direct Order -> JSON serializer (cart_serializer.py).
+"""
+import json
+import uuid
+from decimal import Decimal
+from unittest.mock import patch
+
+from fastapi.responses import Response
+
+import cart_serializer
+from cart_serializer import cart_response, order_to_bytes, order_to_json
+from cart_utils import order_to_dict
+from models import LineItem, Order
+from schemas import CartSchema
+
+
+def _order(item_count=3):
+    order = Order(
+        id=42, token=uuid.uuid4(), state="cart", email=None, currency="USD", item_count=item_count,
+        subtotal=Decimal("59.97"), discount_amount=Decimal("0.00"), discount_code=None,
+        ship_total=Decimal("4.99"), total=Decimal("64.96"),
+    )
+    order.line_items = [
+        LineItem(id=i, order_id=42, product_id=i, variant_id=100 + i, quantity=1, price=Decimal("19.99"),
+                 name=f"Item {i}", slug=None, image_url=None)
+        for i in range(1, item_count + 1)
+    ]
+    return order
+
+
+class TestOrderToJson:
+    def test_matches_validated_model_output(self):
+        order = _order()
+
+        fast = json.loads(order_to_json(order))
+        model = CartSchema.model_validate(order_to_dict(order)).model_dump(mode="json")
+
+        assert fast == model
+        assert fast["total"] == 64.96
+        assert fast["line_items"][0]["price"] == 19.99
+
+    def test_unloaded_attributes_fall_back_to_attribute_access(self):
+        order = _order(item_count=1)
+        del order.__dict__["email"]
+
+        data = json.loads(order_to_json(order))
+
+        assert data["email"] is None
+        assert data["id"] == "42"
+
+
+class TestSerializerSwitch:
+    def test_fast_path_returns_prebuilt_response(self):
+        with patch.object(cart_serializer, "FAST_SERIALIZER", True):
+            response = cart_response(_order())
+
+        assert isinstance(response, Response)
+        assert json.loads(response.body)["item_count"] == 3
+
+    def test_disabled_returns_dict_for_response_model_validation(self):
+        order = _order()
+        with patch.object(cart_serializer, "FAST_SERIALIZER", False):
+            response = cart_response(order)
+            body = order_to_bytes(order)
+
+        assert response == order_to_dict(order)
+        assert json.loads(body) == json.loads(order_to_json(order))
@@ -0,0 +1,179 @@
+"""
+Tests for cart total recalculation (cart_utils.py).
+"""
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from sqlalchemy import inspect
+from sqlalchemy.dialects import postgresql
+
+from cart_concurrency import CartConflict
+from cart_utils import (
+    _delta_statement,
+    apply_line_delta,
+    apply_line_delta_async,
+    change_line_quantity,
+    recalculate_order_async,
+    recalculate_totals_async,
+    to_money,
+)
+from models import Order
+
+
+def _order(discount_amount=0.0, ship_total=0.0):
+    return SimpleNamespace(id=1, item_count=0, subtotal=0, discount_amount=discount_amount,
+                           ship_total=ship_total, total=0)
+
+
+def _async_session(items):
+    result = MagicMock()
+    result.scalars.return_value.all.return_value = items
+    db = MagicMock()
+    db.execute = AsyncMock(return_value=result)
+    return db
+
+
+class TestRecalculateOrderAsync:
+    @pytest.mark.asyncio
+    async def test_totals_from_line_items(self):
+        order = _order(discount_amount=5.0, ship_total=4.99)
+        db = _async_session([
+            SimpleNamespace(quantity=2, price=10.005),
+            SimpleNamespace(quantity=1, price=3.50),
+        ])
+
+        await recalculate_order_async(order, db)
+
+        db.execute.assert_awaited_once()
+        assert order.item_count == 3
+        assert order.subtotal == 23.51
+        assert order.total == 23.5
+
+    @pytest.mark.asyncio
+    async def test_total_never_negative(self):
+        order = _order(discount_amount=50.0)
+        db = _async_session([SimpleNamespace(quantity=1, price=10.0)])
+
+        await recalculate_order_async(order, db)
+
+        assert order.total == 0
+
+
+class TestApplyLineDelta:
+    def test_single_update_returning_totals(self):
+        sql = str(_delta_statement(7, 2, Decimal("19.98")).compile(dialect=postgresql.dialect()))
+
+        assert sql.startswith("UPDATE cart.orders SET")
+        assert "item_count=(cart.orders.item_count +" in sql
+        assert "subtotal=(cart.orders.subtotal +" in sql
+        assert "greatest(" in sql
+        assert "version=(cart.orders.version +" in sql
+        assert sql.endswith(
+            "RETURNING cart.orders.item_count, cart.orders.subtotal, cart.orders.total, cart.orders.version"
+        )
+
+    def test_returned_totals_are_set_without_dirtying_order(self):
+        order = Order(id=7)
+        db = MagicMock()
+        db.execute.return_value.one.return_value = SimpleNamespace(
+            item_count=3, subtotal=Decimal("29.97"), total=Decimal("34.96"), version=4,
+        )
+
+        apply_line_delta(order, db, 1, Decimal("9.99"))
+
+        assert (order.item_count, order.subtotal, order.total) == (3, Decimal("29.97"), Decimal("34.96"))
+        assert order.version == 4
+        assert not inspect(order).attrs.total.history.has_changes()
+
+    @pytest.mark.asyncio
+    async def test_async_variant(self):
+        order = Order(id=7)
+        result = MagicMock()
+        result.one.return_value = SimpleNamespace(item_count=0, subtotal=Decimal("0"), total=Decimal("4.99"), version=2)
+        db = MagicMock()
+        db.execute = AsyncMock(return_value=result)
+
+        await apply_line_delta_async(order, db, -2, Decimal("-19.98"))
+
+        db.execute.assert_awaited_once()
+        assert order.item_count == 0
+        assert order.total == Decimal("4.99")
+
+    def test_to_money_rounds_half_up_to_cents(self):
+        assert to_money(10.005) == Decimal("10.01")
+        assert to_money(24.994) == Decimal("24.99")
+
+
+class TestCompareAndSwap:
+    def test_change_line_quantity_writes_only_the_quantity_read(self):
+        order = Order(id=7)
+        db = MagicMock()
+        db.execute.side_effect = [
+            MagicMock(first=MagicMock(return_value=SimpleNamespace(quantity=2, price=Decimal("9.99")))),
+            MagicMock(rowcount=1),
+            MagicMock(one=MagicMock(return_value=SimpleNamespace(
+                item_count=5, subtotal=Decimal("49.95"), total=Decimal("49.95"), version=8,
+            ))),
+        ]
+
+        assert change_line_quantity(order, db, 3, 5)
+
+        cas = str(db.execute.call_args_list[1].args[0].compile(dialect=postgresql.dialect()))
+        assert ("WHERE cart.line_items.id = %(id_1)s AND cart.line_items.quantity = %(quantity_1)s "
+                "AND cart.line_items.price = %(price_1)s") in cas
+        delta = db.execute.call_args_list[2].args[0].compile()
+        assert delta.params["item_count_1"] == 3
+        assert delta.params["subtotal_1"] == Decimal("29.97")
+        assert order.version == 8
+
+    def test_change_line_quantity_conflict_when_row_changed(self):
+        db = MagicMock()
+        db.execute.side_effect = [
+            MagicMock(first=MagicMock(return_value=SimpleNamespace(quantity=2, price=Decimal("9.99")))),
+            MagicMock(rowcount=0),
+        ]
+
+        with pytest.raises(CartConflict):
+            change_line_quantity(Order(id=7), db, 3, 0)
+        assert db.execute.call_count == 2
+
+    def test_change_line_quantity_conflict_when_repriced_after_the_read(self):
+        line = {"quantity": 2, "price": Decimal("9.99")}
+
+        def execute(stmt, *args):
+            if stmt.is_select:
+                read = SimpleNamespace(**line)
+                # /cart/reprice commits between the read and the compare-and-swap
+                line["price"] = Decimal("12.50")
+                return MagicMock(first=MagicMock(return_value=read))
+            params = stmt.compile().params
+            matches = params["quantity_1"] == line["quantity"] and params["price_1"] == line["price"]
+            return MagicMock(rowcount=int(matches))
+
+        db = MagicMock()
+        db.execute.side_effect = execute
+
+        with pytest.raises(CartConflict):
+            change_line_quantity(Order(id=7), db, 3, 5)
+        assert db.execute.call_count == 2
+
+    def test_change_line_quantity_missing_line_item(self):
+        db = MagicMock()
+        db.execute.return_value.first.return_value = None
+
+        assert not change_line_quantity(Order(id=7), db, 3, 1)
+
+    @pytest.mark.asyncio
+    async def test_recalculate_with_stale_version_conflicts(self):
+        result = MagicMock()
+        result.one_or_none.return_value = None
+        db = MagicMock()
+        db.execute = AsyncMock(return_value=result)
+
+        with pytest.raises(CartConflict):
+            await recalculate_totals_async(Order(id=7), db, expected_version=3)
+
+        sql = str(db.execute.await_args.args[0].compile(dialect=postgresql.dialect()))
+        assert "AND cart.orders.version = %(version_2)s" in sql
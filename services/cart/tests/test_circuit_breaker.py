@@ -0,0 +1,129 @@
+"""
+Tests for upstream circuit breakers and the request deadline (circuit_breaker.py).
+"""
+import asyncio
+from unittest.mock import patch
+
+import httpx
+import pytest
+
+from circuit_breaker import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    CircuitBreaker,
+    CircuitOpenError,
+    DeadlineExceeded,
+    remaining_s,
+    request_deadline,
+)
+from http_clients import _MeteredTransport, _PoolMetrics
+
+
+def _breaker(**overrides):
+    options = {"window_s": 30, "min_requests": 4, "error_rate": 0.5, "slow_call_ms": 1000,
+               "slow_call_rate": 0.8, "open_s": 10}
+    options.update(overrides)
+    return CircuitBreaker("pricing", **options)
+
+
+class TestCircuitBreaker:
+    def test_opens_on_error_rate_once_window_is_full(self):
+        breaker = _breaker()
+        for ok in (True, False, True):
+            breaker.before_call()
+            breaker.record(ok, 5.0)
+        assert breaker.state == CLOSED
+
+        breaker.before_call()
+        breaker.record(False, 5.0)
+
+        assert breaker.state == OPEN
+        with pytest.raises(CircuitOpenError):
+            breaker.before_call()
+        assert breaker.stats()["rejected"] == 1
+
+    def test_opens_on_slow_calls(self):
+        breaker = _breaker()
+        for _ in range(4):
+            breaker.before_call()
+            breaker.record(True, 1500.0)
+
+        assert breaker.state == OPEN
+
+    def test_half_open_admits_one_probe_and_closes_on_success(self):
+        breaker = _breaker(min_requests=1)
+        breaker.before_call()
+        breaker.record(False, 5.0)
+
+        with patch("circuit_breaker.time.monotonic", return_value=breaker._opened_at + 11):
+            assert breaker.before_call() is True
+            assert breaker.state == HALF_OPEN
+            with pytest.raises(CircuitOpenError):
+                breaker.before_call()
+            breaker.record(True, 5.0, probe=True)
+
+        assert breaker.state == CLOSED
+        assert breaker.stats()["window_calls"] == 0
+
+    def test_failed_probe_reopens(self):
+        breaker = _breaker(min_requests=1)
+        breaker.before_call()
+        breaker.record(False, 5.0)
+
+        with patch("circuit_breaker.time.monotonic", return_value=breaker._opened_at + 11):
+            probe = breaker.before_call()
+            breaker.record(False, 5.0, probe=probe)
+
+        assert breaker.state == OPEN
+        assert breaker.times_opened == 2
+
+    def test_old_outcomes_leave_the_window(self):
+        breaker = _breaker(window_s=1)
+        for _ in range(3):
+            breaker.before_call()
+            breaker.record(False, 5.0)
+
+        with patch("circuit_breaker.time.monotonic", return_value=breaker._window[-1][0] + 2):
+            breaker.before_call()
+            breaker.record(False, 5.0)
+
+        assert breaker.state == CLOSED
+        assert breaker.stats()["window_calls"] <= 1
+
+
+class TestTransportGuards:
+    @pytest.mark.asyncio
+    async def test_open_circuit_fails_fast_as_request_error(self):
+        calls = []
+        breaker = _breaker(min_requests=1)
+        transport = _MeteredTransport(
+            httpx.MockTransport(lambda request: calls.append(request) or httpx.Response(503)), _PoolMetrics(), breaker,
+        )
+
+        async with httpx.AsyncClient(transport=transport) as client:
+            assert (await client.get("http://pricing/price")).status_code == 503
+            with pytest.raises(httpx.RequestError):
+                await client.get("http://pricing/price")
+
+        assert len(calls) == 1
+        assert breaker.state == OPEN
+
+    @pytest.mark.asyncio
+    async def test_deadline_caps_timeouts_and_expires(self):
+        seen = []
+
+        def handler(request):
+            seen.append(request.extensions["timeout"])
+            return httpx.Response(200)
+
+        transport = _MeteredTransport(httpx.MockTransport(handler), _PoolMetrics(), _breaker())
+        async with httpx.AsyncClient(transport=transport, timeout=10.0) as client:
+            with request_deadline(200):
+                await client.get("http://catalog/products")
+                await asyncio.sleep(0.25)
+                with pytest.raises(DeadlineExceeded):
+                    await client.get("http://catalog/products")
+            assert remaining_s() is None
+
+        assert 0 < seen[0]["read"] <= 0.2
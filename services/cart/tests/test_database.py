@@ -0,0 +1,94 @@
+"""
+Tests for the startup schema upgrade (database.upgrade_schema).
+"""
+from unittest.mock import MagicMock, patch
+
+import database
+
+
+UP_TO_DATE = {"id": None, "version": "0", "updated_at": "now()"}
+
+
+def _engine(columns: dict, index_valid: bool | None = True):
+    """An engine whose cart.orders has the given columns (name -> default) and idle index state."""
+    conn = MagicMock()
+
+    def execute(stmt, *args):
+        sql = str(stmt)
+        result = MagicMock()
+        if "information_schema.columns" in sql:
+            result.__iter__.return_value = iter(columns.items())
+        elif "relkind" in sql:
+            result.scalar.return_value = False
+        elif "indisvalid" in sql:
+            result.scalar.return_value = index_valid
+        return result
+
+    conn.execute.side_effect = execute
+    engine = MagicMock()
+    engine.begin.return_value.__enter__.return_value = conn
+    engine.connect.return_value.execution_options.return_value.__enter__.return_value = conn
+    return engine, conn
+
+
+def _statements(conn) -> list[str]:
+    return [str(c.args[0]) for c in conn.execute.call_args_list]
+
+
+class TestUpgradeSchema:
+    def test_missing_version_column_is_added_under_a_lock_timeout(self):
+        engine, conn = _engine({"id": None, "updated_at": "now()"})
+
+        with patch.object(database, "engine", engine):
+            database.upgrade_schema()
+
+        statements = _statements(conn)
+        added = next(i for i, s in enumerate(statements) if "ADD COLUMN IF NOT EXISTS version" in s)
+        assert "lock_timeout" in statements[added - 1]
+
+    def test_existing_version_column_is_left_alone(self):
+        engine, conn = _engine(UP_TO_DATE)
+
+        with patch.object(database, "engine", engine):
+            database.upgrade_schema()
+
+        assert not any("version" in s for s in _statements(conn))
+
+    def test_up_to_date_database_takes_no_locks(self):
+        engine, conn = _engine(UP_TO_DATE)
+
+        with patch.object(database, "engine", engine):
+            database.upgrade_schema()
+
+        assert not any(s.startswith(("ALTER", "SET", "CREATE", "DROP")) for s in _statements(conn))
+        engine.connect.assert_not_called()
+
+    def test_missing_updated_at_gets_column_and_default(self):
+        engine, conn = _engine({"id": None, "version": "0"})
+
+        with patch.object(database, "engine", engine):
+            database.upgrade_schema()
+
+        statements = _statements(conn)
+        assert "ALTER TABLE cart.orders ADD COLUMN IF NOT EXISTS updated_at timestamp" in statements
+        assert "ALTER TABLE cart.orders ALTER COLUMN updated_at SET DEFAULT now()" in statements
+
+    def test_invalid_idle_index_is_rebuilt(self):
+        engine, conn = _engine(UP_TO_DATE, index_valid=False)
+
+        with patch.object(database, "engine", engine):
+            database.upgrade_schema()
+
+        statements = _statements(conn)
+        assert statements[-2] == "DROP INDEX CONCURRENTLY IF EXISTS cart.ix_orders_cart_idle"
+        assert statements[-1].startswith("CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_orders_cart_idle")
+
+    def test_missing_idle_index_is_created(self):
+        engine, conn = _engine(UP_TO_DATE, index_valid=None)
+
+        with patch.object(database, "engine", engine):
+            database.upgrade_schema()
+
+        statements = _statements(conn)
+        assert not any(s.startswith("DROP") for s in statements)
+        assert statements[-1].startswith("CREATE INDEX CONCURRENTLY")
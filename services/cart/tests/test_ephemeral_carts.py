@@ -0,0 +1,160 @@
+"""
+Tests for the Redis-backed ephemeral cart store (ephemeral_carts.py).
+"""
+import json
+import time
+import uuid
+from datetime import datetime
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+import pytest
+from fastapi import HTTPException
+
+import ephemeral_carts
+from ephemeral_carts import _to_fields, _to_order, add_line, set_line_quantity
+
+TOKEN = str(uuid.uuid4())
+
+
+def _hash(**lines):
+    fields = {
+        "id": "41", "state": "cart", "email": "", "currency": "USD", "discount_amount": "5.00",
+        "discount_code": "SAVE5", "ship_total": "4.99", "created_at": "2026-01-02T03:04:05", "next_line_id": "3",
+    }
+    for line_item_id, (variant_id, quantity) in lines.items():
+        fields[line_item_id] = json.dumps({
+            "product_id": 1, "variant_id": variant_id, "quantity": quantity, "price": "10.00",
+            "name": "Tee", "slug": "tee", "image_url": None,
+        })
+    return fields
+
+
+def _values(variant_id, quantity=1):
+    return {"order_id": 41, "product_id": 2, "variant_id": variant_id, "quantity": quantity,
+            "price": Decimal("7.50"), "name": "Mug", "slug": None, "image_url": None}
+
+
+class _WatchError(Exception):
+    pass
+
+
+@pytest.fixture
+def fake_redis():
+    """The redis module and a client whose pipeline returns the given hash."""
+    pipe = MagicMock()
+    pipe.__enter__.return_value = pipe
+    client = MagicMock()
+    client.pipeline.return_value = pipe
+    fake = SimpleNamespace(WatchError=_WatchError, RedisError=type("RedisError", (Exception,), {}))
+    with patch.object(ephemeral_carts, "redis", fake), patch.object(ephemeral_carts, "_client", client):
+        yield pipe
+
+
+class TestHashLayout:
+    def test_round_trip_computes_totals(self):
+        order = _to_order(TOKEN, _hash(**{"li:1": (10, 2), "li:2": (20, 1)}))
+
+        assert order.id == 41 and order.email is None and order.discount_code == "SAVE5"
+        assert order.created_at == datetime(2026, 1, 2, 3, 4, 5)
+        assert [li.id for li in order.line_items] == [1, 2]
+        assert (order.item_count, order.subtotal, order.total) == (3, 30.0, 29.99)
+
+        fields = _to_fields(order, 3)
+        assert fields == _hash(**{"li:1": (10, 2), "li:2": (20, 1)})
+
+    def test_new_line_items_get_the_next_ids(self):
+        order = _to_order(TOKEN, _hash(**{"li:1": (10, 2)}))
+        add_line(order, _values(30))
+        add_line(order, _values(10, 3))
+
+        fields = _to_fields(order, 3)
+
+        assert json.loads(fields["li:1"])["quantity"] == 5
+        assert json.loads(fields["li:3"])["price"] == "7.50"
+        assert fields["next_line_id"] == "4"
+
+    def test_set_line_quantity(self):
+        order = _to_order(TOKEN, _hash(**{"li:1": (10, 2), "li:2": (20, 1)}))
+
+        assert set_line_quantity(order, 1, 4)
+        assert set_line_quantity(order, 2, 0)
+        assert not set_line_quantity(order, 9, 1)
+        assert [(li.id, li.quantity) for li in order.line_items] == [(1, 4)]
+
+
+class TestMutate:
+    def test_writes_changed_hash_and_refreshes_ttl(self, fake_redis):
+        fake_redis.hgetall.return_value = _hash(**{"li:1": (10, 2), "li:2": (20, 1)})
+
+        order = ephemeral_carts.mutate(TOKEN, lambda o: set_line_quantity(o, 2, 0))
+
+        assert order.item_count == 2
+        fake_redis.watch.assert_called_once_with("cart:" + TOKEN)
+        written = fake_redis.hset.call_args.kwargs["mapping"]
+        assert "li:2" not in written and "li:1" in written
+        fake_redis.hdel.assert_called_once_with("cart:" + TOKEN, "li:2")
+        fake_redis.expire.assert_called_once_with("cart:" + TOKEN, ephemeral_carts.REDIS_TTL_S)
+        fake_redis.execute.assert_called_once()
+
+    def test_concurrent_change_is_retried(self, fake_redis):
+        fake_redis.hgetall.return_value = _hash(**{"li:1": (10, 2)})
+        fake_redis.execute.side_effect = [_WatchError(), None]
+
+        order = ephemeral_carts.mutate(TOKEN, lambda o: add_line(o, _values(10)))
+
+        assert fake_redis.watch.call_count == 2
+        assert order.item_count == 3
+
+    def test_cart_not_in_redis(self, fake_redis):
+        fake_redis.hgetall.return_value = {}
+
+        assert ephemeral_carts.mutate(TOKEN, MagicMock()) is None
+
+    def test_cart_being_checked_out_is_not_written(self, fake_redis):
+        fake_redis.hgetall.return_value = {**_hash(), "persisting": str(time.time())}
+
+        with patch.object(ephemeral_carts, "_in_postgres", return_value=False):
+            with pytest.raises(HTTPException) as exc:
+                ephemeral_carts.mutate(TOKEN, MagicMock())
+
+        assert exc.value.status_code == 409
+        fake_redis.execute.assert_not_called()
+
+    def test_stale_checkout_mark_is_cleared(self, fake_redis):
+        fake_redis.hgetall.side_effect = [
+            {**_hash(**{"li:1": (10, 2)}), "persisting": str(time.time() - 60)},
+            _hash(**{"li:1": (10, 2)}),
+        ]
+
+        with patch.object(ephemeral_carts, "_in_postgres", return_value=False):
+            order = ephemeral_carts.mutate(TOKEN, lambda o: add_line(o, _values(10)))
+
+        ephemeral_carts._client.hdel.assert_called_once_with("cart:" + TOKEN, "persisting")
+        assert order.item_count == 3
+
+    def test_committed_checkout_falls_through_to_postgres(self, fake_redis):
+        marked = {**_hash(), "persisting": str(time.time())}
+        fake_redis.hgetall.return_value = marked
+        ephemeral_carts._client.hgetall.return_value = marked
+
+        with patch.object(ephemeral_carts, "_in_postgres", return_value=True):
+            assert ephemeral_carts.mutate(TOKEN, MagicMock()) is None
+            assert ephemeral_carts.load(TOKEN) is None
+
+        ephemeral_carts._client.delete.assert_called_with("cart:" + TOKEN)
+        fake_redis.execute.assert_not_called()
+
+
+class TestPersist:
+    def test_redis_failure_after_commit_is_not_an_error(self, fake_redis):
+        fake_redis.hgetall.return_value = _hash(**{"li:1": (10, 2)})
+        ephemeral_carts._client.delete.side_effect = ephemeral_carts.redis.RedisError("connection lost")
+        db = MagicMock()
+
+        order = ephemeral_carts.persist(TOKEN, db, lambda o: setattr(o, "state", "address"))
+
+        db.commit.assert_called_once()
+        assert order.state == "address"
+        ephemeral_carts._client.hdel.assert_not_called()
@@ -0,0 +1,108 @@
+"""
+Tests for the shared upstream HTTP client registry (http_clients.py).
+"""
+import httpx
+import pytest
+
+import http_clients
+from circuit_breaker import CircuitBreaker, request_deadline
+from http_clients import _ClientRegistry, _MeteredTransport, _PoolMetrics
+
+
+class TestClientRegistry:
+    @pytest.mark.asyncio
+    async def test_client_is_shared_per_upstream(self):
+        registry = _ClientRegistry()
+
+        catalog = registry.get("catalog")
+        assert registry.get("catalog") is catalog
+        assert registry.get("discounts") is not catalog
+        assert catalog.timeout.read == http_clients.UPSTREAM_TIMEOUTS["catalog"]
+
+        await registry.aclose()
+        assert catalog.is_closed
+        assert registry.get("catalog") is not catalog
+        await registry.aclose()
+
+    @pytest.mark.asyncio
+    async def test_stats_report_each_upstream(self):
+        registry = _ClientRegistry()
+        registry.get("pricing")
+
+        stats = registry.stats()
+
+        assert set(stats) == {"pricing"}
+        assert stats["pricing"]["timeout_s"] == http_clients.UPSTREAM_TIMEOUTS["pricing"]
+        assert stats["pricing"]["requests"] == 0
+        await registry.aclose()
+
+
+class TestMeteredTransport:
+    @pytest.mark.asyncio
+    async def test_requests_counted_and_released(self):
+        metrics = _PoolMetrics()
+        transport = _MeteredTransport(httpx.MockTransport(lambda request: httpx.Response(200)), metrics, CircuitBreaker("catalog"))
+
+        async with httpx.AsyncClient(transport=transport) as client:
+            await client.get("http://catalog/products")
+            await client.get("http://catalog/products")
+
+        snapshot = metrics.snapshot()
+        assert snapshot["requests"] == 2
+        assert snapshot["in_flight"] == 0
+
+    @pytest.mark.asyncio
+    async def test_in_flight_released_when_request_fails(self):
+        def refuse(request):
+            raise httpx.ConnectError("connection refused")
+
+        metrics = _PoolMetrics()
+        transport = _MeteredTransport(httpx.MockTransport(refuse), metrics, CircuitBreaker("pricing"))
+
+        async with httpx.AsyncClient(transport=transport) as client:
+            with pytest.raises(httpx.ConnectError):
+                await client.get("http://pricing/price")
+
+        assert metrics.snapshot()["in_flight"] == 0
+
+    @pytest.mark.asyncio
+    async def test_timeouts_count_against_the_circuit_only_when_upstream_caused(self):
+        def time_out(request):
+            raise httpx.ReadTimeout("read timed out", request=request)
+
+        def pool_full(request):
+            raise httpx.PoolTimeout("no connection available", request=request)
+
+        breaker = CircuitBreaker("pricing", min_requests=1)
+        transport = _MeteredTransport(httpx.MockTransport(time_out), _PoolMetrics(), breaker)
+        pool_transport = _MeteredTransport(httpx.MockTransport(pool_full), _PoolMetrics(), breaker)
+
+        async with httpx.AsyncClient(transport=transport, timeout=10.0) as client, \
+                httpx.AsyncClient(transport=pool_transport, timeout=10.0) as pool_client:
+            with request_deadline(500):
+                with pytest.raises(httpx.ReadTimeout):
+                    await client.get("http://pricing/price")
+            with pytest.raises(httpx.PoolTimeout):
+                await pool_client.get("http://pricing/price")
+            assert breaker.state == "closed"
+            assert breaker.stats()["window_calls"] == 0
+
+            with pytest.raises(httpx.ReadTimeout):
+                await client.get("http://pricing/price")
+
+        assert breaker.state == "open"
+
+    @pytest.mark.asyncio
+    async def test_pool_wait_recorded_from_trace_events(self):
+        metrics = _PoolMetrics()
+        trace = metrics.trace_for_request()
+        metrics.requests = 1
+
+        await trace("connection.connect_tcp.started", {})
+        await trace("connection.connect_tcp.complete", {})
+        await trace("http11.send_request_headers.started", {})
+
+        snapshot = metrics.snapshot()
+        assert snapshot["connections_opened"] == 1
+        assert snapshot["pool_wait_max_ms"] >= 0
+        assert metrics.wait_total_ms == metrics.wait_max_ms
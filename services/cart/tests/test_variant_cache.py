@@ -0,0 +1,147 @@
+"""
+Tests for the cart-side catalog variant cache (variant_cache.py).
+"""
+import asyncio
+from decimal import Decimal
+from unittest.mock import patch
+
+import httpx
+import pytest
+
+from variant_cache import CatalogUnavailable, VariantCache
+
+
+def _product(product_id: int, variant_ids: list[int], price: float = 10.0) -> dict:
+    return {
+        "id": product_id,
+        "slug": f"product-{product_id}",
+        "name": f"Product {product_id}",
+        "images": [{"url": f"/img/{product_id}.jpg"}],
+        "variants": [
+            {"id": vid, "price": price, "options_text": "Size: M" if vid % 2 else None, "image_url": None}
+            for vid in variant_ids
+        ],
+    }
+
+
+class FakeCatalog:
+    """Serves /catalog_version, paged /products and /variants/{id}, counting requests per path."""
+
+    def __init__(self, products: list[dict], per_page_limit: int = 2) -> None:
+        self.products = products
+        self.version = "v1"
+        self.per_page_limit = per_page_limit
+        self.calls: dict[str, int] = {}
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.path
+        key = "/variants" if path.startswith("/variants/") else path
+        self.calls[key] = self.calls.get(key, 0) + 1
+        if path == "/catalog_version":
+            return httpx.Response(200, json={"version": self.version, "variant_count": 0})
+        if path == "/products":
+            page = int(request.url.params["page"])
+            per_page = min(int(request.url.params["per_page"]), self.per_page_limit)
+            chunk = self.products[(page - 1) * per_page:page * per_page]
+            pages = (len(self.products) + per_page - 1) // per_page
+            return httpx.Response(200, json={"products": chunk, "meta": {"count": len(self.products), "pages": pages}})
+        variant_id = int(path.rsplit("/", 1)[1])
+        for p in self.products:
+            for v in p["variants"]:
+                if v["id"] == variant_id:
+                    return httpx.Response(200, json={
+                        "id": variant_id, "product_id": p["id"], "product_name": p["name"],
+                        "product_slug": p["slug"], "sku": f"SKU-{variant_id}", "price": v["price"],
+                        "options_text": v["options_text"], "in_stock": True, "image_url": p["images"][0]["url"],
+                    })
+        return httpx.Response(404, json={"detail": "Variant not found"})
+
+    def client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(transport=httpx.MockTransport(self.handler))
+
+
+class TestVariantCache:
+    @pytest.mark.asyncio
+    async def test_warm_pages_through_whole_catalog(self):
+        catalog = FakeCatalog([_product(i, [i * 10, i * 10 + 1]) for i in range(1, 6)])
+        cache = VariantCache(ttl_s=60)
+
+        with patch("variant_cache.get_client", return_value=catalog.client()):
+            await cache.warm()
+            variant = await cache.get(51)
+
+        assert catalog.calls["/products"] == 3
+        assert cache.stats()["variants"] == 10
+        assert variant.product_id == 5
+        assert variant.name == "Product 5 (Size: M)"
+        assert variant.image_url == "/img/5.jpg"
+        assert "/variants" not in catalog.calls
+        assert cache.hits == 1
+
+    @pytest.mark.asyncio
+    async def test_miss_fetches_single_variant_and_caches_it(self):
+        catalog = FakeCatalog([_product(1, [10])])
+        cache = VariantCache(ttl_s=60)
+
+        with patch("variant_cache.get_client", return_value=catalog.client()):
+            await cache.warm()
+            catalog.products.append(_product(2, [20], price=4.5))
+            first = await cache.get(20)
+            second = await cache.get(20)
+            missing = await cache.get(999)
+
+        assert first == second
+        assert first.price == 4.5
+        assert first.name == "Product 2"
+        assert missing is None
+        assert catalog.calls["/variants"] == 2
+
+    @pytest.mark.asyncio
+    async def test_stale_cache_reloads_only_when_version_changes(self):
+        catalog = FakeCatalog([_product(1, [10], price=10.0)])
+        cache = VariantCache(ttl_s=60)
+
+        with patch("variant_cache.get_client", return_value=catalog.client()):
+            await cache.warm()
+            cache._checked_at -= 120
+            await cache.get(10)
+            await asyncio.sleep(0)
+            assert cache.reloads == 1
+
+            catalog.products[0]["variants"][0]["price"] = 12.0
+            catalog.version = "v2"
+            cache._checked_at -= 120
+            stale = await cache.get(10)
+            await asyncio.sleep(0)
+            fresh = await cache.get(10)
+
+        assert stale.price == 10.0
+        assert fresh.price == 12.0
+        assert cache.reloads == 2
+        assert cache.stats()["catalog_version"] == "v2"
+
+    @pytest.mark.asyncio
+    async def test_catalog_unreachable_on_miss_raises(self):
+        def refuse(request):
+            raise httpx.ConnectError("connection refused")
+
+        cache = VariantCache(ttl_s=0)
+        client = httpx.AsyncClient(transport=httpx.MockTransport(refuse))
+
+        with patch("variant_cache.get_client", return_value=client):
+            with pytest.raises(CatalogUnavailable):
+                await cache.get(10)
+
+    @pytest.mark.asyncio
+    async def test_set_prices_updates_cached_variants_only(self):
+        catalog = FakeCatalog([_product(1, [10, 11])])
+        cache = VariantCache(ttl_s=60)
+
+        with patch("variant_cache.get_client", return_value=catalog.client()):
+            await cache.warm()
+            cache.set_prices({10: Decimal("12.50"), 99: Decimal("1.00")})
+            variant = await cache.get(10)
+
+        assert variant.price == 12.5
+        assert (await cache.get(11)).price == 10.0
+        assert cache.stats()["variants"] == 2
@@ -0,0 +1,270 @@
+"""
+Variant Cache
+
+add_item needs a variant's price, name, options, slug and image. Rather than
+asking the catalog for a page of products on every add-to-cart, the cart
+keeps every catalog variant in a dict keyed by variant_id:
+
+- The cache is warmed at startup by paging through GET /products.
+- Once it is older than CART_VARIANT_CACHE_TTL_S it is still served, and a
+  single background refresh checks GET /catalog_version, reloading every
+  variant only when the version changed.
+- A variant missing from the cache (added to the catalog since the last
+  load) is fetched on its own with GET /variants/{id} and cached.
+
+A TTL of 0 disables the cache: every lookup fetches the single variant.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass, replace
+
+import httpx
+
+from circuit_breaker import clear_deadline
+from http_clients import get_client
+
+CATALOG_URL = os.environ.get("CATALOG_URL", "http://localhost:8000")
+
+# How long the cache is served before a background version check.
+VARIANT_CACHE_TTL_S = float(os.environ.get("CART_VARIANT_CACHE_TTL_S", "60"))
+
+# Largest page the catalog serves from GET /products.
+_PAGE_SIZE = 100
+
+logger = logging.getLogger(__name__)
+
+
+class CatalogUnavailable(RuntimeError):
+    """Raised when the catalog could not be reached for a variant lookup."""
+
+
+@dataclass(frozen=True)
+class CachedVariant:
+    variant_id: int
+    product_id: int
+    product_name: str
+    price: float
+    options_text: str | None
+    slug: str | None
+    image_url: str | None
+
+    @property
+    def name(self) -> str:
+        """Line item name: the product name, with the options text when set."""
+        if self.options_text:
+            return f"{self.product_name} ({self.options_text})"
+        return self.product_name
+
+
+def _variants_from_products(products: list[dict]) -> dict[int, CachedVariant]:
+    variants = {}
+    for p in products:
+        product_image = p["images"][0].get("url") if p.get("images") else None
+        for v in p["variants"]:
+            variants[v["id"]] = CachedVariant(
+                variant_id=v["id"],
+                product_id=p["id"],
+                product_name=p["name"],
+                price=float(v["price"]),
+                options_text=v.get("options_text"),
+                slug=p.get("slug"),
+                image_url=v.get("image_url") or product_image,
+            )
+    return variants
+
+
+def _variant_from_detail(data: dict) -> CachedVariant:
+    return CachedVariant(
+        variant_id=data["id"],
+        product_id=data["product_id"],
+        product_name=data["product_name"],
+        price=float(data["price"]),
+        options_text=data.get("options_text"),
+        slug=data.get("product_slug"),
+        image_url=data.get("image_url"),
+    )
+
+
+async def _get_json(path: str, headers: dict | None = None, params: dict | None = None) -> dict | None:
+    """GET a catalog path; None on 404, CatalogUnavailable on any other failure."""
+    try:
+        resp = await get_client("catalog").get(f"{CATALOG_URL}{path}", params=params, headers=headers)
+    except httpx.RequestError as exc:
+        raise CatalogUnavailable(str(exc)) from exc
+    if resp.status_code == 404:
+        return None
+    if resp.status_code != 200:
+        raise CatalogUnavailable(f"GET {path} returned {resp.status_code}")
+    return resp.json()
+
+
+class VariantCache:
+    """All catalog variants by id, refreshed when the catalog version changes."""
+
+    def __init__(self, ttl_s: float) -> None:
+        self.ttl_s = ttl_s
+        self.reset()
+
+    def reset(self) -> None:
+        self._variants: dict[int, CachedVariant] = {}
+        self._version: str | None = None
+        self._checked_at: float | None = None
+        self._refresh_task: asyncio.Task | None = None
+        self.hits = 0
+        self.misses = 0
+        self.single_fetches = 0
+        self.reloads = 0
+        self.version_checks = 0
+        self.refresh_failures = 0
+        self.last_error: str | None = None
+
+    async def warm(self) -> None:
+        """Load every variant and the catalog version."""
+        if self.ttl_s <= 0:
+            return
+        version = await self._fetch_version()
+        await self._reload(version)
+
+    async def get(self, variant_id: int, headers: dict | None = None) -> CachedVariant | None:
+        """Return a variant, or None if the catalog does not have it.
+
+        Raises:
+            CatalogUnavailable: If the variant is not cached and the catalog could not be reached.
+        """
+        if self.ttl_s <= 0:
+            return await self._fetch_one(variant_id, headers)
+
+        if self._is_stale() and self._refresh_task is None:
+            self._refresh_task = asyncio.create_task(self._refresh())
+
+        variant = self._variants.get(variant_id)
+        if variant is not None:
+            self.hits += 1
+            return variant
+
+        self.misses += 1
+        variant = await self._fetch_one(variant_id, headers)
+        if variant is not None:
+            self._variants[variant_id] = variant
+        return variant
+
+    def set_prices(self, prices: dict) -> None:
+        """Overwrite the price of cached variants (the next reload takes the catalog's again)."""
+        for variant_id, price in prices.items():
+            variant = self._variants.get(variant_id)
+            if variant is not None:
+                self._variants[variant_id] = replace(variant, price=float(price))
+
+    async def close(self) -> None:
+        """Cancel a background refresh still in progress."""
+        task, self._refresh_task = self._refresh_task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    def _is_stale(self) -> bool:
+        return self._checked_at is None or time.monotonic() - self._checked_at >= self.ttl_s
+
+    async def _refresh(self) -> None:
+        # Started from a request, but not bound by that request's deadline.
+        clear_deadline()
+        try:
+            version = await self._fetch_version()
+            # Without a version to compare, reload on every TTL expiry.
+            if version is None or version != self._version:
+                await self._reload(version)
+            else:
+                self._checked_at = time.monotonic()
+            self.last_error = None
+        except Exception as exc:
+            # Keep serving the cached variants; the next stale lookup retries.
+            self.refresh_failures += 1
+            self.last_error = str(exc)
+            logger.warning("Variant cache refresh failed: %s", exc)
+        finally:
+            self._refresh_task = None
+
+    async def _fetch_version(self) -> str | None:
+        self.version_checks += 1
+        data = await _get_json("/catalog_version")
+        return data["version"] if data else None
+
+    async def _reload(self, version: str | None) -> None:
+        variants: dict[int, CachedVariant] = {}
+        page = 1
+        while True:
+            data = await _get_json("/products", params={"per_page": _PAGE_SIZE, "page": page})
+            if data is None:
+                raise CatalogUnavailable("GET /products returned 404")
+            variants.update(_variants_from_products(data["products"]))
+            if page >= data["meta"]["pages"]:
+                break
+            page += 1
+        self._variants = variants
+        self._version = version
+        self._checked_at = time.monotonic()
+        self.reloads += 1
+
+    async def _fetch_one(self, variant_id: int, headers: dict | None) -> CachedVariant | None:
+        self.single_fetches += 1
+        data = await _get_json(f"/variants/{variant_id}", headers=headers)
+        return _variant_from_detail(data) if data else None
+
+    def stats(self) -> dict:
+        return {
+            "ttl_s": self.ttl_s,
+            "variants": len(self._variants),
+            "catalog_version": self._version,
+            "age_s": round(time.monotonic() - self._checked_at, 2) if self._checked_at is not None else None,
+            "refreshing": self._refresh_task is not None,
+            "hits": self.hits,
+            "misses": self.misses,
+            "single_fetches": self.single_fetches,
+            "reloads": self.reloads,
+            "version_checks": self.version_checks,
+            "refresh_failures": self.refresh_failures,
+            "last_error": self.last_error,
+        }
+
+
+_cache = VariantCache(VARIANT_CACHE_TTL_S)
+
+
+async def warm_variant_cache() -> None:
+    """Load the catalog's variants; on failure the cache fills on demand instead."""
+    try:
+        await _cache.warm()
+    except Exception as exc:
+        _cache.last_error = str(exc)
+        logger.warning("Variant cache warm-up failed, fetching variants on demand: %s", exc)
+
+
+async def close_variant_cache() -> None:
+    """Stop any background refresh."""
+    await _cache.close()
+
+
+async def get_variant(variant_id: int, headers: dict | None = None) -> CachedVariant | None:
+    """Return a catalog variant by id, or None if it does not exist.
+
+    Raises:
+        CatalogUnavailable: If the variant is not cached and the catalog could not be reached.
+    """
+    return await _cache.get(variant_id, headers)
+
+
+def update_variant_prices(prices: dict) -> None:
+    """Apply catalog price changes to cached variants; prices maps variant_id to price."""
+    _cache.set_prices(prices)
+
+
+def get_variant_cache_stats() -> dict:
+    """Return cache size, catalog version and hit/refresh counters for observability."""
+    return _cache.stats()
@@ -1,5 +1,6 @@
 import bootstrap  # noqa: F401 — must be first for dd-trace
 
+import hashlib
 import logging
 from contextlib import asynccontextmanager
 
@@ -10,8 +11,9 @@ from sqlalchemy import text
 from sqlalchemy.orm import Session, selectinload
 
 from database import Base, SessionLocal, engine, ensure_schema, get_db
-from models import Page, Product, ProductTaxon, Taxon
+from models import Image, Page, Product, ProductTaxon, Taxon, Variant
 from schemas import (
+    CatalogVersionSchema,
     ImageSchema,
     PageSchema,
     PaginationMeta,
@@ -20,6 +22,7 @@ from schemas import (
     ProductSchema,
     TaxonSchema,
     TaxonTreeSchema,
+    VariantDetailSchema,
     VariantSchema,
 )
 from seed import seed_database
@@ -144,6 +147,54 @@ def get_product(slug: str, db: Session = Depends(get_db)):
     return _product_to_schema(product)
 
 
+@app.get("/variants/{variant_id}", response_model=VariantDetailSchema)
+def get_variant(variant_id: int, db: Session = Depends(get_db)):
+    variant = db.query(Variant).options(
+        selectinload(Variant.product).selectinload(Product.images),
+    ).filter(Variant.id == variant_id).first()
+    if not variant:
+        raise HTTPException(status_code=404, detail="Variant not found")
+    product = variant.product
+    image_url = variant.image_url
+    if not image_url and product.images:
+        image_url = product.images[0].url
+    return VariantDetailSchema(
+        id=variant.id,
+        product_id=product.id,
+        product_name=product.name,
+        product_slug=product.slug,
+        sku=variant.sku,
+        price=float(variant.price),
+        options_text=variant.options_text,
+        in_stock=variant.in_stock,
+        image_url=image_url,
+    )
+
+
+def _catalog_digest(variants, products, images) -> str:
+    """Digest of every column the cart caches per variant, over rows in id order."""
+    digest = hashlib.sha1()
+    for table, rows in (("variants", variants), ("products", products), ("images", images)):
+        digest.update(table.encode())
+        for row in rows:
+            digest.update(repr(tuple(row)).encode())
+    return digest.hexdigest()[:16]
+
+
+@app.get("/catalog_version", response_model=CatalogVersionSchema)
+def catalog_version(db: Session = Depends(get_db)):
+    # The catalog has no update timestamps, so the version is a digest of the
+    # rows themselves: it changes whenever a variant is added, removed,
+    # repriced or renamed, or its product's name, slug or images change.
+    variants = db.query(
+        Variant.id, Variant.product_id, Variant.price, Variant.options_text, Variant.image_url,
+    ).order_by(Variant.id).all()
+    products = db.query(Product.id, Product.name, Product.slug).order_by(Product.id).all()
+    images = db.query(Image.id, Image.product_id, Image.url).order_by(Image.id).all()
+    digest = _catalog_digest(variants, products, images)
+    return CatalogVersionSchema(version=digest, variant_count=len(variants))
+
+
 def _build_taxon_tree(taxon: Taxon) -> TaxonTreeSchema:
     return TaxonTreeSchema(
         id=taxon.id,
@@ -22,6 +22,23 @@ class VariantSchema(BaseModel):
     model_config = {"from_attributes": True}
 
 
+class VariantDetailSchema(BaseModel):
+    id: int
+    product_id: int
+    product_name: str
+    product_slug: str
+    sku: str
+    price: float
+    options_text: str | None = None
+    in_stock: bool
+    image_url: str | None = None
+
+
+class CatalogVersionSchema(BaseModel):
+    version: str
+    variant_count: int
+
+
 class ImageSchema(BaseModel):
     url: str
     alt: str | None = None
@@ -0,0 +1,34 @@
+"""
+Tests for the catalog version digest (main._catalog_digest).
+"""
+from decimal import Decimal
+
+from main import _catalog_digest
+
+VARIANTS = [
+    (1, 10, Decimal("10.00"), "Small", None),
+    (2, 10, Decimal("20.00"), "Large", None),
+]
+PRODUCTS = [(10, "Tee", "tee")]
+IMAGES = [(100, 10, "/img/tee.png")]
+
+
+class TestCatalogDigest:
+    def test_same_rows_same_version(self):
+        assert _catalog_digest(VARIANTS, PRODUCTS, IMAGES) == _catalog_digest(list(VARIANTS), PRODUCTS, IMAGES)
+
+    def test_offsetting_price_changes_change_the_version(self):
+        repriced = [
+            (1, 10, Decimal("12.50"), "Small", None),
+            (2, 10, Decimal("17.50"), "Large", None),
+        ]
+
+        assert _catalog_digest(repriced, PRODUCTS, IMAGES) != _catalog_digest(VARIANTS, PRODUCTS, IMAGES)
+
+    def test_product_and_image_edits_change_the_version(self):
+        before = _catalog_digest(VARIANTS, PRODUCTS, IMAGES)
+
+        assert _catalog_digest(VARIANTS, [(10, "Tee", "tee-2")], IMAGES) != before
+        assert _catalog_digest(VARIANTS, [(10, "T-shirt", "tee")], IMAGES) != before
+        assert _catalog_digest(VARIANTS, PRODUCTS, [(100, 10, "/img/tee-2.png")]) != before
+        assert _catalog_digest([(1, 10, Decimal("10.00"), "Medium", None), VARIANTS[1]], PRODUCTS, IMAGES) != before
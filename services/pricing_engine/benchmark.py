@@ -0,0 +1,226 @@
+"""
+Pricing Engine Benchmark
+
+Measures the pricing hot paths across ruleset sizes:
+
+- evaluate:        rule_engine.evaluate for a single item
+- decision_cache:  store_decision followed by get_stats, as /price does
+- price_asgi:      the full POST /price request through the ASGI app
+- evaluate_conditions: evaluate with request facts after a quarter of the
+  rules are given time, session-segment, quantity and taxon conditions, to
+  compare against the fixed-field evaluate above
+
+Each ruleset size runs in its own subprocess, because PRICING_RULES_COUNT is
+read when rule_engine is imported. PRICING_FETCH_DELAY_MS is forced to 0 so
+the numbers reflect engine work rather than the simulated upstream wait.
+
+Usage:
+    python benchmark.py                              # 1k..1M rules, JSON to stdout
+    python benchmark.py --rules 1000 10000 -o run.json
+    python benchmark.py --compare baseline.json      # exit 1 on regressions
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import dataclasses
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+
+DEFAULT_RULE_COUNTS = [1_000, 10_000, 100_000, 1_000_000]
+
+# Relative change in p95 latency or throughput beyond which --compare flags a regression.
+DEFAULT_THRESHOLD = 0.10
+
+
+def _summarize(latencies_ns: list[int], elapsed_s: float) -> dict:
+    ordered = sorted(latencies_ns)
+
+    def percentile(p: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))] / 1000.0, 2)
+
+    return {
+        "iterations": len(ordered),
+        "p50_us": percentile(0.50),
+        "p95_us": percentile(0.95),
+        "p99_us": percentile(0.99),
+        "throughput_per_s": round(len(ordered) / elapsed_s, 1) if elapsed_s > 0 else None,
+    }
+
+
+def _workload(iterations: int, seed: int = 7) -> list[tuple[int, float, float]]:
+    rng = random.Random(seed)
+    return [(rng.randint(1, 1000), round(rng.uniform(5.0, 150.0), 2), round(rng.uniform(0.0, 250.0), 2))
+            for _ in range(iterations)]
+
+
+def _time_calls(calls, fn) -> dict:
+    latencies: list[int] = []
+    started = time.perf_counter()
+    for args in calls:
+        t0 = time.perf_counter_ns()
+        fn(*args)
+        latencies.append(time.perf_counter_ns() - t0)
+    return _summarize(latencies, time.perf_counter() - started)
+
+
+async def _time_asgi(items: list[tuple[int, float, float]]) -> dict:
+    from httpx import ASGITransport, AsyncClient
+
+    from main import app
+
+    latencies: list[int] = []
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://bench") as client:
+        started = time.perf_counter()
+        for variant_id, base_price, cart_total in items:
+            t0 = time.perf_counter_ns()
+            response = await client.post(
+                "/price", json={"variant_id": variant_id, "base_price": base_price, "cart_total": cart_total}
+            )
+            latencies.append(time.perf_counter_ns() - t0)
+            response.raise_for_status()
+        elapsed = time.perf_counter() - started
+    return _summarize(latencies, elapsed)
+
+
+def _with_conditions(rules: list, share: int = 4) -> list:
+    # Every share-th rule gets one of each condition type; the rest stay plain.
+    now = time.time()
+    return [
+        dataclasses.replace(
+            rule,
+            active_from=now - 3600.0,
+            active_until=now + 3600.0 * (1 + rule.rule_id % 24),
+            session_segments=frozenset(range(rule.rule_id % 8, 64, 8)),
+            min_quantity=1 + rule.rule_id % 3,
+            taxon_ids=frozenset({1 + rule.rule_id % 20}),
+        )
+        if rule.rule_id % share == 0 else rule
+        for rule in rules
+    ]
+
+
+def run_single(iterations: int, asgi_iterations: int) -> dict:
+    """Benchmark the ruleset size configured in this process's environment."""
+    started = time.perf_counter()
+    import rule_engine
+    import decision_cache
+    startup_ms = (time.perf_counter() - started) * 1000.0
+
+    items = _workload(iterations)
+    results = {"evaluate": _time_calls(items, rule_engine.evaluate)}
+
+    decided = [(v, c, rule_engine.evaluate(v, b, c)) for v, b, c in items]
+    decision_cache.reset_cache()
+    results["decision_cache"] = _time_calls(
+        decided, lambda v, c, r: (decision_cache.store_decision(v, c, r), decision_cache.get_stats())
+    )
+    decision_cache.reset_cache()
+
+    results["price_asgi"] = asyncio.run(_time_asgi(items[:asgi_iterations]))
+    decision_cache.reset_cache()
+
+    rule_engine.replace_rules(_with_conditions(rule_engine.get_ruleset().rules))
+    rng = random.Random(11)
+    with_facts = [
+        (v, b, c, rule_engine.RequestFacts(
+            session_id=f"session-{rng.randint(1, 10_000)}",
+            quantity=rng.randint(1, 4),
+            taxon_ids=(rng.randint(1, 20), rng.randint(1, 20)),
+        ))
+        for v, b, c in items
+    ]
+    results["evaluate_conditions"] = _time_calls(with_facts, rule_engine.evaluate)
+
+    return {
+        "rules_count": len(rule_engine.get_ruleset().rules_by_id),
+        "startup_ms": round(startup_ms, 2),
+        # ru_maxrss is reported in KB on Linux.
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "benchmarks": results,
+    }
+
+
+def run_all(rule_counts: list[int], iterations: int, asgi_iterations: int) -> dict:
+    """Run every ruleset size in a fresh subprocess and collect the results."""
+    runs = []
+    for count in rule_counts:
+        env = {**os.environ, "PRICING_RULES_COUNT": str(count), "PRICING_FETCH_DELAY_MS": "0"}
+        proc = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--single",
+             "--iterations", str(iterations), "--asgi-iterations", str(asgi_iterations)],
+            env=env,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        runs.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "iterations": iterations,
+        "asgi_iterations": asgi_iterations,
+        "runs": runs,
+    }
+
+
+def compare(current: dict, baseline: dict, threshold: float = DEFAULT_THRESHOLD) -> list[dict]:
+    """Return one entry per benchmark whose p95 or throughput regressed beyond threshold."""
+    baseline_runs = {run["rules_count"]: run for run in baseline.get("runs", [])}
+    regressions = []
+    for run in current.get("runs", []):
+        base_run = baseline_runs.get(run["rules_count"])
+        if base_run is None:
+            continue
+        for name, stats in run["benchmarks"].items():
+            base = base_run["benchmarks"].get(name)
+            if base is None:
+                continue
+            if base["p95_us"] and stats["p95_us"] > base["p95_us"] * (1 + threshold):
+                regressions.append({"rules_count": run["rules_count"], "benchmark": name, "metric": "p95_us",
+                                    "baseline": base["p95_us"], "current": stats["p95_us"]})
+            if base["throughput_per_s"] and stats["throughput_per_s"] < base["throughput_per_s"] * (1 - threshold):
+                regressions.append({"rules_count": run["rules_count"], "benchmark": name, "metric": "throughput_per_s",
+                                    "baseline": base["throughput_per_s"], "current": stats["throughput_per_s"]})
+    return regressions
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the pricing engine across ruleset sizes.")
+    parser.add_argument("--rules", type=int, nargs="+", default=DEFAULT_RULE_COUNTS, help="ruleset sizes to run")
+    parser.add_argument("--iterations", type=int, default=2000, help="calls per in-process benchmark")
+    parser.add_argument("--asgi-iterations", type=int, default=500, help="requests for the /price ASGI benchmark")
+    parser.add_argument("-o", "--output", help="write the JSON report to this file")
+    parser.add_argument("--compare", metavar="BASELINE", help="flag regressions against a stored JSON report")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="allowed relative change")
+    parser.add_argument("--single", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.single:
+        print(json.dumps(run_single(args.iterations, args.asgi_iterations)))
+        return 0
+
+    report = run_all(args.rules, args.iterations, args.asgi_iterations)
+    exit_code = 0
+    if args.compare:
+        with open(args.compare) as f:
+            report["regressions"] = compare(report, json.load(f), args.threshold)
+        exit_code = 1 if report["regressions"] else 0
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    print(output)
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,60 +2,198 @@
 Pricing Decision Cache
 
 Stores pricing decisions for audit and analytics purposes.
-Each decision record includes full rule evaluation context.
+Each decision record keeps the ids of the matched rules and the ruleset
+version, from which the full rule snapshot can be rebuilt on demand.
+
+Decisions are kept in a fixed-capacity ring buffer: scalar fields live in
+preallocated array-backed columns, the oldest decisions are evicted once the
+buffer is full or older than the configured maximum age, and statistics are
+maintained as running counters so reading them is O(1).
+
+Every decision is folded into the streaming aggregates in pricing_analytics;
+with PRICING_DECISION_SAMPLE_EVERY above 1 only one in N full decisions is
+kept here, which bounds memory without losing analytics. When
+PRICING_DECISION_LOG_DIR is set, every decision is also queued for the
+on-disk decision_log.
 """
 from __future__ import annotations
 
+import os
 import threading
+import time
+from array import array
 from datetime import datetime, timezone
 
+from decision_log import log_decision
+from pricing_analytics import record_decision
 from rule_engine import PricingResult
 
-_decisions: list[dict] = []
+CACHE_CAPACITY = int(os.getenv("PRICING_DECISION_CACHE_SIZE", "10000"))
+
+# Decisions older than this many seconds are evicted; 0 disables age eviction.
+CACHE_MAX_AGE_S = float(os.getenv("PRICING_DECISION_MAX_AGE_S", "0"))
+
+# Keep one in every N full decisions; 1 keeps them all.
+SAMPLE_EVERY = max(1, int(os.getenv("PRICING_DECISION_SAMPLE_EVERY", "1")))
+
+# Approximate bytes for one scalar row (9 columns of 8 bytes), used together
+# with the size of each matched-id array to keep a running memory estimate.
+_ROW_BYTES = 9 * 8
+
+
+class _DecisionRing:
+    """Fixed-capacity, column-oriented ring buffer of pricing decisions."""
+
+    def __init__(self, capacity: int, max_age_s: float) -> None:
+        self.capacity = max(1, capacity)
+        self.max_age_s = max_age_s
+        self.timestamp = array("d", [0.0]) * self.capacity
+        self.variant_id = array("q", [0]) * self.capacity
+        self.cart_total = array("d", [0.0]) * self.capacity
+        self.base_price = array("d", [0.0]) * self.capacity
+        self.final_price = array("d", [0.0]) * self.capacity
+        self.discount_pct = array("d", [0.0]) * self.capacity
+        self.rule_matched = array("q", [0]) * self.capacity  # -1 when no rule matched
+        self.rules_evaluated = array("q", [0]) * self.capacity
+        self.ruleset_version = array("q", [0]) * self.capacity
+        self.matched_rule_ids: list[array | None] = [None] * self.capacity
+        self.clear()
+
+    def clear(self) -> None:
+        self.head = 0  # slot of the oldest decision
+        self.size = 0
+        self.total_decisions = 0
+        self.evicted = 0
+        self.memory_bytes = 0
+        for slot in range(self.capacity):
+            self.matched_rule_ids[slot] = None
+
+    def append(self, variant_id: int, cart_total: float, result: PricingResult, now: float) -> int:
+        self.evict_expired(now)
+        if self.size == self.capacity:
+            self._evict_oldest()
+
+        slot = (self.head + self.size) % self.capacity
+        self.timestamp[slot] = now
+        self.variant_id[slot] = variant_id
+        self.cart_total[slot] = cart_total
+        self.base_price[slot] = result.base_price
+        self.final_price[slot] = result.final_price
+        self.discount_pct[slot] = result.discount_pct
+        self.rule_matched[slot] = result.rule_matched if result.rule_matched is not None else -1
+        self.rules_evaluated[slot] = result.rules_evaluated
+        self.ruleset_version[slot] = result.ruleset_version
+        self.matched_rule_ids[slot] = result.matched_rule_ids
+
+        self.size += 1
+        self.total_decisions += 1
+        self.memory_bytes += _ROW_BYTES + _ids_bytes(result.matched_rule_ids)
+        return self.total_decisions
+
+    def get(self, decision_id: int) -> dict | None:
+        first = self.total_decisions - self.size + 1
+        if not first <= decision_id <= self.total_decisions:
+            return None
+        slot = (self.head + decision_id - first) % self.capacity
+        rule_matched = self.rule_matched[slot]
+        return {
+            "decision_id": decision_id,
+            "timestamp": datetime.fromtimestamp(self.timestamp[slot], timezone.utc).isoformat(),
+            "variant_id": self.variant_id[slot],
+            "cart_total": self.cart_total[slot],
+            "base_price": self.base_price[slot],
+            "final_price": self.final_price[slot],
+            "discount_pct": self.discount_pct[slot],
+            "rule_matched": rule_matched if rule_matched >= 0 else None,
+            "rules_evaluated": self.rules_evaluated[slot],
+            "ruleset_version": self.ruleset_version[slot],
+            "matched_rule_ids": self.matched_rule_ids[slot].tolist(),
+        }
+
+    def evict_expired(self, now: float) -> None:
+        if self.max_age_s <= 0:
+            return
+        cutoff = now - self.max_age_s
+        while self.size and self.timestamp[self.head] < cutoff:
+            self._evict_oldest()
+
+    def _evict_oldest(self) -> None:
+        slot = self.head
+        self.memory_bytes -= _ROW_BYTES + _ids_bytes(self.matched_rule_ids[slot])
+        self.matched_rule_ids[slot] = None
+        self.head = (slot + 1) % self.capacity
+        self.size -= 1
+        self.evicted += 1
+
+
+def _ids_bytes(ids: array | None) -> int:
+    return len(ids) * ids.itemsize if ids is not None else 0
+
+
+_ring = _DecisionRing(CACHE_CAPACITY, CACHE_MAX_AGE_S)
 _lock = threading.Lock()
+_seen = 0
+
 
+def store_decision(variant_id: int, cart_total: float, result: PricingResult) -> int | None:
+    """Record a pricing decision in the analytics and, if sampled, the audit cache.
 
-def store_decision(variant_id: int, cart_total: float, result: PricingResult) -> None:
-    """Append a pricing decision to the audit cache.
+    The full decision is appended to the audit cache for one in every
+    SAMPLE_EVERY decisions, evicting the oldest if full.
 
     Args:
         variant_id: The product variant that was priced.
         cart_total: The cart subtotal at the time of evaluation.
-        result: The full PricingResult including rule evaluation context.
+        result: The PricingResult including matched rule ids and ruleset version.
+
+    Returns:
+        The decision id, a sequence number starting at 1, or None if the
+        decision was not sampled.
     """
-    record = {
-        "timestamp": datetime.now(timezone.utc).isoformat(),
-        "variant_id": variant_id,
-        "cart_total": cart_total,
-        "base_price": result.base_price,
-        "final_price": result.final_price,
-        "discount_pct": result.discount_pct,
-        "rule_matched": result.rule_matched,
-        "rules_evaluated": result.rules_evaluated,
-        "rule_snapshot": result.rule_snapshot,
-    }
+    global _seen
+    record_decision(variant_id, result)
+    now = time.time()
+    log_decision(variant_id, cart_total, result, now)
+    with _lock:
+        _seen += 1
+        if (_seen - 1) % SAMPLE_EVERY:
+            return None
+        return _ring.append(variant_id, cart_total, result, now)
+
+
+def get_decision(decision_id: int) -> dict | None:
+    """Return a stored decision by id, or None if it was never stored or has been evicted."""
+    now = time.time()
     with _lock:
-        _decisions.append(record)
+        _ring.evict_expired(now)
+        return _ring.get(decision_id)
 
 
 def get_stats() -> dict:
     """Return cache statistics for observability.
 
     Returns:
-        A dict with cache_size, total_decisions, and estimated_memory_kb.
+        A dict with cache_size, capacity, total_decisions, evicted,
+        decisions_seen, sample_every and estimated_memory_kb.
     """
+    now = time.time()
     with _lock:
-        size = len(_decisions)
-        estimated_kb = sum(len(str(d)) for d in _decisions) / 1024
-
-    return {
-        "cache_size": size,
-        "total_decisions": size,
-        "estimated_memory_kb": round(estimated_kb, 2),
-    }
+        _ring.evict_expired(now)
+        stats = {
+            "cache_size": _ring.size,
+            "capacity": _ring.capacity,
+            "total_decisions": _ring.total_decisions,
+            "evicted": _ring.evicted,
+            "decisions_seen": _seen,
+            "sample_every": SAMPLE_EVERY,
+            "estimated_memory_kb": round(_ring.memory_bytes / 1024, 2),
+        }
+    return stats
 
 
 def reset_cache() -> None:
     """Clear all stored decisions. Intended for use in tests only."""
+    global _seen
     with _lock:
-        _decisions.clear()
+        _ring.clear()
+        _seen = 0
@@ -0,0 +1,283 @@
+"""
+Pricing Decision Log
+
+Persists every pricing decision to an append-only log on disk, so the audit
+trail survives restarts. /price only puts the decision on a bounded queue; a
+background writer thread packs queued decisions into binary records and
+appends them to the current segment file, rotating to a new segment once it
+reaches PRICING_DECISION_LOG_SEGMENT_MB and deleting the oldest segments
+beyond PRICING_DECISION_LOG_SEGMENTS.
+
+Segment layout: an 8-byte magic followed by records of
+
+    timestamp, variant_id, cart_total, base_price, final_price, discount_pct,
+    rule_matched (-1 = none), rules_evaluated, ruleset_version, id_count
+
+and id_count matched rule ids. Queries mmap each segment and decode records
+in place, so filtering never loads whole segments into memory.
+"""
+from __future__ import annotations
+
+import mmap
+import os
+import queue
+import struct
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Iterator
+
+from rule_engine import PricingResult
+
+# Directory for log segments; unset disables the decision log.
+LOG_DIR = os.getenv("PRICING_DECISION_LOG_DIR", "")
+
+# Size at which the current segment is closed and a new one started.
+SEGMENT_BYTES = int(float(os.getenv("PRICING_DECISION_LOG_SEGMENT_MB", "64")) * 1024 * 1024)
+
+# Number of segments kept on disk; the oldest are deleted beyond this.
+MAX_SEGMENTS = int(os.getenv("PRICING_DECISION_LOG_SEGMENTS", "8"))
+
+# Decisions waiting for the writer; further decisions are dropped (and counted) when full.
+QUEUE_SIZE = int(os.getenv("PRICING_DECISION_LOG_QUEUE", "100000"))
+
+_MAGIC = b"PRDLOG01"
+_RECORD = struct.Struct("<dqddddqqqI")
+_ID = struct.Struct("<q")
+_WRITE_BATCH = 1024
+
+
+def _segment_name(seq: int) -> str:
+    return f"decisions-{seq:08d}.log"
+
+
+class DecisionLog:
+    """Rotating, append-only segment files fed by a background writer thread."""
+
+    def __init__(self, directory: str, segment_bytes: int = SEGMENT_BYTES, max_segments: int = MAX_SEGMENTS,
+                 queue_size: int = QUEUE_SIZE) -> None:
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_segments = max(1, max_segments)
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._writer: threading.Thread | None = None
+        self._file = None
+        self._seq = 0
+        self.written = 0
+        self.dropped = 0
+        self.rotations = 0
+        self.last_error: str | None = None
+
+    def start(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        existing = self.segments()
+        self._seq = existing[-1][0] + 1 if existing else 1
+        self._open_segment()
+        self._writer = threading.Thread(target=self._run, name="pricing-decision-log", daemon=True)
+        self._writer.start()
+
+    def append(self, variant_id: int, cart_total: float, result: PricingResult, now: float) -> None:
+        try:
+            self._queue.put_nowait((now, variant_id, cart_total, result))
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self) -> None:
+        """Block until every queued decision has been written."""
+        self._queue.join()
+
+    def stop(self) -> None:
+        if self._writer is None:
+            return
+        self._queue.put(None)
+        self._writer.join()
+        self._writer = None
+        self._file.close()
+        self._file = None
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < _WRITE_BATCH:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stopping = batch[-1] is None
+            try:
+                self._write([item for item in batch if item is not None])
+            except OSError as exc:
+                self.last_error = str(exc)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            if stopping:
+                return
+
+    def _write(self, batch: list) -> None:
+        if not batch:
+            return
+        chunks = []
+        for now, variant_id, cart_total, result in batch:
+            ids = result.matched_rule_ids
+            chunks.append(_RECORD.pack(
+                now, variant_id, cart_total, result.base_price, result.final_price, result.discount_pct,
+                result.rule_matched if result.rule_matched is not None else -1,
+                result.rules_evaluated, result.ruleset_version, len(ids),
+            ))
+            chunks.append(ids.tobytes())
+        self._file.write(b"".join(chunks))
+        self._file.flush()
+        self.written += len(batch)
+        if self._file.tell() >= self.segment_bytes:
+            self._rotate()
+
+    def _open_segment(self) -> None:
+        self._file = open(os.path.join(self.directory, _segment_name(self._seq)), "ab")
+        if self._file.tell() == 0:
+            self._file.write(_MAGIC)
+            self._file.flush()
+
+    def _rotate(self) -> None:
+        self._file.close()
+        self._seq += 1
+        self._open_segment()
+        self.rotations += 1
+        for _, path in self.segments()[:-self.max_segments]:
+            os.remove(path)
+
+    def segments(self) -> list[tuple[int, str]]:
+        """Return (sequence, path) for every segment on disk, oldest first."""
+        found = []
+        for name in os.listdir(self.directory):
+            if name.startswith("decisions-") and name.endswith(".log"):
+                found.append((int(name[len("decisions-"):-len(".log")]), os.path.join(self.directory, name)))
+        return sorted(found)
+
+    def query(self, variant_id: int | None = None, rule_id: int | None = None, since: float | None = None,
+              until: float | None = None) -> Iterator[dict]:
+        """Yield logged decisions oldest first, filtered by variant, matched rule and time range.
+
+        since and until are Unix timestamps; rule_id matches any of a decision's matched rule ids.
+        """
+        paths = [path for _, path in self.segments()]
+        for i, path in enumerate(paths):
+            if since is not None and i + 1 < len(paths):
+                next_start = _first_timestamp(paths[i + 1])
+                if next_start is not None and next_start < since:
+                    continue
+            for record in _scan(path, variant_id, rule_id, since):
+                if until is not None and record["timestamp_unix"] > until:
+                    return
+                yield record
+
+    def stats(self) -> dict:
+        segments = self.segments()
+        return {
+            "enabled": True,
+            "directory": self.directory,
+            "segments": len(segments),
+            "disk_kb": round(sum(os.path.getsize(path) for _, path in segments) / 1024, 2),
+            "queued": self._queue.qsize(),
+            "written": self.written,
+            "dropped": self.dropped,
+            "rotations": self.rotations,
+            "last_error": self.last_error,
+        }
+
+
+def _map(path: str) -> mmap.mmap | None:
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size <= len(_MAGIC):
+            return None
+        mapped = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+    if mapped[:len(_MAGIC)] != _MAGIC:
+        mapped.close()
+        return None
+    return mapped
+
+
+def _first_timestamp(path: str) -> float | None:
+    mapped = _map(path)
+    if mapped is None:
+        return None
+    with mapped:
+        if len(mapped) < len(_MAGIC) + _RECORD.size:
+            return None
+        return _RECORD.unpack_from(mapped, len(_MAGIC))[0]
+
+
+def _scan(path: str, variant_id: int | None, rule_id: int | None, since: float | None) -> Iterator[dict]:
+    mapped = _map(path)
+    if mapped is None:
+        return
+    with mapped:
+        end = len(mapped)
+        offset = len(_MAGIC)
+        # The writer may be mid-append, so a truncated record at the end is ignored.
+        while offset + _RECORD.size <= end:
+            fields = _RECORD.unpack_from(mapped, offset)
+            ids_start = offset + _RECORD.size
+            offset = ids_start + fields[9] * _ID.size
+            if offset > end:
+                return
+            if variant_id is not None and fields[1] != variant_id:
+                continue
+            if since is not None and fields[0] < since:
+                continue
+            ids = struct.unpack_from(f"<{fields[9]}q", mapped, ids_start)
+            if rule_id is not None and rule_id not in ids:
+                continue
+            yield {
+                "timestamp": datetime.fromtimestamp(fields[0], timezone.utc).isoformat(),
+                "timestamp_unix": fields[0],
+                "variant_id": fields[1],
+                "cart_total": fields[2],
+                "base_price": fields[3],
+                "final_price": fields[4],
+                "discount_pct": fields[5],
+                "rule_matched": fields[6] if fields[6] >= 0 else None,
+                "rules_evaluated": fields[7],
+                "ruleset_version": fields[8],
+                "matched_rule_ids": list(ids),
+            }
+
+
+_log: DecisionLog | None = None
+
+
+def start_decision_log(directory: str = LOG_DIR) -> None:
+    """Open the log in directory and start its writer; does nothing when directory is empty."""
+    global _log
+    if not directory or _log is not None:
+        return
+    log = DecisionLog(directory)
+    log.start()
+    _log = log
+
+
+def stop_decision_log() -> None:
+    """Write out queued decisions and stop the writer."""
+    global _log
+    if _log is not None:
+        _log.stop()
+        _log = None
+
+
+def log_decision(variant_id: int, cart_total: float, result: PricingResult, now: float | None = None) -> None:
+    """Queue a decision for the on-disk log. Never blocks; a no-op when the log is disabled."""
+    if _log is not None:
+        _log.append(variant_id, cart_total, result, time.time() if now is None else now)
+
+
+def get_decision_log() -> DecisionLog | None:
+    """Return the running decision log, or None when it is disabled."""
+    return _log
+
+
+def get_log_stats() -> dict:
+    """Return segment, queue and write counters for observability."""
+    if _log is None:
+        return {"enabled": False}
+    return _log.stats()
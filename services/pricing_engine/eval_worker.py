@@ -0,0 +1,21 @@
+"""
+Rule-Evaluation Pool Workers
+
+Entry point of the worker processes started by rule_engine.start_eval_pool.
+A worker gets its ruleset from the pool's initializer arguments, so it marks
+itself as a worker before rule_engine is first imported and the import-time
+ruleset build is skipped. For that to hold, this module does not import
+rule_engine at the top level, and the initializer arguments are plain data
+(a packed ruleset path or rule dicts) whose unpickling imports nothing.
+"""
+import os
+
+# Set in a worker's own environment by init_worker; rule_engine checks it at import.
+WORKER_ENV = "PRICING_EVAL_WORKER"
+
+
+def init_worker(path: str | None, rules: list[dict] | None, version: int) -> None:
+    os.environ[WORKER_ENV] = "1"
+    import rule_engine
+
+    rule_engine.install_worker_ruleset(path, rules, version)
@@ -2,28 +2,68 @@ from __future__ import annotations
 
 import bootstrap  # noqa: F401 — must be first for dd-trace
 
+import itertools
+import json
 import os
+from contextlib import asynccontextmanager
 from typing import Optional
 
 from ddtrace import tracer
 from ddtrace.propagation.http import HTTPPropagator
-from fastapi import FastAPI, Request
-from pydantic import BaseModel
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, Field, field_validator
 
-from decision_cache import get_stats, store_decision
-from rule_engine import evaluate
+from decision_cache import get_decision, get_stats, store_decision
+from decision_log import get_decision_log, get_log_stats, start_decision_log, stop_decision_log
+from pricing_analytics import get_analytics
+from pricing_context import get_context_stats, start_background_refresh, stop_background_refresh
+from rule_engine import (
+    PricingRule,
+    RequestFacts,
+    RulesetReadOnly,
+    add_rule,
+    delete_rule,
+    evaluate_async,
+    evaluate_batch,
+    get_rule_snapshot,
+    get_ruleset,
+    get_ruleset_stats,
+    replace_rules,
+    shutdown_eval_pool,
+    start_eval_pool,
+    update_rule,
+)
 from rules_middleware import register_middleware
 
-app = FastAPI(title="Store Pricing Engine")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    start_background_refresh()
+    start_eval_pool()
+    start_decision_log()
+    yield
+    stop_decision_log()
+    shutdown_eval_pool()
+    stop_background_refresh()
+
+
+app = FastAPI(title="Store Pricing Engine", lifespan=lifespan)
 
 register_middleware(app)
 
 
 class PriceRequest(BaseModel):
-    variant_id: int
+    # Rules index variant ids below 2**31 (rule_engine._RuleIndex._SIZE)
+    variant_id: int = Field(ge=0, lt=2**31)
     base_price: float
     cart_total: float
     session_id: Optional[str] = None
+    quantity: int = Field(default=1, ge=1)
+    taxon_ids: list[int] = []
+
+    def facts(self) -> RequestFacts:
+        return RequestFacts(session_id=self.session_id, quantity=self.quantity, taxon_ids=tuple(self.taxon_ids))
 
 
 class PriceResponse(BaseModel):
@@ -33,6 +73,57 @@ class PriceResponse(BaseModel):
     discount_pct: float
     rule_matched: Optional[int]
     rules_evaluated: int
+    ruleset_version: int
+    decision_id: Optional[int] = None
+
+
+class BatchPriceRequest(BaseModel):
+    items: list[PriceRequest] = Field(min_length=1, max_length=1000)
+
+
+class BatchPriceResponse(BaseModel):
+    items: list[PriceResponse]
+
+
+class PricingRuleModel(BaseModel):
+    # Rule ids are stored in int64 columns
+    rule_id: int = Field(ge=0, lt=2**63)
+    variant_range: tuple[int, int]
+    cart_min: float
+    discount_pct: float = Field(ge=0.0, le=1.0)
+    # Priorities are stored in int64 columns; the lowest value is reserved for "no match"
+    priority: int = Field(gt=-2**63, lt=2**63)
+    active_from: Optional[float] = None
+    active_until: Optional[float] = None
+    session_segments: Optional[list[int]] = None
+    min_quantity: int = Field(default=1, ge=1)
+    taxon_ids: Optional[list[int]] = None
+
+    @field_validator("variant_range")
+    @classmethod
+    def _check_variant_range(cls, value: tuple[int, int]) -> tuple[int, int]:
+        low, high = value
+        if not 0 <= low <= high < 2**31:
+            raise ValueError("variant_range must satisfy 0 <= low <= high < 2**31")
+        return value
+
+    def to_rule(self) -> PricingRule:
+        return PricingRule(
+            rule_id=self.rule_id,
+            variant_range=self.variant_range,
+            cart_min=self.cart_min,
+            discount_pct=self.discount_pct,
+            priority=self.priority,
+            active_from=self.active_from,
+            active_until=self.active_until,
+            session_segments=frozenset(self.session_segments) if self.session_segments is not None else None,
+            min_quantity=self.min_quantity,
+            taxon_ids=frozenset(self.taxon_ids) if self.taxon_ids is not None else None,
+        )
+
+
+class RulesetVersionResponse(BaseModel):
+    ruleset_version: int
 
 
 # --- Health ---
@@ -47,29 +138,31 @@ def health():
 
 
 @app.post("/price", response_model=PriceResponse)
-def price(body: PriceRequest, request: Request):
+async def price(body: PriceRequest, request: Request):
     ctx = HTTPPropagator.extract(dict(request.headers))
     if ctx.trace_id:
         with tracer.start_span("pricing_engine.evaluate_rules", child_of=ctx) as span:
-            result = evaluate(body.variant_id, body.base_price, body.cart_total)
-            store_decision(body.variant_id, body.cart_total, result)
+            result = await evaluate_async(body.variant_id, body.base_price, body.cart_total, body.facts())
+            decision_id = store_decision(body.variant_id, body.cart_total, result)
             cache_stats = get_stats()
             span.set_tag("pricing.variant_id", body.variant_id)
             span.set_tag("pricing.rules_evaluated", result.rules_evaluated)
             span.set_tag("pricing.base_price", result.base_price)
             span.set_tag("pricing.final_price", result.final_price)
             span.set_tag("pricing.rule_matched", result.rule_matched if result.rule_matched is not None else -1)
+            span.set_tag("pricing.ruleset_version", result.ruleset_version)
             span.set_tag("pricing.cache_size", cache_stats["cache_size"])
     else:
         with tracer.start_span("pricing_engine.evaluate_rules") as span:
-            result = evaluate(body.variant_id, body.base_price, body.cart_total)
-            store_decision(body.variant_id, body.cart_total, result)
+            result = await evaluate_async(body.variant_id, body.base_price, body.cart_total, body.facts())
+            decision_id = store_decision(body.variant_id, body.cart_total, result)
             cache_stats = get_stats()
             span.set_tag("pricing.variant_id", body.variant_id)
             span.set_tag("pricing.rules_evaluated", result.rules_evaluated)
             span.set_tag("pricing.base_price", result.base_price)
             span.set_tag("pricing.final_price", result.final_price)
             span.set_tag("pricing.rule_matched", result.rule_matched if result.rule_matched is not None else -1)
+            span.set_tag("pricing.ruleset_version", result.ruleset_version)
             span.set_tag("pricing.cache_size", cache_stats["cache_size"])
 
     return PriceResponse(
@@ -79,12 +172,147 @@ def price(body: PriceRequest, request: Request):
         discount_pct=result.discount_pct,
         rule_matched=result.rule_matched,
         rules_evaluated=result.rules_evaluated,
+        ruleset_version=result.ruleset_version,
+        decision_id=decision_id,
     )
 
 
+@app.post("/price/batch", response_model=BatchPriceResponse)
+def price_batch(body: BatchPriceRequest, request: Request):
+    ctx = HTTPPropagator.extract(dict(request.headers))
+    with tracer.start_span("pricing_engine.evaluate_batch", child_of=ctx if ctx.trace_id else None) as span:
+        results = evaluate_batch(
+            [(item.variant_id, item.base_price, item.cart_total) for item in body.items],
+            [item.facts() for item in body.items],
+        )
+        decision_ids = [
+            store_decision(item.variant_id, item.cart_total, result)
+            for item, result in zip(body.items, results)
+        ]
+        cache_stats = get_stats()
+        span.set_tag("pricing.batch_size", len(results))
+        span.set_tag("pricing.rules_evaluated", sum(r.rules_evaluated for r in results))
+        span.set_tag("pricing.cache_size", cache_stats["cache_size"])
+
+    return BatchPriceResponse(
+        items=[
+            PriceResponse(
+                variant_id=result.variant_id,
+                base_price=result.base_price,
+                final_price=result.final_price,
+                discount_pct=result.discount_pct,
+                rule_matched=result.rule_matched,
+                rules_evaluated=result.rules_evaluated,
+                ruleset_version=result.ruleset_version,
+                decision_id=decision_id,
+            )
+            for result, decision_id in zip(results, decision_ids)
+        ]
+    )
+
+
+# --- Rules admin ---
+
+
+@app.exception_handler(RulesetReadOnly)
+async def ruleset_read_only(request: Request, exc: RulesetReadOnly):
+    return JSONResponse(status_code=409, content={"detail": str(exc)})
+
+
+@app.post("/admin/rules", response_model=RulesetVersionResponse, status_code=201)
+def create_rule(body: PricingRuleModel):
+    if body.rule_id in get_ruleset().rules_by_id:
+        raise HTTPException(status_code=409, detail=f"Rule {body.rule_id} already exists")
+    try:
+        version = add_rule(body.to_rule())
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc))
+    return RulesetVersionResponse(ruleset_version=version)
+
+
+@app.put("/admin/rules/{rule_id}", response_model=RulesetVersionResponse)
+def replace_rule(rule_id: int, body: PricingRuleModel):
+    if body.rule_id != rule_id:
+        raise HTTPException(status_code=422, detail="rule_id in body does not match URL")
+    try:
+        version = update_rule(body.to_rule())
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Rule not found")
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc))
+    return RulesetVersionResponse(ruleset_version=version)
+
+
+@app.delete("/admin/rules/{rule_id}", response_model=RulesetVersionResponse)
+def remove_rule(rule_id: int):
+    try:
+        version = delete_rule(rule_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Rule not found")
+    return RulesetVersionResponse(ruleset_version=version)
+
+
+@app.put("/admin/rules", response_model=RulesetVersionResponse)
+def load_ruleset(body: list[PricingRuleModel]):
+    """Replace the whole ruleset with the contents of a ruleset file (a JSON array of rules)."""
+    try:
+        version = replace_rules([rule.to_rule() for rule in body])
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc))
+    return RulesetVersionResponse(ruleset_version=version)
+
+
 # --- Observability ---
 
 
 @app.get("/pricing/cache-stats")
 def cache_stats():
     return get_stats()
+
+
+@app.get("/pricing/analytics")
+def analytics(top: int = Query(10, ge=1, le=1000)):
+    return get_analytics(top)
+
+
+@app.get("/pricing/ruleset-stats")
+def ruleset_stats():
+    return get_ruleset_stats()
+
+
+@app.get("/pricing/decisions")
+def logged_decisions(
+    variant_id: Optional[int] = None,
+    rule_id: Optional[int] = None,
+    since: Optional[float] = None,
+    until: Optional[float] = None,
+    limit: int = Query(1000, ge=1, le=100000),
+):
+    """Stream decisions from the on-disk log as NDJSON; since and until are Unix timestamps."""
+    log = get_decision_log()
+    if log is None:
+        raise HTTPException(status_code=404, detail="Decision log is not enabled")
+    records = itertools.islice(log.query(variant_id=variant_id, rule_id=rule_id, since=since, until=until), limit)
+    return StreamingResponse((json.dumps(record) + "\n" for record in records), media_type="application/x-ndjson")
+
+
+@app.get("/pricing/decision-log-stats")
+def decision_log_stats():
+    return get_log_stats()
+
+
+@app.get("/pricing/decisions/{decision_id}/explain")
+def explain_decision(decision_id: int):
+    decision = get_decision(decision_id)
+    if decision is None:
+        raise HTTPException(status_code=404, detail="Decision not found or already evicted")
+    try:
+        decision["rule_snapshot"] = get_rule_snapshot(decision["matched_rule_ids"], decision["ruleset_version"])
+    except KeyError:
+        raise HTTPException(status_code=410, detail="Ruleset version for this decision is no longer available")
+    return decision
+
+
+@app.get("/pricing/context-stats")
+def context_stats():
+    return get_context_stats()
@@ -0,0 +1,106 @@
+"""
+Pricing Analytics
+
+Streaming aggregates over every pricing decision. Each decision updates a
+handful of counters in O(1), so analytics stay complete even when the audit
+cache only keeps a sample of full decisions:
+
+- hits per winning rule
+- a histogram of discount_pct in 5% buckets
+- requests per variant
+- final-vs-base price deltas (total, mean, largest)
+"""
+from __future__ import annotations
+
+import heapq
+import threading
+from array import array
+
+from rule_engine import PricingResult
+
+# discount_pct is in [0, 1]; 20 buckets of 5%, with 100% folded into the last one.
+_HISTOGRAM_BUCKETS = 20
+
+
+class _Aggregates:
+    """Running counters updated once per decision."""
+
+    def __init__(self) -> None:
+        self.clear()
+
+    def clear(self) -> None:
+        self.decisions = 0
+        self.matched = 0
+        self.rule_hits: dict[int, int] = {}
+        self.variant_requests: dict[int, int] = {}
+        self.discount_histogram = array("q", [0]) * _HISTOGRAM_BUCKETS
+        self.base_total = 0.0
+        self.final_total = 0.0
+        self.max_delta = 0.0
+
+    def record(self, variant_id: int, result: PricingResult) -> None:
+        self.decisions += 1
+        if result.rule_matched is not None:
+            self.matched += 1
+            self.rule_hits[result.rule_matched] = self.rule_hits.get(result.rule_matched, 0) + 1
+        self.variant_requests[variant_id] = self.variant_requests.get(variant_id, 0) + 1
+        self.discount_histogram[min(int(result.discount_pct * _HISTOGRAM_BUCKETS), _HISTOGRAM_BUCKETS - 1)] += 1
+        delta = result.base_price - result.final_price
+        self.base_total += result.base_price
+        self.final_total += result.final_price
+        if delta > self.max_delta:
+            self.max_delta = delta
+
+    def snapshot(self, top: int) -> dict:
+        delta_total = self.base_total - self.final_total
+        width = 1.0 / _HISTOGRAM_BUCKETS
+        return {
+            "decisions": self.decisions,
+            "matched": self.matched,
+            "top_rules": _top(self.rule_hits, "rule_id", top),
+            "top_variants": _top(self.variant_requests, "variant_id", top),
+            "distinct_variants": len(self.variant_requests),
+            "discount_histogram": [
+                {"min_pct": round(i * width, 2), "max_pct": round((i + 1) * width, 2), "count": count}
+                for i, count in enumerate(self.discount_histogram)
+            ],
+            "price_delta": {
+                "base_total": round(self.base_total, 2),
+                "final_total": round(self.final_total, 2),
+                "discount_total": round(delta_total, 2),
+                "mean_discount": round(delta_total / self.decisions, 4) if self.decisions else 0.0,
+                "mean_discount_pct": round(delta_total / self.base_total, 4) if self.base_total else 0.0,
+                "max_discount": round(self.max_delta, 2),
+            },
+        }
+
+
+def _top(counts: dict[int, int], key: str, n: int) -> list[dict]:
+    ranked = heapq.nsmallest(n, counts.items(), key=lambda item: (-item[1], item[0]))
+    return [{key: k, "count": count} for k, count in ranked]
+
+
+_aggregates = _Aggregates()
+_lock = threading.Lock()
+
+
+def record_decision(variant_id: int, result: PricingResult) -> None:
+    """Fold one pricing decision into the running aggregates."""
+    with _lock:
+        _aggregates.record(variant_id, result)
+
+
+def get_analytics(top: int = 10) -> dict:
+    """Return the aggregates, listing the top rules and variants by count.
+
+    Args:
+        top: How many rules and variants to include in the ranked lists.
+    """
+    with _lock:
+        return _aggregates.snapshot(top)
+
+
+def reset_analytics() -> None:
+    """Clear all aggregates. Intended for use in tests only."""
+    with _lock:
+        _aggregates.clear()
@@ -0,0 +1,297 @@
+"""
+Pricing Context
+
+Live pricing context (promotional rates, regional overrides, tier
+adjustments) comes from the central pricing authority. Fetching it is slow,
+so the last fetched context is cached with a TTL and served to every
+evaluation:
+
+- While the context is fresh it is returned immediately.
+- Once it is older than the TTL it is still served (stale-while-revalidate)
+  and a single refresh is started in the background.
+- When there is no context yet, concurrent callers collapse into one fetch
+  (single-flight) and wait for it.
+
+A background thread also refreshes the context on a fixed interval, so
+requests normally never wait on the upstream at all. get_context_async
+offers the same behaviour to coroutines, awaiting a cold fetch on the event
+loop instead of blocking a thread.
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import threading
+import time
+from dataclasses import dataclass
+
+# Time (ms) to fetch live pricing context from the central pricing authority.
+# In production this would be a network call; here it reflects the observed
+# p95 latency of the upstream pricing-context service.
+PRICING_FETCH_DELAY_MS = int(os.getenv("PRICING_FETCH_DELAY_MS", "2500"))
+
+# How long a fetched context is considered fresh. 0 disables caching, so every
+# evaluation fetches the context itself.
+CONTEXT_TTL_S = float(os.getenv("PRICING_CONTEXT_TTL_S", "30"))
+
+# Interval between background refreshes; 0 disables the refresher.
+CONTEXT_REFRESH_INTERVAL_S = float(os.getenv("PRICING_CONTEXT_REFRESH_INTERVAL_S", "10"))
+
+
+class PricingContextUnavailable(RuntimeError):
+    """Raised when no pricing context could be fetched from the pricing authority."""
+
+
+@dataclass(frozen=True)
+class PricingContext:
+    version: int        # increments on every successful fetch
+    fetched_at: float   # time.monotonic() when the fetch completed
+    fetch_ms: float     # how long the fetch took
+
+
+def _fetch_from_authority(version: int) -> PricingContext:
+    started = time.monotonic()
+    if PRICING_FETCH_DELAY_MS > 0:
+        time.sleep(PRICING_FETCH_DELAY_MS / 1000.0)
+    finished = time.monotonic()
+    return PricingContext(version=version, fetched_at=finished, fetch_ms=(finished - started) * 1000.0)
+
+
+async def _fetch_from_authority_async(version: int) -> PricingContext:
+    started = time.monotonic()
+    if PRICING_FETCH_DELAY_MS > 0:
+        await asyncio.sleep(PRICING_FETCH_DELAY_MS / 1000.0)
+    finished = time.monotonic()
+    return PricingContext(version=version, fetched_at=finished, fetch_ms=(finished - started) * 1000.0)
+
+
+class _Flight:
+    """A fetch in progress that threads and coroutines can both wait on."""
+
+    def __init__(self) -> None:
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._waiters: list[tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+
+    def wait(self) -> None:
+        self._event.wait()
+
+    async def wait_async(self) -> None:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._waiters.append((loop, future))
+        await future
+
+    def finish(self) -> None:
+        with self._lock:
+            self._event.set()
+            waiters, self._waiters = self._waiters, []
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(_resolve, future)
+
+
+def _resolve(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class _ContextCache:
+    """TTL cache for the pricing context with single-flight refreshes."""
+
+    def __init__(self, ttl_s: float) -> None:
+        self.ttl_s = ttl_s
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        self._context: PricingContext | None = None
+        self._inflight: _Flight | None = None
+        self.hits = 0
+        self.stale_served = 0
+        self.coalesced_waits = 0
+        self.refreshes = 0
+        self.refresh_failures = 0
+        self.last_error: str | None = None
+
+    def _claim(self) -> tuple[PricingContext | None, _Flight | None, bool]:
+        """Return (context, flight, leader); flight is None when the context is fresh."""
+        now = time.monotonic()
+        with self._lock:
+            context = self._context
+            if context is not None and now - context.fetched_at < self.ttl_s:
+                self.hits += 1
+                return context, None, False
+            leader = self._inflight is None
+            if leader:
+                self._inflight = _Flight()
+            if context is not None:
+                self.stale_served += 1
+            elif not leader:
+                self.coalesced_waits += 1
+            return context, self._inflight, leader
+
+    def get(self) -> PricingContext:
+        if self.ttl_s <= 0:
+            return _fetch_from_authority(self._next_version())
+
+        context, flight, leader = self._claim()
+        if flight is None:
+            return context
+        if context is not None:
+            if leader:
+                threading.Thread(target=self._run_refresh, args=(flight,), daemon=True).start()
+            return context
+
+        if leader:
+            self._run_refresh(flight)
+        else:
+            flight.wait()
+        return self._current()
+
+    async def get_async(self) -> PricingContext:
+        if self.ttl_s <= 0:
+            return await _fetch_from_authority_async(self._next_version())
+
+        context, flight, leader = self._claim()
+        if flight is None:
+            return context
+        if context is not None:
+            if leader:
+                threading.Thread(target=self._run_refresh, args=(flight,), daemon=True).start()
+            return context
+
+        if leader:
+            try:
+                fetched = await _fetch_from_authority_async(self._next_version())
+            except asyncio.CancelledError as exc:
+                self._finish(flight, None, exc)
+                raise
+            except Exception as exc:
+                self._finish(flight, None, exc)
+            else:
+                self._finish(flight, fetched, None)
+        else:
+            await flight.wait_async()
+        return self._current()
+
+    def refresh(self) -> None:
+        """Fetch a new context now, or wait for the fetch already in flight."""
+        with self._lock:
+            leader = self._inflight is None
+            if leader:
+                self._inflight = _Flight()
+            flight = self._inflight
+        if leader:
+            self._run_refresh(flight)
+        else:
+            flight.wait()
+
+    def _run_refresh(self, flight: _Flight) -> None:
+        try:
+            fetched = _fetch_from_authority(self._next_version())
+        except Exception as exc:
+            self._finish(flight, None, exc)
+        else:
+            self._finish(flight, fetched, None)
+
+    def _finish(self, flight: _Flight, context: PricingContext | None, error: Exception | None) -> None:
+        with self._lock:
+            if context is not None:
+                self._context = context
+                self.last_error = None
+            else:
+                self.refresh_failures += 1
+                self.last_error = str(error)
+            self._inflight = None
+        flight.finish()
+
+    def _next_version(self) -> int:
+        with self._lock:
+            self.refreshes += 1
+            return self.refreshes
+
+    def _current(self) -> PricingContext:
+        with self._lock:
+            if self._context is None:
+                raise PricingContextUnavailable(self.last_error or "pricing context fetch failed")
+            return self._context
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            context = self._context
+            return {
+                "ttl_s": self.ttl_s,
+                "version": context.version if context is not None else None,
+                "age_ms": round((now - context.fetched_at) * 1000.0, 2) if context is not None else None,
+                "last_refresh_ms": round(context.fetch_ms, 2) if context is not None else None,
+                "refreshing": self._inflight is not None,
+                "hits": self.hits,
+                "stale_served": self.stale_served,
+                "coalesced_waits": self.coalesced_waits,
+                "refreshes": self.refreshes,
+                "refresh_failures": self.refresh_failures,
+                "last_error": self.last_error,
+            }
+
+
+_cache = _ContextCache(CONTEXT_TTL_S)
+_refresher: threading.Thread | None = None
+_stop_refresher = threading.Event()
+
+
+def get_context() -> PricingContext:
+    """Return the current pricing context, fetching it only when none is cached.
+
+    Raises:
+        PricingContextUnavailable: If there is no cached context and the fetch failed.
+    """
+    return _cache.get()
+
+
+async def get_context_async() -> PricingContext:
+    """Like get_context, but a cold fetch is awaited instead of blocking a thread.
+
+    Raises:
+        PricingContextUnavailable: If there is no cached context and the fetch failed.
+    """
+    return await _cache.get_async()
+
+
+def get_context_stats() -> dict:
+    """Return context age, refresh latency and cache counters for observability."""
+    return _cache.stats()
+
+
+def start_background_refresh(interval_s: float = CONTEXT_REFRESH_INTERVAL_S) -> None:
+    """Warm the context and keep refreshing it every interval_s seconds on a daemon thread."""
+    global _refresher
+    if interval_s <= 0 or _cache.ttl_s <= 0 or _refresher is not None:
+        return
+
+    def _loop() -> None:
+        _cache.refresh()
+        while not _stop_refresher.wait(interval_s):
+            _cache.refresh()
+
+    _stop_refresher.clear()
+    _refresher = threading.Thread(target=_loop, name="pricing-context-refresh", daemon=True)
+    _refresher.start()
+
+
+def stop_background_refresh() -> None:
+    """Stop the background refresher started by start_background_refresh."""
+    global _refresher
+    _stop_refresher.set()
+    if _refresher is not None:
+        _refresher.join(timeout=1.0)
+        _refresher = None
+
+
+def reset_context() -> None:
+    """Drop the cached context and counters. Intended for use in tests only."""
+    with _cache._lock:
+        _cache.reset()
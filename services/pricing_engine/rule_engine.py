@@ -1,26 +1,88 @@
 """
 Dynamic Pricing Rule Engine
 
-Evaluates a large synthetic ruleset to determine final pricing for a given
-variant. On each evaluation, the engine fetches the latest pricing context
-from the central pricing authority before applying rules — ensuring that
-promotional rates, regional overrides, and tier adjustments are always
-current. Rule evaluation is comprehensive: all rules are inspected to handle
-overlapping conditions correctly.
+Evaluates a large ruleset (synthetic by default) to determine final pricing
+for a given variant. Each evaluation applies rules against the latest pricing
+context from the central pricing authority (see pricing_context), so
+promotional rates, regional overrides, and tier adjustments stay current.
+Rules are indexed by variant range at startup so that each evaluation only
+inspects the rules whose conditions actually match. Rules may also carry
+conditions on time, session segment, quantity and taxon; those are compiled
+per ruleset version into bitsets, so each request pays one bitwise AND per
+predicate type rather than a check per rule and predicate.
+
+The ruleset is versioned and immutable: every admin change produces a new
+Ruleset whose lookup structures share everything the change did not touch,
+and the new version is swapped in atomically so in-flight evaluations keep
+using the version they started with. With PRICING_RULES_SHARED_PATH set, the
+startup ruleset is packed into one file that every worker maps read-only; in
+that mode the ruleset cannot be changed through the admin API (a change would
+only reach the worker that handled it), so rules are changed by updating
+PRICING_RULES_FILE and restarting.
 """
 from __future__ import annotations
 
+import asyncio
+import fcntl
+import hashlib
+import json
+import mmap
+import multiprocessing
 import os
 import random
+import sys
+import threading
 import time
-from dataclasses import dataclass, field
+import zlib
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from collections import OrderedDict
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field, replace
+from typing import Iterable, Iterator
+
+import numpy as np
+
+from eval_worker import WORKER_ENV, init_worker
+from pricing_context import get_context, get_context_async
 
 RULES_COUNT = int(os.getenv("PRICING_RULES_COUNT", "10000"))
 
-# Time (ms) to fetch live pricing context from the central pricing authority.
-# In production this would be a network call; here it reflects the observed
-# p95 latency of the upstream pricing-context service.
-PRICING_FETCH_DELAY_MS = int(os.getenv("PRICING_FETCH_DELAY_MS", "2500"))
+# Optional JSON ruleset to load at startup instead of the synthetic rules.
+RULES_FILE = os.getenv("PRICING_RULES_FILE", "")
+
+# When set, the startup ruleset is packed into this file (ideally on /dev/shm)
+# by the first worker and mmap'd read-only by every other worker.
+RULES_SHARED_PATH = os.getenv("PRICING_RULES_SHARED_PATH", "")
+
+# Number of past ruleset versions kept so older decisions can still be explained.
+RULESET_HISTORY = int(os.getenv("PRICING_RULESET_HISTORY", "10"))
+
+# Upper bound on the (items x rules) match matrix evaluate_batch builds at once.
+# Larger batches are evaluated in chunks to keep peak memory flat.
+BATCH_MAX_CELLS = int(os.getenv("PRICING_BATCH_MAX_CELLS", "4000000"))
+
+# When enabled, the ruleset is compiled at startup into a per-variant decision
+# table so each evaluation is a single bisect. Only the winning rule is
+# recorded in matched_rule_ids in this mode.
+COMPILED_RULES = os.getenv("PRICING_RULES_COMPILED", "false").lower() == "true"
+
+# The packed layout has no decision table, so the two modes are exclusive.
+if COMPILED_RULES and RULES_SHARED_PATH:
+    raise RuntimeError("PRICING_RULES_COMPILED cannot be combined with PRICING_RULES_SHARED_PATH")
+
+# Worker processes for evaluate_async. Each worker loads its own copy of the
+# ruleset once at startup; 0 evaluates rules on a thread of the serving process.
+EVAL_WORKERS = int(os.getenv("PRICING_EVAL_WORKERS", "0"))
+
+# Sessions are bucketed into this many segments by a stable hash of session_id,
+# so a segment set fits in one 64-bit mask.
+SESSION_SEGMENTS = 64
+
+# Priorities live in int64 columns; the lowest int64 is reserved as the score
+# of a rule that does not match in evaluate_batch().
+_NO_MATCH = np.iinfo(np.int64).min
 
 
 @dataclass
@@ -30,6 +92,37 @@ class PricingRule:
     cart_min: float                  # applies if cart_total >= cart_min
     discount_pct: float              # 0.0–0.30
     priority: int                    # higher priority wins
+    # Optional conditions; a rule without them applies on variant and cart alone.
+    active_from: float | None = None                 # Unix time the rule starts applying
+    active_until: float | None = None                # Unix time the rule stops applying (exclusive)
+    session_segments: frozenset[int] | None = None   # applies if session_segment(session_id) is in this set
+    min_quantity: int = 1                            # applies if quantity >= min_quantity
+    taxon_ids: frozenset[int] | None = None          # applies if the variant is in any of these taxons
+
+    @property
+    def has_conditions(self) -> bool:
+        return (
+            self.active_from is not None
+            or self.active_until is not None
+            or self.session_segments is not None
+            or self.min_quantity > 1
+            or self.taxon_ids is not None
+        )
+
+
+@dataclass(frozen=True)
+class RequestFacts:
+    """Request attributes that rule conditions are tested against."""
+
+    session_id: str | None = None
+    quantity: int = 1
+    taxon_ids: tuple[int, ...] = ()
+    timestamp: float | None = None  # Unix time of the request; defaults to now
+
+
+def session_segment(session_id: str) -> int:
+    """Return the segment a session falls into, stable across processes and restarts."""
+    return zlib.crc32(session_id.encode()) % SESSION_SEGMENTS
 
 
 @dataclass
@@ -40,7 +133,8 @@ class PricingResult:
     discount_pct: float
     rule_matched: int | None          # rule_id of winning rule, None if no match
     rules_evaluated: int
-    rule_snapshot: list[dict] = field(default_factory=list)  # serialized evaluated rules — stored in cache for "audit"
+    ruleset_version: int = 0
+    matched_rule_ids: array = field(default_factory=lambda: array("q"))  # audit detail is rebuilt on demand
 
 
 def _build_rules(count: int) -> list[PricingRule]:
@@ -61,52 +155,1241 @@ def _build_rules(count: int) -> list[PricingRule]:
     return rules
 
 
-_RULES: list[PricingRule] = _build_rules(RULES_COUNT)
+def _rank(rule: PricingRule) -> tuple[int, int]:
+    # Higher priority wins; ties go to the lowest rule_id.
+    return (rule.priority, -rule.rule_id)
+
+
+class _RuleIndex:
+    """Segment tree over variant ids for point lookups against variant ranges.
+
+    Each rule is stored in the O(log n) canonical nodes that exactly cover its
+    variant_range, and every node keeps its rules sorted by cart_min along
+    with the running best rule at each position. A lookup walks from the
+    variant's leaf to the root and bisects each node, so it only touches the
+    rules that match: O(log n + k) instead of O(n).
+    """
+
+    # Variant ids are non-negative 31-bit integers; nodes are created lazily.
+    _SIZE = 1 << 31
+
+    def __init__(self, rules: list[PricingRule]) -> None:
+        self._nodes: dict[int, tuple[list[float], array, list[PricingRule]]] = {}
+        pending: dict[int, list[PricingRule]] = {}
+        for rule in rules:
+            for node in self._cover(*rule.variant_range):
+                pending.setdefault(node, []).append(rule)
+        for node, node_rules in pending.items():
+            node_rules.sort(key=lambda r: r.cart_min)
+            self._nodes[node] = self._compile_entry(node_rules)
+
+    def with_changes(
+        self,
+        added: list[PricingRule],
+        removed: list[PricingRule],
+        rules_by_id: dict[int, PricingRule],
+    ) -> "_RuleIndex":
+        """Return a new index with rules added and removed, leaving this one untouched.
+
+        Only the nodes covering the changed rules' ranges are rebuilt; every
+        other node is shared with this index.
+        """
+        touched: dict[int, list[PricingRule]] = {}
+
+        def node_rules(node: int) -> list[PricingRule]:
+            if node not in touched:
+                entry = self._nodes.get(node)
+                touched[node] = [rules_by_id[i] for i in entry[1]] if entry is not None else []
+            return touched[node]
+
+        for rule in removed:
+            for node in self._cover(*rule.variant_range):
+                rules = node_rules(node)
+                rules[:] = [r for r in rules if r.rule_id != rule.rule_id]
+        for rule in added:
+            for node in self._cover(*rule.variant_range):
+                insort(node_rules(node), rule, key=lambda r: r.cart_min)
+
+        index = _RuleIndex([])
+        index._nodes = dict(self._nodes)
+        for node, rules in touched.items():
+            if rules:
+                index._nodes[node] = self._compile_entry(rules)
+            else:
+                index._nodes.pop(node, None)
+        return index
+
+    @staticmethod
+    def _compile_entry(node_rules: list[PricingRule]) -> tuple[list[float], array, list[PricingRule]]:
+        best: list[PricingRule] = []
+        for rule in node_rules:
+            best.append(rule if not best or _rank(rule) > _rank(best[-1]) else best[-1])
+        return (
+            [r.cart_min for r in node_rules],
+            array("q", (r.rule_id for r in node_rules)),
+            best,
+        )
+
+    def _cover(self, low: int, high: int) -> list[int]:
+        """Return the canonical node ids covering the inclusive range [low, high]."""
+        low = max(low, 0)
+        high = min(high, self._SIZE - 1)
+        nodes: list[int] = []
+        left, right = low + self._SIZE, high + 1 + self._SIZE
+        while left < right:
+            if left & 1:
+                nodes.append(left)
+                left += 1
+            if right & 1:
+                right -= 1
+                nodes.append(right)
+            left >>= 1
+            right >>= 1
+        return nodes
+
+    def path(self, variant_id: int) -> list[int]:
+        """Return the populated node ids on the path from variant_id's leaf to the root."""
+        if not 0 <= variant_id < self._SIZE:
+            return []
+        nodes: list[int] = []
+        node = variant_id + self._SIZE
+        while node:
+            if node in self._nodes:
+                nodes.append(node)
+            node >>= 1
+        return nodes
+
+    def lookup(self, variant_id: int, cart_total: float) -> tuple[array, PricingRule | None]:
+        """Return the ids of every rule that applies to variant_id at cart_total, and the winner."""
+        matched_ids = array("q")
+        best_match: PricingRule | None = None
+        for node in self.path(variant_id):
+            cart_mins, rule_ids, best = self._nodes[node]
+            count = bisect_right(cart_mins, cart_total)
+            if count:
+                matched_ids.extend(rule_ids[:count])
+                candidate = best[count - 1]
+                if best_match is None or _rank(candidate) > _rank(best_match):
+                    best_match = candidate
+        return matched_ids, best_match
+
+
+class _DecisionTable:
+    """Ruleset compiled into a per-variant step function of cart_total.
+
+    Variants between two consecutive range boundaries are covered by exactly
+    the same rules, so they share one table: a sorted array of cart_min
+    breakpoints and the winning rule from each breakpoint onward. A lookup is
+    one bisect over the segments and one over the breakpoints.
+    """
+
+    def __init__(self, rules: list[PricingRule], index: _RuleIndex) -> None:
+        started = time.perf_counter()
+        bounds = {r.variant_range[0] for r in rules} | {r.variant_range[1] + 1 for r in rules}
+        self._starts = array("q", sorted(bounds))
+        self._breakpoints: list[array] = []
+        self._winners: list[tuple[PricingRule, ...]] = []
+
+        node_steps: dict[int, list[tuple[float, int, int, PricingRule]]] = {}
+        for start in self._starts:
+            breakpoints, winners = self._compile_segment(index, start, node_steps)
+            self._breakpoints.append(breakpoints)
+            self._winners.append(winners)
+
+        self.build_ms = (time.perf_counter() - started) * 1000.0
+
+    def with_changes(self, index: _RuleIndex, changed_ranges: list[tuple[int, int]]) -> "_DecisionTable":
+        """Return a new table recompiling only the segments inside the changed ranges.
+
+        index must already reflect the change. Segments outside every changed
+        range are shared with this table.
+        """
+        started = time.perf_counter()
+        bounds = set(self._starts)
+        for low, high in changed_ranges:
+            bounds.update((low, high + 1))
+
+        table = object.__new__(_DecisionTable)
+        table._starts = array("q", sorted(bounds))
+        table._breakpoints = []
+        table._winners = []
+        node_steps: dict[int, list[tuple[float, int, int, PricingRule]]] = {}
+        for start in table._starts:
+            if any(low <= start <= high for low, high in changed_ranges):
+                breakpoints, winners = self._compile_segment(index, start, node_steps)
+            else:
+                # Boundaries are only ever added, so each unchanged segment lies
+                # inside exactly one old segment and has the same winners.
+                old = bisect_right(self._starts, start) - 1
+                breakpoints = self._breakpoints[old] if old >= 0 else array("d")
+                winners = self._winners[old] if old >= 0 else ()
+            table._breakpoints.append(breakpoints)
+            table._winners.append(winners)
+
+        table.build_ms = (time.perf_counter() - started) * 1000.0
+        return table
+
+    @classmethod
+    def _compile_segment(
+        cls,
+        index: _RuleIndex,
+        start: int,
+        node_steps: dict[int, list[tuple[float, int, int, PricingRule]]],
+    ) -> tuple[array, tuple[PricingRule, ...]]:
+        # Within one index node the winner only changes when a higher-priority
+        # rule appears, so each node compiles down to a handful of steps.
+        steps: list[tuple[float, int, int, PricingRule]] = []
+        for node in index.path(start):
+            if node not in node_steps:
+                node_steps[node] = cls._compile_node(*index._nodes[node])
+            steps.extend(node_steps[node])
+        steps.sort(key=lambda s: s[0])
+
+        breakpoints = array("d")
+        winners: list[PricingRule] = []
+        best: tuple[int, int] | None = None
+        for cart_min, priority, neg_rule_id, rule in steps:
+            if best is None or (priority, neg_rule_id) > best:
+                best = (priority, neg_rule_id)
+                if breakpoints and breakpoints[-1] == cart_min:
+                    winners[-1] = rule
+                else:
+                    breakpoints.append(cart_min)
+                    winners.append(rule)
+        return breakpoints, tuple(winners)
+
+    @staticmethod
+    def _compile_node(
+        cart_mins: list[float], rule_ids: array, best: list[PricingRule]
+    ) -> list[tuple[float, int, int, PricingRule]]:
+        steps: list[tuple[float, int, int, PricingRule]] = []
+        for position, rule in enumerate(best):
+            if not steps or rule is not steps[-1][3]:
+                steps.append((cart_mins[position], rule.priority, -rule.rule_id, rule))
+        return steps
+
+    def lookup(self, variant_id: int, cart_total: float) -> PricingRule | None:
+        """Return the winning rule for variant_id at cart_total, if any."""
+        segment = bisect_right(self._starts, variant_id) - 1
+        if segment < 0:
+            return None
+        step = bisect_right(self._breakpoints[segment], cart_total) - 1
+        if step < 0:
+            return None
+        return self._winners[segment][step]
+
+    def stats(self) -> dict:
+        """Return build time and approximate memory footprint of the table."""
+        memory = sys.getsizeof(self._starts) + sys.getsizeof(self._breakpoints) + sys.getsizeof(self._winners)
+        memory += sum(sys.getsizeof(b) for b in self._breakpoints)
+        memory += sum(sys.getsizeof(w) for w in self._winners)
+        return {
+            "segments": len(self._starts),
+            "steps": sum(len(b) for b in self._breakpoints),
+            "build_ms": round(self.build_ms, 2),
+            "memory_kb": round(memory / 1024, 2),
+        }
+
+
+def _bitset(bits: Iterable[int], size: int) -> int:
+    buf = bytearray((size + 7) // 8)
+    for bit in bits:
+        buf[bit >> 3] |= 1 << (bit & 7)
+    return int.from_bytes(buf, "little")
+
+
+class _ConditionFilter:
+    """Bitset filter over the rules that carry extra conditions.
+
+    Every conditional rule gets one bit, and each predicate type is compiled
+    into bitsets of the rules that accept a given request value: one per
+    session segment, one per quantity tier, one per taxon, and one per
+    interval between time-window boundaries (computed when the clock first
+    enters it). A request's eligible rules are the AND of one bitset per
+    predicate type; the variant-range index over these rules then only tests
+    one bit per candidate.
+
+    A rule keeps its bit while it is in the filter, and the bits of removed
+    rules are handed to later additions, so a change only clears and sets the
+    bits of the rules it touches.
+    """
+
+    def __init__(self, rules: list[PricingRule]) -> None:
+        self._slots: list[PricingRule | None] = sorted(rules, key=lambda r: r.rule_id)
+        self._bits = {rule.rule_id: bit for bit, rule in enumerate(self._slots)}
+        self._free: list[int] = []
+        # The index stores each rule under its bit, so candidates come back as bit positions.
+        self._indexed = {bit: replace(rule, rule_id=bit) for bit, rule in enumerate(self._slots)}
+        self.index = _RuleIndex(list(self._indexed.values()))
+        size = len(self._slots)
+        self._ids = np.fromiter((rule.rule_id for rule in self._slots), dtype=np.int64, count=size)
+        self._priority = np.fromiter((rule.priority for rule in self._slots), dtype=np.int64, count=size)
+
+        def matching(predicate) -> int:
+            return _bitset((bit for bit, rule in enumerate(self._slots) if predicate(rule)), size)
+
+        any_segment = matching(lambda r: r.session_segments is None)
+        self._no_session = any_segment
+        self._segments = [
+            any_segment | matching(lambda r, s=s: r.session_segments is not None and s in r.session_segments)
+            for s in range(SESSION_SEGMENTS)
+        ]
+
+        self._tiers = sorted({rule.min_quantity for rule in self._slots})
+        self._tier_masks = [matching(lambda r, q=q: r.min_quantity <= q) for q in self._tiers]
+
+        self._any_taxon = matching(lambda r: r.taxon_ids is None)
+        taxon_bits: dict[int, list[int]] = {}
+        for bit, rule in enumerate(self._slots):
+            for taxon_id in rule.taxon_ids or ():
+                taxon_bits.setdefault(taxon_id, []).append(bit)
+        self._taxons = {taxon_id: _bitset(bits, size) for taxon_id, bits in taxon_bits.items()}
+
+        self._windows = {
+            bit: (rule.active_from, rule.active_until)
+            for bit, rule in enumerate(self._slots)
+            if rule.active_from is not None or rule.active_until is not None
+        }
+        self._untimed = matching(lambda r: r.active_from is None and r.active_until is None)
+        self._reset_time_bounds()
+
+    def __len__(self) -> int:
+        return len(self._bits)
+
+    def with_changes(self, added: list[PricingRule], removed: list[PricingRule]) -> "_ConditionFilter | None":
+        """Return a new filter with rules added and removed, leaving this one untouched.
+
+        Only the changed rules' bits are cleared or set in each bitset, and
+        only the index nodes covering their ranges are rebuilt.
+        """
+        if len(self._bits) - len(removed) + len(added) == 0:
+            return None
+        new = object.__new__(_ConditionFilter)
+        new._slots = list(self._slots)
+        new._bits = dict(self._bits)
+        new._indexed = dict(self._indexed)
+        new._no_session = self._no_session
+        new._segments = list(self._segments)
+        new._tiers = list(self._tiers)
+        new._tier_masks = list(self._tier_masks)
+        new._any_taxon = self._any_taxon
+        new._taxons = dict(self._taxons)
+        new._windows = dict(self._windows)
+        new._untimed = self._untimed
+
+        removed_indexed = []
+        free = list(self._free)
+        for rule in removed:
+            bit = new._bits.pop(rule.rule_id)
+            removed_indexed.append(new._indexed.pop(bit))
+            new._slots[bit] = None
+            new._clear(bit, rule)
+            free.append(bit)
+
+        # Additions take the lowest free bits first, then new bits at the end.
+        grow = max(0, len(added) - len(free))
+        free = list(range(len(new._slots) + grow - 1, len(new._slots) - 1, -1)) + sorted(free, reverse=True)
+        new._slots.extend([None] * grow)
+        new._ids = np.concatenate([self._ids, np.zeros(grow, dtype=np.int64)])
+        new._priority = np.concatenate([self._priority, np.zeros(grow, dtype=np.int64)])
+        added_indexed = []
+        for rule in added:
+            bit = free.pop()
+            new._slots[bit] = rule
+            new._bits[rule.rule_id] = bit
+            new._ids[bit] = rule.rule_id
+            new._priority[bit] = rule.priority
+            new._indexed[bit] = replace(rule, rule_id=bit)
+            added_indexed.append(new._indexed[bit])
+            new._set(bit, rule)
+        new._free = free
+
+        new.index = self.index.with_changes(added_indexed, removed_indexed, self._indexed)
+        new._reset_time_bounds()
+        return new
+
+    def _set(self, bit: int, rule: PricingRule) -> None:
+        flag = 1 << bit
+        if rule.session_segments is None:
+            self._no_session |= flag
+            self._segments = [mask | flag for mask in self._segments]
+        else:
+            for segment in rule.session_segments:
+                self._segments[segment] |= flag
+        tier = bisect_left(self._tiers, rule.min_quantity)
+        if tier == len(self._tiers) or self._tiers[tier] != rule.min_quantity:
+            # A new tier accepts the rules of the tier below it.
+            self._tiers.insert(tier, rule.min_quantity)
+            self._tier_masks.insert(tier, self._tier_masks[tier - 1] if tier else 0)
+        for position in range(tier, len(self._tiers)):
+            self._tier_masks[position] |= flag
+        if rule.taxon_ids is None:
+            self._any_taxon |= flag
+        else:
+            for taxon_id in rule.taxon_ids:
+                self._taxons[taxon_id] = self._taxons.get(taxon_id, 0) | flag
+        if rule.active_from is None and rule.active_until is None:
+            self._untimed |= flag
+        else:
+            self._windows[bit] = (rule.active_from, rule.active_until)
+
+    def _clear(self, bit: int, rule: PricingRule) -> None:
+        # Tiers left without rules keep the same mask as the tier below, so they stay.
+        keep = ~(1 << bit)
+        self._no_session &= keep
+        self._segments = [mask & keep for mask in self._segments]
+        self._tier_masks = [mask & keep for mask in self._tier_masks]
+        self._any_taxon &= keep
+        for taxon_id in rule.taxon_ids or ():
+            mask = self._taxons[taxon_id] & keep
+            if mask:
+                self._taxons[taxon_id] = mask
+            else:
+                del self._taxons[taxon_id]
+        self._untimed &= keep
+        self._windows.pop(bit, None)
+
+    def _reset_time_bounds(self) -> None:
+        self._time_bounds = sorted(
+            {t for start, end in self._windows.values() for t in (start, end) if t is not None}
+        )
+        # (interval start, interval end, mask) for the interval the clock was last in.
+        self._time_cache = (0.0, -1.0, 0)
+
+    def _time_mask(self, now: float) -> int:
+        start, end, mask = self._time_cache
+        if start <= now < end:
+            return mask
+        position = bisect_right(self._time_bounds, now)
+        start = self._time_bounds[position - 1] if position else float("-inf")
+        end = self._time_bounds[position] if position < len(self._time_bounds) else float("inf")
+        active = (
+            bit for bit, (active_from, active_until) in self._windows.items()
+            if (active_from is None or active_from <= now) and (active_until is None or now < active_until)
+        )
+        mask = self._untimed | _bitset(active, len(self._slots))
+        self._time_cache = (start, end, mask)
+        return mask
+
+    def eligible(self, facts: RequestFacts) -> int:
+        """Return the bitset of conditional rules whose extra conditions accept facts."""
+        tier = bisect_right(self._tiers, facts.quantity) - 1
+        if tier < 0:
+            return 0
+        mask = self._tier_masks[tier]
+        mask &= self._segments[session_segment(facts.session_id)] if facts.session_id else self._no_session
+        taxons = self._any_taxon
+        for taxon_id in facts.taxon_ids:
+            taxons |= self._taxons.get(taxon_id, 0)
+        mask &= taxons
+        if mask:
+            mask &= self._time_mask(time.time() if facts.timestamp is None else facts.timestamp)
+        return mask
+
+    def lookup(self, variant_id: int, cart_total: float, facts: RequestFacts) -> tuple[array, PricingRule | None]:
+        """Return the ids of every conditional rule that applies, and the best of them."""
+        candidates, _ = self.index.lookup(variant_id, cart_total)
+        if not candidates:
+            return candidates, None
+        eligible = np.unpackbits(
+            np.frombuffer(self.eligible(facts).to_bytes((len(self._slots) + 7) // 8, "little"), dtype=np.uint8),
+            bitorder="little",
+        )
+        bits = np.frombuffer(candidates, dtype=np.int64)
+        bits = bits[eligible[bits].astype(bool)]
+        if not len(bits):
+            return array("q"), None
+        priorities = self._priority[bits]
+        # Highest priority wins; among ties the lowest rule_id, since bits are reused out of rule_id order.
+        top = bits[priorities == priorities.max()]
+        winner = int(top[self._ids[top].argmin()])
+        return array("q", self._ids[bits].tobytes()), self._slots[winner]
+
+
+@dataclass
+class _RuleColumns:
+    """Struct-of-arrays view of the ruleset, ordered by rule_id, for vectorized evaluation."""
+
+    low: np.ndarray
+    high: np.ndarray
+    cart_min: np.ndarray
+    priority: np.ndarray
+    rule_id: np.ndarray
+    discount_pct: np.ndarray
+
+    @classmethod
+    def from_rules(cls, rules: list[PricingRule]) -> "_RuleColumns":
+        ordered = sorted(rules, key=lambda r: r.rule_id)
+        return cls(
+            low=np.fromiter((r.variant_range[0] for r in ordered), dtype=np.int64, count=len(ordered)),
+            high=np.fromiter((r.variant_range[1] for r in ordered), dtype=np.int64, count=len(ordered)),
+            cart_min=np.fromiter((r.cart_min for r in ordered), dtype=np.float64, count=len(ordered)),
+            priority=np.fromiter((r.priority for r in ordered), dtype=np.int64, count=len(ordered)),
+            rule_id=np.fromiter((r.rule_id for r in ordered), dtype=np.int64, count=len(ordered)),
+            discount_pct=np.fromiter((r.discount_pct for r in ordered), dtype=np.float64, count=len(ordered)),
+        )
+
+    def __len__(self) -> int:
+        return len(self.rule_id)
+
+    def rule_at(self, row: int) -> PricingRule:
+        return PricingRule(
+            rule_id=int(self.rule_id[row]),
+            variant_range=(int(self.low[row]), int(self.high[row])),
+            cart_min=float(self.cart_min[row]),
+            discount_pct=float(self.discount_pct[row]),
+            priority=int(self.priority[row]),
+        )
 
 
-def evaluate(variant_id: int, base_price: float, cart_total: float) -> PricingResult:
-    """Evaluate all pricing rules for the given variant and cart state.
+class Ruleset:
+    """One immutable version of the ruleset together with its lookup structures."""
+
+    def __init__(
+        self,
+        version: int,
+        rules_by_id: dict[int, PricingRule],
+        index: _RuleIndex,
+        table: _DecisionTable | None,
+        conditions: _ConditionFilter | None = None,
+    ) -> None:
+        self.version = version
+        self.rules_by_id = rules_by_id
+        self.index = index
+        self.table = table
+        self.conditions = conditions
+        self._columns: _RuleColumns | None = None
+
+    @classmethod
+    def build(cls, rules: list[PricingRule], version: int) -> "Ruleset":
+        rules_by_id: dict[int, PricingRule] = {}
+        for rule in rules:
+            _validate_rule(rule)
+            if rule.rule_id in rules_by_id:
+                raise ValueError(f"duplicate rule_id {rule.rule_id}")
+            rules_by_id[rule.rule_id] = rule
+        # The index and decision table hold the plain rules; rules with extra
+        # conditions go through the condition filter instead.
+        plain = [rule for rule in rules if not rule.has_conditions]
+        conditional = [rule for rule in rules if rule.has_conditions]
+        index = _RuleIndex(plain)
+        table = _DecisionTable(plain, index) if COMPILED_RULES else None
+        conditions = _ConditionFilter(conditional) if conditional else None
+        return cls(version, rules_by_id, index, table, conditions)
+
+    @property
+    def rules(self) -> list[PricingRule]:
+        return list(self.rules_by_id.values())
+
+    @property
+    def columns(self) -> "_RuleColumns":
+        # Only batch pricing needs the columnar copy of the plain rules, so it is built on first use.
+        if self._columns is None:
+            self._columns = _RuleColumns.from_rules([rule for rule in self.rules if not rule.has_conditions])
+        return self._columns
+
+    def with_changes(self, added: list[PricingRule], removed: list[PricingRule]) -> "Ruleset":
+        """Return the next version with rules added and removed.
+
+        The index, decision table and condition filter are updated
+        incrementally, sharing unchanged parts with this version. rules_by_id
+        is copied, so every version kept in the history costs O(rules) memory
+        for its map.
+        """
+        for rule in added:
+            _validate_rule(rule)
+        rules_by_id = dict(self.rules_by_id)
+        for rule in removed:
+            del rules_by_id[rule.rule_id]
+        for rule in added:
+            rules_by_id[rule.rule_id] = rule
+
+        plain_added = [rule for rule in added if not rule.has_conditions]
+        plain_removed = [rule for rule in removed if not rule.has_conditions]
+        index = self.index
+        table = self.table
+        if plain_added or plain_removed:
+            index = self.index.with_changes(plain_added, plain_removed, self.rules_by_id)
+            if self.table is not None:
+                table = self.table.with_changes(index, [r.variant_range for r in (*plain_added, *plain_removed)])
+
+        conditional_added = [rule for rule in added if rule.has_conditions]
+        conditional_removed = [rule for rule in removed if rule.has_conditions]
+        conditions = self.conditions
+        if conditional_added or conditional_removed:
+            if conditions is None:
+                conditions = _ConditionFilter(conditional_added)
+            else:
+                conditions = conditions.with_changes(conditional_added, conditional_removed)
+        return Ruleset(self.version + 1, rules_by_id, index, table, conditions)
+
+
+def _validate_rule(rule: PricingRule) -> None:
+    if not 0 <= rule.rule_id < 2**63:
+        raise ValueError(f"rule {rule.rule_id}: rule_id must be between 0 and 2**63 - 1")
+    if not _NO_MATCH < rule.priority < 2**63:
+        raise ValueError(f"rule {rule.rule_id}: priority must be between -2**63 + 1 and 2**63 - 1")
+    low, high = rule.variant_range
+    if low > high:
+        raise ValueError(f"rule {rule.rule_id}: variant_range low must not exceed high")
+    # The index covers variant ids below _RuleIndex._SIZE; a wider range would silently not match.
+    if low < 0 or high >= _RuleIndex._SIZE:
+        raise ValueError(f"rule {rule.rule_id}: variant_range must lie between 0 and {_RuleIndex._SIZE - 1}")
+    if not 0.0 <= rule.discount_pct <= 1.0:
+        raise ValueError(f"rule {rule.rule_id}: discount_pct must be between 0 and 1")
+    if rule.active_from is not None and rule.active_until is not None and rule.active_from >= rule.active_until:
+        raise ValueError(f"rule {rule.rule_id}: active_from must be before active_until")
+    if rule.session_segments is not None and not all(0 <= s < SESSION_SEGMENTS for s in rule.session_segments):
+        raise ValueError(f"rule {rule.rule_id}: session_segments must be between 0 and {SESSION_SEGMENTS - 1}")
+    if rule.min_quantity < 1:
+        raise ValueError(f"rule {rule.rule_id}: min_quantity must be at least 1")
+
+
+class _PackedRules(Mapping):
+    """Read-only rule_id -> PricingRule view over packed columns sorted by rule_id."""
+
+    def __init__(self, columns: _RuleColumns) -> None:
+        self._columns = columns
+
+    def _row(self, rule_id: int) -> int:
+        row = int(np.searchsorted(self._columns.rule_id, rule_id))
+        if row == len(self._columns) or self._columns.rule_id[row] != rule_id:
+            raise KeyError(rule_id)
+        return row
+
+    def __getitem__(self, rule_id: int) -> PricingRule:
+        return self._columns.rule_at(self._row(rule_id))
+
+    def __contains__(self, rule_id: object) -> bool:
+        try:
+            self._row(rule_id)  # type: ignore[arg-type]
+        except (KeyError, TypeError):
+            return False
+        return True
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._columns.rule_id.tolist())
+
+    def __len__(self) -> int:
+        return len(self._columns)
+
+
+class _PackedIndex:
+    """The _RuleIndex segment tree flattened into CSR arrays over packed rule rows."""
+
+    def __init__(
+        self,
+        columns: _RuleColumns,
+        node_ids: np.ndarray,
+        offsets: np.ndarray,
+        entry_cart_min: np.ndarray,
+        entry_row: np.ndarray,
+        entry_best: np.ndarray,
+    ) -> None:
+        self._columns = columns
+        # Nodes are bounded by the variant id domain, not the rule count, so a
+        # per-process dict over them stays small.
+        self._position = {node: i for i, node in enumerate(node_ids.tolist())}
+        self._offsets = offsets
+        self._entry_cart_min = entry_cart_min
+        self._entry_row = entry_row
+        self._entry_best = entry_best
+
+    def lookup(self, variant_id: int, cart_total: float) -> tuple[array, PricingRule | None]:
+        """Return the ids of every rule that applies to variant_id at cart_total, and the winner."""
+        if not 0 <= variant_id < _RuleIndex._SIZE:
+            return array("q"), None
+        columns = self._columns
+        matched_ids = array("q")
+        best_row = -1
+        node = variant_id + _RuleIndex._SIZE
+        while node:
+            position = self._position.get(node)
+            if position is not None:
+                start, end = int(self._offsets[position]), int(self._offsets[position + 1])
+                count = int(np.searchsorted(self._entry_cart_min[start:end], cart_total, side="right"))
+                if count:
+                    matched_ids.frombytes(columns.rule_id[self._entry_row[start : start + count]].tobytes())
+                    row = int(self._entry_best[start + count - 1])
+                    if best_row < 0 or (columns.priority[row], -columns.rule_id[row]) > (
+                        columns.priority[best_row],
+                        -columns.rule_id[best_row],
+                    ):
+                        best_row = row
+            node >>= 1
+        return matched_ids, (columns.rule_at(best_row) if best_row >= 0 else None)
+
+
+class RulesetReadOnly(RuntimeError):
+    """Raised by admin changes while the ruleset is shared across workers (RULES_SHARED_PATH)."""
+
+
+class PackedRuleset:
+    """A ruleset stored as packed struct-of-arrays in a file mmap'd by every worker.
+
+    Columns and the flattened index are zero-copy views into the mapping, so
+    workers share one physical copy through the page cache. Packed rulesets
+    are read-only; admin changes are refused while RULES_SHARED_PATH is set.
+    """
+
+    _MAGIC = b"PRICERS1"
+    # magic, 32-byte source key, then version, rules, nodes and entries as int64.
+    _HEADER = 8 + 32 + 4 * 8
 
-    Fetches live pricing context from the central pricing authority, then
-    iterates the full ruleset to handle overlapping rule conditions correctly.
-    All matching rules are collected and the highest-priority match determines
-    the final price.
+    table = None
+    conditions = None
+
+    def __init__(self, path: str, mapping: mmap.mmap, version: int, columns: _RuleColumns, index: _PackedIndex) -> None:
+        self.path = path
+        self.version = version
+        self._mapping = mapping
+        self.columns = columns
+        self.index = index
+        self.rules_by_id = _PackedRules(columns)
+
+    @property
+    def rules(self) -> list[PricingRule]:
+        return list(self.rules_by_id.values())
+
+    @classmethod
+    def write(cls, ruleset: Ruleset, path: str, source_key: bytes) -> None:
+        """Pack an in-memory ruleset into path, replacing any previous file atomically."""
+        rules = sorted(ruleset.rules, key=lambda r: r.rule_id)
+        row_of = {r.rule_id: row for row, r in enumerate(rules)}
+        nodes = sorted(ruleset.index._nodes)
+        offsets = [0]
+        entry_cart_min: list[float] = []
+        entry_row: list[int] = []
+        entry_best: list[int] = []
+        for node in nodes:
+            cart_mins, rule_ids, best = ruleset.index._nodes[node]
+            entry_cart_min.extend(cart_mins)
+            entry_row.extend(row_of[rule_id] for rule_id in rule_ids)
+            entry_best.extend(row_of[rule.rule_id] for rule in best)
+            offsets.append(len(entry_row))
+
+        columns = _RuleColumns.from_rules(rules)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(cls._MAGIC + source_key)
+            f.write(np.array([ruleset.version, len(rules), len(nodes), len(entry_row)], dtype=np.int64).tobytes())
+            for column in (
+                columns.rule_id,
+                columns.low,
+                columns.high,
+                columns.priority,
+                columns.cart_min,
+                columns.discount_pct,
+            ):
+                f.write(column.tobytes())
+            f.write(np.array(nodes, dtype=np.int64).tobytes())
+            f.write(np.array(offsets, dtype=np.int64).tobytes())
+            f.write(np.array(entry_cart_min, dtype=np.float64).tobytes())
+            f.write(np.array(entry_row, dtype=np.int64).tobytes())
+            f.write(np.array(entry_best, dtype=np.int64).tobytes())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def source_matches(cls, path: str, source_key: bytes) -> bool:
+        try:
+            with open(path, "rb") as f:
+                header = f.read(cls._HEADER)
+        except FileNotFoundError:
+            return False
+        return len(header) == cls._HEADER and header[:8] == cls._MAGIC and header[8:40] == source_key
+
+    @classmethod
+    def attach(cls, path: str) -> "PackedRuleset":
+        """Map a packed ruleset file read-only without copying its arrays."""
+        with open(path, "rb") as f:
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        version, n_rules, n_nodes, n_entries = np.frombuffer(mapping, dtype=np.int64, count=4, offset=40).tolist()
+
+        offset = cls._HEADER
+
+        def take(dtype: type, count: int) -> np.ndarray:
+            nonlocal offset
+            view = np.frombuffer(mapping, dtype=dtype, count=count, offset=offset)
+            offset += count * 8
+            return view
+
+        rule_id, low, high, priority = (take(np.int64, n_rules) for _ in range(4))
+        cart_min, discount_pct = (take(np.float64, n_rules) for _ in range(2))
+        columns = _RuleColumns(
+            low=low, high=high, cart_min=cart_min, priority=priority, rule_id=rule_id, discount_pct=discount_pct
+        )
+        node_ids = take(np.int64, n_nodes)
+        offsets = take(np.int64, n_nodes + 1)
+        entry_cart_min = take(np.float64, n_entries)
+        entry_row = take(np.int64, n_entries)
+        entry_best = take(np.int64, n_entries)
+        index = _PackedIndex(columns, node_ids, offsets, entry_cart_min, entry_row, entry_best)
+        return cls(path, mapping, version, columns, index)
+
+
+def _load_shared_ruleset(path: str) -> Ruleset | PackedRuleset:
+    """Attach to the packed ruleset at path, building it first if no worker has yet."""
+    source = f"file:{RULES_FILE}:{os.stat(RULES_FILE).st_mtime_ns}" if RULES_FILE else f"synthetic:{RULES_COUNT}"
+    source_key = hashlib.sha256(source.encode()).digest()
+    with open(f"{path}.lock", "a+") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            if not PackedRuleset.source_matches(path, source_key):
+                rules = _load_source_rules()
+                if any(rule.has_conditions for rule in rules):
+                    # The packed layout only holds plain rules, so a ruleset with
+                    # conditions is built in every worker instead.
+                    return Ruleset.build(rules, version=1)
+                PackedRuleset.write(Ruleset.build(rules, version=1), path, source_key)
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+    return PackedRuleset.attach(path)
+
+
+def _load_source_rules() -> list[PricingRule]:
+    return load_rules_file(RULES_FILE) if RULES_FILE else _build_rules(RULES_COUNT)
+
+
+def load_rules_file(path: str) -> list[PricingRule]:
+    """Read a JSON array of rules in the same shape as get_rule_snapshot entries."""
+    with open(path) as f:
+        return rules_from_dicts(json.load(f))
+
+
+def rules_from_dicts(entries: list[dict]) -> list[PricingRule]:
+    """Build PricingRule objects from rule dicts (rule_id, variant_range, cart_min, discount_pct, priority).
+
+    The condition keys active_from, active_until, session_segments, min_quantity
+    and taxon_ids are optional.
+    """
+    return [
+        PricingRule(
+            rule_id=int(e["rule_id"]),
+            variant_range=(int(e["variant_range"][0]), int(e["variant_range"][1])),
+            cart_min=float(e["cart_min"]),
+            discount_pct=float(e["discount_pct"]),
+            priority=int(e["priority"]),
+            active_from=float(e["active_from"]) if e.get("active_from") is not None else None,
+            active_until=float(e["active_until"]) if e.get("active_until") is not None else None,
+            session_segments=frozenset(e["session_segments"]) if e.get("session_segments") is not None else None,
+            min_quantity=int(e.get("min_quantity", 1)),
+            taxon_ids=frozenset(e["taxon_ids"]) if e.get("taxon_ids") is not None else None,
+        )
+        for e in entries
+    ]
+
+
+def _rule_dict(rule: PricingRule) -> dict:
+    entry = {
+        "rule_id": rule.rule_id,
+        "variant_range": list(rule.variant_range),
+        "cart_min": rule.cart_min,
+        "discount_pct": rule.discount_pct,
+        "priority": rule.priority,
+    }
+    # Conditions are only listed when set, so plain rules keep their original shape.
+    if rule.active_from is not None:
+        entry["active_from"] = rule.active_from
+    if rule.active_until is not None:
+        entry["active_until"] = rule.active_until
+    if rule.session_segments is not None:
+        entry["session_segments"] = sorted(rule.session_segments)
+    if rule.min_quantity > 1:
+        entry["min_quantity"] = rule.min_quantity
+    if rule.taxon_ids is not None:
+        entry["taxon_ids"] = sorted(rule.taxon_ids)
+    return entry
+
+
+# Eval pool workers get their ruleset from install_worker_ruleset (see eval_worker),
+# so they skip the import-time build.
+_load_started = time.perf_counter()
+if os.getenv(WORKER_ENV) == "1":
+    _current: Ruleset | PackedRuleset = Ruleset.build([], version=0)
+elif RULES_SHARED_PATH:
+    _current = _load_shared_ruleset(RULES_SHARED_PATH)
+else:
+    _current = Ruleset.build(_load_source_rules(), version=1)
+_LOAD_MS = (time.perf_counter() - _load_started) * 1000.0
+_history: OrderedDict[int, Mapping[int, PricingRule]] = OrderedDict({_current.version: _current.rules_by_id})
+_write_lock = threading.Lock()
+_POOL: ProcessPoolExecutor | None = None
+_POOL_WORKERS = 0
+# Ruleset version the pool's workers hold; behind _current while a refresh runs.
+_POOL_VERSION = 0
+_pool_lock = threading.Lock()
+_pool_refresh: threading.Thread | None = None
+_pool_error: str | None = None
+
+
+def get_ruleset() -> Ruleset | PackedRuleset:
+    """Return the current ruleset version. Hold on to it for a consistent view."""
+    return _current
+
+
+def add_rule(rule: PricingRule) -> int:
+    """Add a rule and return the new ruleset version.
+
+    Raises:
+        ValueError: If a rule with the same rule_id exists or the rule is invalid.
+        RulesetReadOnly: If the ruleset is shared across workers.
+    """
+    with _write_lock:
+        _check_writable()
+        if rule.rule_id in _current.rules_by_id:
+            raise ValueError(f"rule {rule.rule_id} already exists")
+        return _publish(_current.with_changes([rule], []))
+
+
+def update_rule(rule: PricingRule) -> int:
+    """Replace the rule with the same rule_id and return the new ruleset version.
+
+    Raises:
+        KeyError: If no rule with that rule_id exists.
+        ValueError: If the rule is invalid.
+        RulesetReadOnly: If the ruleset is shared across workers.
+    """
+    with _write_lock:
+        _check_writable()
+        old = _current.rules_by_id[rule.rule_id]
+        return _publish(_current.with_changes([rule], [old]))
+
+
+def delete_rule(rule_id: int) -> int:
+    """Delete a rule and return the new ruleset version.
+
+    Raises:
+        KeyError: If no rule with that rule_id exists.
+        RulesetReadOnly: If the ruleset is shared across workers.
+    """
+    with _write_lock:
+        _check_writable()
+        old = _current.rules_by_id[rule_id]
+        return _publish(_current.with_changes([], [old]))
+
+
+def replace_rules(rules: list[PricingRule]) -> int:
+    """Replace the whole ruleset (e.g. from a ruleset file) and return the new version.
+
+    Raises:
+        ValueError: If rule_ids are duplicated or a rule is invalid.
+        RulesetReadOnly: If the ruleset is shared across workers.
+    """
+    with _write_lock:
+        _check_writable()
+        return _publish(Ruleset.build(rules, version=_current.version + 1))
+
+
+def _check_writable() -> None:
+    # Every worker maps the same packed file; a change here would reach only this worker.
+    if RULES_SHARED_PATH:
+        raise RulesetReadOnly(
+            "ruleset is shared across workers (PRICING_RULES_SHARED_PATH); update PRICING_RULES_FILE and restart"
+        )
+
+
+def _publish(ruleset: Ruleset | PackedRuleset) -> int:
+    global _current
+    _history[ruleset.version] = ruleset.rules_by_id
+    while len(_history) > max(RULESET_HISTORY, 1):
+        _history.popitem(last=False)
+    # A single reference assignment: evaluations that already read _current
+    # finish against the version they started with.
+    _current = ruleset
+    _schedule_pool_refresh()
+    return ruleset.version
+
+
+def get_ruleset_stats() -> dict:
+    """Return the loaded ruleset's size, version, storage and load cost, plus this worker's RSS."""
+    ruleset = _current
+    return {
+        "rules_count": len(ruleset.rules_by_id),
+        "conditional_rules": len(ruleset.conditions) if ruleset.conditions is not None else 0,
+        "ruleset_version": ruleset.version,
+        "versions_retained": list(_history),
+        "shared": isinstance(ruleset, PackedRuleset),
+        "startup_load_ms": round(_LOAD_MS, 2),
+        "worker_pid": os.getpid(),
+        "worker_rss_kb": _rss_kb(),
+        "compiled": ruleset.table is not None,
+        "decision_table": ruleset.table.stats() if ruleset.table is not None else None,
+        "eval_pool": _pool_stats(),
+    }
+
+
+def _rss_kb() -> int | None:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def evaluate(
+    variant_id: int, base_price: float, cart_total: float, facts: RequestFacts | None = None
+) -> PricingResult:
+    """Evaluate the pricing rules that apply to the given variant and cart state.
+
+    Obtains the cached pricing context from the central pricing authority,
+    then collects every matching rule from the variant-range index. The
+    highest-priority match determines the final price; ties go to the lowest
+    rule_id, as they would in a scan of the ruleset in order. Only the ids of
+    matched rules are kept; use get_rule_snapshot for the full audit detail.
 
     Args:
         variant_id: The product variant being priced.
         base_price: The catalog list price for the variant.
         cart_total: The current cart subtotal before this item.
+        facts: Session, quantity, taxons and time for rules with extra
+            conditions. Without it only rules that do not target a session
+            segment or taxon apply, at quantity 1 and the current time.
 
     Returns:
-        A PricingResult with the final price and full evaluation context.
+        A PricingResult with the final price and matched rule ids.
     """
-    # Fetch live pricing context from the central pricing authority.
-    # This ensures promotional rates and regional overrides are always current.
-    if PRICING_FETCH_DELAY_MS > 0:
-        time.sleep(PRICING_FETCH_DELAY_MS / 1000.0)
-
-    matched: list[PricingRule] = []
-
-    for rule in _RULES:
-        low, high = rule.variant_range
-        if low <= variant_id <= high and cart_total >= rule.cart_min:
-            matched.append(rule)
-
-    best_match: PricingRule | None = None
-    if matched:
-        best_match = max(matched, key=lambda r: r.priority)
-
-    rule_snapshot: list[dict] = [
-        {
-            "rule_id": r.rule_id,
-            "variant_range": list(r.variant_range),
-            "cart_min": r.cart_min,
-            "discount_pct": r.discount_pct,
-            "priority": r.priority,
-        }
-        for r in matched
-    ]
+    get_context()
+    return _match(variant_id, base_price, cart_total, facts)
+
 
+async def evaluate_async(
+    variant_id: int, base_price: float, cart_total: float, facts: RequestFacts | None = None
+) -> PricingResult:
+    """Evaluate pricing like evaluate(), without blocking the event loop.
+
+    A cold pricing-context fetch is awaited on the event loop. When the
+    evaluation pool is running and its workers hold the current ruleset, rule
+    matching happens in a worker process so large rulesets do not hold the
+    GIL of the serving process; otherwise it runs on a thread of the default
+    executor.
+
+    Args:
+        variant_id: The product variant being priced.
+        base_price: The catalog list price for the variant.
+        cart_total: The current cart subtotal before this item.
+        facts: Request attributes for rules with extra conditions, as for evaluate().
+
+    Returns:
+        A PricingResult with the final price and matched rule ids.
+    """
+    await get_context_async()
+    version = _current.version
+    pool = _POOL
+    loop = asyncio.get_running_loop()
+    if pool is not None and _POOL_VERSION == version:
+        try:
+            result = await loop.run_in_executor(pool, _match, variant_id, base_price, cart_total, facts)
+        except RuntimeError:
+            # The pool was replaced and shut down after it was read.
+            result = None
+        if result is not None and result.ruleset_version == version:
+            return result
+    return await loop.run_in_executor(None, _match, variant_id, base_price, cart_total, facts)
+
+
+def start_eval_pool(workers: int = EVAL_WORKERS) -> None:
+    """Start the rule-evaluation process pool and wait until every worker is warm."""
+    global _POOL, _POOL_WORKERS, _POOL_VERSION
+    if workers <= 0 or _POOL is not None:
+        return
+    ruleset = _current
+    pool = _start_pool(workers, ruleset)
+    with _pool_lock:
+        _POOL, _POOL_WORKERS, _POOL_VERSION = pool, workers, ruleset.version
+
+
+def _start_pool(workers: int, ruleset: Ruleset | PackedRuleset) -> ProcessPoolExecutor:
+    # Workers attach a packed ruleset file directly instead of unpickling its rules.
+    if isinstance(ruleset, PackedRuleset):
+        initargs = (ruleset.path, None, ruleset.version)
+    else:
+        initargs = (None, [_rule_dict(rule) for rule in ruleset.rules], ruleset.version)
+    pool = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=init_worker,
+        initargs=initargs,
+    )
+    try:
+        for future in [pool.submit(_warm_worker) for _ in range(workers)]:
+            future.result()
+    except BaseException:
+        pool.shutdown(wait=False, cancel_futures=True)
+        raise
+    return pool
+
+
+def _schedule_pool_refresh() -> None:
+    # Workers hold their own copy of the ruleset, so a new version needs a new,
+    # warm pool. It is built on a background thread, outside _write_lock, so
+    # admin changes do not wait for workers to spawn; until it is swapped in,
+    # evaluate_async matches against the new version on a thread instead.
+    global _pool_refresh
+    with _pool_lock:
+        if _POOL is None or _pool_refresh is not None:
+            return
+        _pool_refresh = threading.Thread(target=_refresh_eval_pool, name="eval-pool-refresh", daemon=True)
+        _pool_refresh.start()
+
+
+def _refresh_eval_pool() -> None:
+    global _POOL, _POOL_VERSION, _pool_refresh, _pool_error
+    while True:
+        # Changes published while a pool was starting are picked up by the next round.
+        with _pool_lock:
+            ruleset = _current
+            if _POOL is None or _POOL_VERSION == ruleset.version:
+                _pool_refresh = None
+                return
+        try:
+            pool = _start_pool(_POOL_WORKERS, ruleset)
+        except Exception as exc:
+            with _pool_lock:
+                _pool_error = str(exc)
+                _pool_refresh = None
+            return
+        with _pool_lock:
+            old = _POOL
+            if old is None:
+                # shutdown_eval_pool ran while the new pool was starting.
+                _pool_refresh = None
+            else:
+                _POOL, _POOL_VERSION, _pool_error = pool, ruleset.version, None
+        if old is None:
+            pool.shutdown(wait=False)
+            return
+        # Evaluations already queued on the old pool finish there.
+        old.shutdown(wait=False)
+
+
+def _pool_stats() -> dict | None:
+    if _POOL is None:
+        return None
+    return {
+        "workers": _POOL_WORKERS,
+        "ruleset_version": _POOL_VERSION,
+        "refreshing": _pool_refresh is not None,
+        "last_error": _pool_error,
+    }
+
+
+def shutdown_eval_pool() -> None:
+    """Stop the rule-evaluation process pool started by start_eval_pool."""
+    global _POOL
+    with _pool_lock:
+        pool, _POOL = _POOL, None
+        refresh = _pool_refresh
+    if refresh is not None:
+        refresh.join()
+    if pool is not None:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def install_worker_ruleset(path: str | None, rules: list[dict] | None, version: int) -> None:
+    """Load an eval pool worker's ruleset: attach the packed file at path, or build it from rule dicts."""
+    global _current
+    _current = PackedRuleset.attach(path) if path is not None else Ruleset.build(rules_from_dicts(rules), version)
+
+
+def _warm_worker() -> int:
+    return _current.version
+
+
+_NO_FACTS = RequestFacts()
+
+
+def _match(
+    variant_id: int, base_price: float, cart_total: float, facts: RequestFacts | None = None
+) -> PricingResult:
+    ruleset = _current
+    if ruleset.table is not None:
+        best_match = ruleset.table.lookup(variant_id, cart_total)
+        matched_ids = array("q", [best_match.rule_id] if best_match is not None else [])
+    else:
+        matched_ids, best_match = ruleset.index.lookup(variant_id, cart_total)
+    if ruleset.conditions is not None:
+        best_match = _match_conditions(ruleset.conditions, variant_id, cart_total, facts, matched_ids, best_match)
+
+    return _build_result(ruleset, variant_id, base_price, best_match, matched_ids, len(matched_ids))
+
+
+def _match_conditions(
+    conditions: _ConditionFilter,
+    variant_id: int,
+    cart_total: float,
+    facts: RequestFacts | None,
+    matched_ids: array,
+    best_match: PricingRule | None,
+) -> PricingRule | None:
+    # Adds the applicable conditional rules to matched_ids and returns the overall winner.
+    conditional_ids, conditional_best = conditions.lookup(variant_id, cart_total, facts or _NO_FACTS)
+    matched_ids.extend(conditional_ids)
+    if conditional_best is not None and (best_match is None or _rank(conditional_best) > _rank(best_match)):
+        return conditional_best
+    return best_match
+
+
+def evaluate_batch(
+    items: list[tuple[int, float, float]], facts: list[RequestFacts | None] | None = None
+) -> list[PricingResult]:
+    """Evaluate many (variant_id, base_price, cart_total) tuples in one pass.
+
+    Pricing context is obtained once for the whole batch, and plain rules are
+    matched with NumPy over the struct-of-arrays ruleset rather than per item;
+    rules with extra conditions go through the condition filter per item.
+    Winners are identical to evaluate(); rules_evaluated reports the full
+    ruleset, since every rule is compared against every item.
+
+    Args:
+        items: (variant_id, base_price, cart_total) tuples to price.
+        facts: Optional request attributes for each item, as for evaluate().
+
+    Returns:
+        One PricingResult per item, in input order.
+    """
+    get_context()
+
+    ruleset = _current
+    columns = ruleset.columns
+    rules_count = len(ruleset.rules_by_id)
+    chunk_size = max(1, BATCH_MAX_CELLS // max(len(columns), 1))
+    results: list[PricingResult] = []
+
+    for offset in range(0, len(items), chunk_size):
+        chunk = items[offset : offset + chunk_size]
+        variant_ids = np.array([item[0] for item in chunk], dtype=np.int64)[:, None]
+        cart_totals = np.array([item[2] for item in chunk], dtype=np.float64)[:, None]
+
+        mask = (columns.low <= variant_ids) & (variant_ids <= columns.high) & (columns.cart_min <= cart_totals)
+        # argmax returns the first maximum, i.e. the lowest rule_id among ties.
+        # Priorities are validated to lie above _NO_MATCH, so an unmatched rule never wins.
+        scores = np.where(mask, columns.priority, _NO_MATCH)
+        best = scores.argmax(axis=1) if len(columns) else np.zeros(len(chunk), dtype=np.int64)
+
+        for row, (variant_id, base_price, cart_total) in enumerate(chunk):
+            matched_ids = array("q", columns.rule_id[mask[row]].tobytes())
+            best_match = columns.rule_at(best[row]) if matched_ids else None
+            if ruleset.conditions is not None:
+                item_facts = facts[offset + row] if facts is not None else None
+                best_match = _match_conditions(
+                    ruleset.conditions, variant_id, cart_total, item_facts, matched_ids, best_match
+                )
+            results.append(_build_result(ruleset, variant_id, base_price, best_match, matched_ids, rules_count))
+
+    return results
+
+
+def _build_result(
+    ruleset: Ruleset | PackedRuleset,
+    variant_id: int,
+    base_price: float,
+    best_match: PricingRule | None,
+    matched_ids: array,
+    rules_evaluated: int,
+) -> PricingResult:
     if best_match is not None:
         discount = best_match.discount_pct
         final_price = base_price * (1.0 - discount)
@@ -122,6 +1405,26 @@ def evaluate(variant_id: int, base_price: float, cart_total: float) -> PricingRe
         final_price=final_price,
         discount_pct=discount,
         rule_matched=rule_matched,
-        rules_evaluated=RULES_COUNT,
-        rule_snapshot=rule_snapshot,
+        rules_evaluated=rules_evaluated,
+        ruleset_version=ruleset.version,
+        matched_rule_ids=matched_ids,
     )
+
+
+def get_rule_snapshot(rule_ids: Iterable[int], ruleset_version: int) -> list[dict]:
+    """Materialize the audit snapshot of the given rules, ordered by rule_id.
+
+    Args:
+        rule_ids: Ids of the rules matched by a pricing decision.
+        ruleset_version: The ruleset version the decision was computed with.
+
+    Returns:
+        One dict per rule with its full conditions and discount.
+
+    Raises:
+        KeyError: If the ruleset version is not available.
+    """
+    rules_by_id = _history.get(ruleset_version)
+    if rules_by_id is None:
+        raise KeyError(f"ruleset version {ruleset_version} is not available")
+    return [_rule_dict(rules_by_id[rule_id]) for rule_id in sorted(rule_ids)]
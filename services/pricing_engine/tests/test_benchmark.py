@@ -0,0 +1,34 @@
+"""Tests for the benchmark report helpers."""
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from benchmark import _summarize, compare
+
+
+def _report(p95_us, throughput):
+    stats = {"iterations": 100, "p50_us": 1.0, "p95_us": p95_us, "p99_us": p95_us, "throughput_per_s": throughput}
+    return {"runs": [{"rules_count": 1000, "benchmarks": {"evaluate": stats}}]}
+
+
+def test_summarize_reports_percentiles_in_microseconds():
+    summary = _summarize([i * 1000 for i in range(1, 101)], elapsed_s=0.5)
+
+    assert summary["iterations"] == 100
+    assert summary["p50_us"] == 51.0
+    assert summary["p99_us"] == 100.0
+    assert summary["throughput_per_s"] == 200.0
+
+
+def test_compare_flags_latency_and_throughput_regressions():
+    regressions = compare(_report(p95_us=20.0, throughput=500.0), _report(p95_us=10.0, throughput=1000.0))
+
+    assert {r["metric"] for r in regressions} == {"p95_us", "throughput_per_s"}
+
+
+def test_compare_ignores_changes_within_threshold_and_unknown_sizes():
+    baseline = _report(p95_us=10.0, throughput=1000.0)
+
+    assert compare(_report(p95_us=10.5, throughput=950.0), baseline, threshold=0.10) == []
+    assert compare({"runs": [{"rules_count": 5, "benchmarks": {}}]}, baseline) == []
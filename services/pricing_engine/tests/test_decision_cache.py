@@ -68,3 +68,60 @@ def test_estimated_memory_grows():
     memory_after_ten = stats_ten["estimated_memory_kb"]
 
     assert memory_after_ten > memory_after_one
+
+
+def test_capacity_bounds_cache_size(monkeypatch):
+    monkeypatch.setattr(decision_cache, "_ring", decision_cache._DecisionRing(capacity=4, max_age_s=0))
+
+    for i in range(1, 11):
+        _make_decision(variant_id=i)
+
+    stats = get_stats()
+    assert stats["cache_size"] == 4
+    assert stats["capacity"] == 4
+    assert stats["total_decisions"] == 10
+    assert stats["evicted"] == 6
+    assert list(decision_cache._ring.variant_id) == [9, 10, 7, 8]
+
+
+def test_estimated_memory_stable_once_full(monkeypatch):
+    monkeypatch.setattr(decision_cache, "_ring", decision_cache._DecisionRing(capacity=3, max_age_s=0))
+
+    for _ in range(3):
+        _make_decision(variant_id=1)
+    memory_full = get_stats()["estimated_memory_kb"]
+
+    for _ in range(5):
+        _make_decision(variant_id=1)
+
+    assert get_stats()["estimated_memory_kb"] == memory_full
+
+
+def test_age_eviction(monkeypatch):
+    ring = decision_cache._DecisionRing(capacity=10, max_age_s=60)
+    monkeypatch.setattr(decision_cache, "_ring", ring)
+    result = evaluate(1, 29.99, 50.0)
+
+    ring.append(1, 50.0, result, now=1000.0)
+    ring.append(2, 50.0, result, now=1030.0)
+    ring.append(3, 50.0, result, now=1090.0)
+
+    assert ring.size == 2
+    assert ring.evicted == 1
+    assert ring.variant_id[ring.head] == 2
+
+    ring.evict_expired(now=2000.0)
+    assert ring.size == 0
+    assert ring.memory_bytes == 0
+
+
+def test_sampling_keeps_one_in_n_decisions(monkeypatch):
+    monkeypatch.setattr(decision_cache, "SAMPLE_EVERY", 3)
+    result = evaluate(1, 29.99, 50.0)
+
+    ids = [store_decision(1, 50.0, result) for _ in range(7)]
+
+    assert ids == [1, None, None, 2, None, None, 3]
+    stats = get_stats()
+    assert stats["cache_size"] == 3
+    assert stats["decisions_seen"] == 7
@@ -0,0 +1,79 @@
+"""Tests for the on-disk pricing decision log."""
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import pytest
+
+from decision_log import DecisionLog
+from rule_engine import evaluate
+
+
+@pytest.fixture
+def log(tmp_path):
+    log = DecisionLog(str(tmp_path), segment_bytes=4096, max_segments=3)
+    log.start()
+    yield log
+    log.stop()
+
+
+def _append(log, variant_id, now, cart_total=300.0):
+    log.append(variant_id, cart_total, evaluate(variant_id, 29.99, cart_total), now)
+
+
+def test_logged_decisions_round_trip(log):
+    result = evaluate(42, 29.99, 300.0)
+    log.append(42, 300.0, result, now=1000.0)
+    log.flush()
+
+    [record] = list(log.query())
+
+    assert record["variant_id"] == 42
+    assert record["final_price"] == pytest.approx(result.final_price)
+    assert record["rule_matched"] == result.rule_matched
+    assert record["ruleset_version"] == result.ruleset_version
+    assert record["matched_rule_ids"] == result.matched_rule_ids.tolist()
+
+
+def test_query_filters_by_variant_rule_and_time(log):
+    for i in range(10):
+        _append(log, variant_id=1 + i % 2, now=1000.0 + i)
+    log.flush()
+
+    assert len(list(log.query(variant_id=2))) == 5
+    assert [r["timestamp_unix"] for r in log.query(since=1003.0, until=1005.0)] == [1003.0, 1004.0, 1005.0]
+
+    rule_id = evaluate(1, 29.99, 300.0).rule_matched
+    assert all(rule_id in r["matched_rule_ids"] for r in log.query(rule_id=rule_id))
+    assert len(list(log.query(rule_id=rule_id))) >= 5
+
+
+def test_segments_rotate_and_oldest_are_deleted(log):
+    for i in range(2000):
+        _append(log, variant_id=1 + i % 5, now=1000.0 + i, cart_total=10.0)
+        if i % 100 == 0:
+            log.flush()
+    log.flush()
+
+    stats = log.stats()
+    assert stats["rotations"] > 3
+    assert stats["segments"] <= 4
+    timestamps = [r["timestamp_unix"] for r in log.query(since=2500.0)]
+    assert timestamps == sorted(timestamps)
+    assert timestamps[-1] == 2999.0
+
+
+def test_restart_appends_to_a_new_segment(tmp_path):
+    first = DecisionLog(str(tmp_path))
+    first.start()
+    _append(first, variant_id=1, now=1000.0)
+    first.stop()
+
+    second = DecisionLog(str(tmp_path))
+    second.start()
+    _append(second, variant_id=2, now=2000.0)
+    second.stop()
+
+    assert [r["variant_id"] for r in second.query()] == [1, 2]
+    assert len(second.segments()) == 2
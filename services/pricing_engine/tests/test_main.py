@@ -4,21 +4,28 @@ import os
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
 
+import json
+
 import pytest
 import pytest_asyncio
 from httpx import ASGITransport, AsyncClient
 
 import decision_cache
+import decision_log
+import rule_engine
 from decision_cache import reset_cache
 from main import app
+from pricing_analytics import reset_analytics
 
 
 @pytest.fixture(autouse=True)
 def clear_cache():
-    """Reset the decision cache before each test."""
+    """Reset the decision cache and analytics before each test."""
     reset_cache()
+    reset_analytics()
     yield
     reset_cache()
+    reset_analytics()
 
 
 @pytest.mark.asyncio
@@ -65,6 +72,47 @@ async def test_cache_stats_grows_after_price_calls():
     assert stats["total_decisions"] >= 3
 
 
+@pytest.mark.asyncio
+async def test_analytics_aggregate_price_calls():
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        for variant_id in (10, 10, 20):
+            await client.post("/price", json={"variant_id": variant_id, "base_price": 19.99, "cart_total": 300.0})
+        response = await client.get("/pricing/analytics", params={"top": 1})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["decisions"] == 3
+    assert body["top_variants"] == [{"variant_id": 10, "count": 2}]
+    assert sum(bucket["count"] for bucket in body["discount_histogram"]) == 3
+
+
+@pytest.mark.asyncio
+async def test_logged_decisions_are_streamed_as_ndjson(tmp_path, monkeypatch):
+    log = decision_log.DecisionLog(str(tmp_path))
+    log.start()
+    monkeypatch.setattr(decision_log, "_log", log)
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        for variant_id in (10, 20, 10):
+            await client.post("/price", json={"variant_id": variant_id, "base_price": 19.99, "cart_total": 300.0})
+        log.flush()
+        response = await client.get("/pricing/decisions", params={"variant_id": 10})
+    log.stop()
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    records = [json.loads(line) for line in response.text.splitlines()]
+    assert [r["variant_id"] for r in records] == [10, 10]
+
+
+@pytest.mark.asyncio
+async def test_logged_decisions_404_when_log_disabled():
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        response = await client.get("/pricing/decisions")
+
+    assert response.status_code == 404
+
+
 @pytest.mark.asyncio
 async def test_price_with_dd_trace_headers():
     """Ensure the /price endpoint does not crash when W3C trace headers are present."""
@@ -77,3 +125,173 @@ async def test_price_with_dd_trace_headers():
         response = await client.post("/price", json=payload, headers=headers)
 
     assert response.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_price_batch_returns_items_in_order():
+    payload = {
+        "items": [
+            {"variant_id": 42, "base_price": 29.99, "cart_total": 60.0},
+            {"variant_id": 99999, "base_price": 10.0, "cart_total": 0.0},
+            {"variant_id": 7, "base_price": 5.0, "cart_total": 150.0},
+        ]
+    }
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        response = await client.post("/price/batch", json=payload)
+        stats = (await client.get("/pricing/cache-stats")).json()
+
+    assert response.status_code == 200
+    items = response.json()["items"]
+    assert [i["variant_id"] for i in items] == [42, 99999, 7]
+    assert items[1]["final_price"] == pytest.approx(10.0)
+    assert items[1]["rule_matched"] is None
+    assert stats["total_decisions"] == 3
+
+
+@pytest.mark.asyncio
+async def test_price_batch_rejects_empty_batch():
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        response = await client.post("/price/batch", json={"items": []})
+
+    assert response.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_out_of_range_variant_id_is_rejected():
+    payload = {"variant_id": 2**63, "base_price": 10.0, "cart_total": 0.0}
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        single = await client.post("/price", json=payload)
+        batch = await client.post("/price/batch", json={"items": [{**payload, "variant_id": -1}]})
+
+    assert single.status_code == 422
+    assert batch.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_explain_decision_rebuilds_snapshot():
+    payload = {"variant_id": 120, "base_price": 40.0, "cart_total": 150.0}
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        priced = (await client.post("/price", json=payload)).json()
+        response = await client.get(f"/pricing/decisions/{priced['decision_id']}/explain")
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["variant_id"] == 120
+    assert body["rule_matched"] == priced["rule_matched"]
+    assert len(body["rule_snapshot"]) == priced["rules_evaluated"]
+
+
+@pytest.mark.asyncio
+async def test_explain_unknown_decision_returns_404():
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        response = await client.get("/pricing/decisions/999999/explain")
+
+    assert response.status_code == 404
+
+
+@pytest.fixture
+def restore_ruleset():
+    ruleset, history = rule_engine._current, rule_engine._history.copy()
+    yield
+    rule_engine._current = ruleset
+    rule_engine._history = history
+
+
+@pytest.mark.asyncio
+async def test_admin_rule_lifecycle_bumps_ruleset_version(restore_ruleset):
+    rule = {"rule_id": 9_000_000, "variant_range": [42, 42], "cart_min": 0.0, "discount_pct": 0.5, "priority": 1000}
+    payload = {"variant_id": 42, "base_price": 20.0, "cart_total": 10.0}
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        before = (await client.post("/price", json=payload)).json()
+        created = await client.post("/admin/rules", json=rule)
+        duplicate = await client.post("/admin/rules", json=rule)
+        priced = (await client.post("/price", json=payload)).json()
+        updated = await client.put("/admin/rules/9000000", json={**rule, "discount_pct": 0.25})
+        repriced = (await client.post("/price", json=payload)).json()
+        deleted = await client.delete("/admin/rules/9000000")
+        missing = await client.delete("/admin/rules/9000000")
+
+    assert created.status_code == 201
+    assert created.json()["ruleset_version"] == before["ruleset_version"] + 1
+    assert duplicate.status_code == 409
+    assert priced["rule_matched"] == 9_000_000
+    assert priced["final_price"] == pytest.approx(10.0)
+    assert priced["ruleset_version"] == created.json()["ruleset_version"]
+    assert updated.status_code == 200
+    assert repriced["final_price"] == pytest.approx(15.0)
+    assert deleted.json()["ruleset_version"] == before["ruleset_version"] + 3
+    assert missing.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_admin_rejects_rules_outside_the_indexed_ranges(restore_ruleset):
+    rule = {"rule_id": 9_000_001, "variant_range": [1, 2], "cart_min": 0.0, "discount_pct": 0.1, "priority": 1}
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        huge_id = await client.post("/admin/rules", json={**rule, "rule_id": 2**63})
+        wide = await client.post("/admin/rules", json={**rule, "variant_range": [1, 2**31]})
+        reversed_range = await client.put("/admin/rules", json=[{**rule, "variant_range": [5, 1]}])
+        huge_priority = await client.post("/admin/rules", json={**rule, "priority": 2**63})
+        stats = (await client.get("/pricing/ruleset-stats")).json()
+
+    assert [r.status_code for r in (huge_id, wide, reversed_range, huge_priority)] == [422, 422, 422, 422]
+    assert stats["ruleset_version"] == rule_engine.get_ruleset().version
+
+
+@pytest.mark.asyncio
+async def test_admin_changes_refused_for_shared_ruleset(restore_ruleset, monkeypatch):
+    monkeypatch.setattr(rule_engine, "RULES_SHARED_PATH", "/dev/shm/pricing-rules.bin")
+    rule = {"rule_id": 9_000_002, "variant_range": [1, 2], "cart_min": 0.0, "discount_pct": 0.1, "priority": 1}
+    version = rule_engine.get_ruleset().version
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        created = await client.post("/admin/rules", json=rule)
+        loaded = await client.put("/admin/rules", json=[rule])
+
+    assert (created.status_code, loaded.status_code) == (409, 409)
+    assert "PRICING_RULES_SHARED_PATH" in created.json()["detail"]
+    assert rule_engine.get_ruleset().version == version
+
+
+@pytest.mark.asyncio
+async def test_conditional_rule_applies_to_matching_requests(restore_ruleset):
+    rules = [
+        {"rule_id": 1, "variant_range": [1, 100], "cart_min": 0.0, "discount_pct": 0.1, "priority": 5},
+        {"rule_id": 2, "variant_range": [1, 100], "cart_min": 0.0, "discount_pct": 0.5, "priority": 10,
+         "min_quantity": 3, "taxon_ids": [7]},
+    ]
+    payload = {"variant_id": 60, "base_price": 10.0, "cart_total": 0.0}
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        await client.put("/admin/rules", json=rules)
+        plain = (await client.post("/price", json=payload)).json()
+        bulk = (await client.post("/price", json={**payload, "quantity": 3, "taxon_ids": [7]})).json()
+        items = [payload, {**payload, "quantity": 3, "taxon_ids": [7]}]
+        batch = (await client.post("/price/batch", json={"items": items})).json()
+
+    assert plain["rule_matched"] == 1
+    assert bulk["rule_matched"] == 2
+    assert bulk["final_price"] == pytest.approx(5.0)
+    assert [item["rule_matched"] for item in batch["items"]] == [1, 2]
+
+
+@pytest.mark.asyncio
+async def test_admin_load_ruleset_replaces_rules(restore_ruleset):
+    rules = [
+        {"rule_id": 1, "variant_range": [1, 100], "cart_min": 0.0, "discount_pct": 0.1, "priority": 5},
+        {"rule_id": 2, "variant_range": [50, 150], "cart_min": 0.0, "discount_pct": 0.2, "priority": 10},
+    ]
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        loaded = await client.put("/admin/rules", json=rules)
+        stats = (await client.get("/pricing/ruleset-stats")).json()
+        priced = (await client.post("/price", json={"variant_id": 60, "base_price": 10.0, "cart_total": 0.0})).json()
+
+    assert loaded.status_code == 200
+    assert stats["rules_count"] == 2
+    assert stats["ruleset_version"] == loaded.json()["ruleset_version"]
+    assert priced["rule_matched"] == 2
@@ -0,0 +1,65 @@
+"""Tests for the streaming pricing analytics."""
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from array import array
+
+import pytest
+
+from pricing_analytics import _Aggregates
+from rule_engine import PricingResult
+
+
+def _result(variant_id, base_price, discount_pct, rule_matched):
+    return PricingResult(
+        variant_id=variant_id,
+        base_price=base_price,
+        final_price=round(base_price * (1 - discount_pct), 2),
+        discount_pct=discount_pct,
+        rule_matched=rule_matched,
+        rules_evaluated=1,
+        matched_rule_ids=array("q", [rule_matched] if rule_matched is not None else []),
+    )
+
+
+def test_aggregates_count_rule_hits_and_variants():
+    agg = _Aggregates()
+    agg.record(1, _result(1, 10.0, 0.10, rule_matched=7))
+    agg.record(1, _result(1, 10.0, 0.10, rule_matched=7))
+    agg.record(2, _result(2, 10.0, 0.0, rule_matched=None))
+
+    snapshot = agg.snapshot(top=5)
+
+    assert snapshot["decisions"] == 3
+    assert snapshot["matched"] == 2
+    assert snapshot["top_rules"] == [{"rule_id": 7, "count": 2}]
+    assert snapshot["top_variants"] == [{"variant_id": 1, "count": 2}, {"variant_id": 2, "count": 1}]
+
+
+def test_discount_histogram_buckets():
+    agg = _Aggregates()
+    for pct in (0.0, 0.04, 0.05, 0.30, 1.0):
+        agg.record(1, _result(1, 100.0, pct, rule_matched=1))
+
+    counts = [bucket["count"] for bucket in agg.snapshot(top=1)["discount_histogram"]]
+
+    assert len(counts) == 20
+    assert counts[0] == 2
+    assert counts[1] == 1
+    assert counts[6] == 1
+    assert counts[19] == 1
+
+
+def test_price_deltas():
+    agg = _Aggregates()
+    agg.record(1, _result(1, 100.0, 0.20, rule_matched=1))
+    agg.record(2, _result(2, 50.0, 0.0, rule_matched=None))
+
+    delta = agg.snapshot(top=1)["price_delta"]
+
+    assert delta["discount_total"] == pytest.approx(20.0)
+    assert delta["mean_discount"] == pytest.approx(10.0)
+    assert delta["mean_discount_pct"] == pytest.approx(20.0 / 150.0, abs=1e-4)
+    assert delta["max_discount"] == pytest.approx(20.0)
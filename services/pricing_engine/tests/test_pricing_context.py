@@ -0,0 +1,102 @@
+"""Tests for the cached pricing context."""
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import threading
+import time
+
+import pytest
+
+import pricing_context
+from pricing_context import PricingContext, PricingContextUnavailable, _ContextCache
+
+
+@pytest.fixture
+def fetches(monkeypatch):
+    """Replace the upstream fetch with a slow, counting fake."""
+    calls = []
+
+    def fake_fetch(version):
+        calls.append(version)
+        time.sleep(0.05)
+        return PricingContext(version=version, fetched_at=time.monotonic(), fetch_ms=50.0)
+
+    monkeypatch.setattr(pricing_context, "_fetch_from_authority", fake_fetch)
+    return calls
+
+
+def test_fresh_context_is_served_from_cache(fetches):
+    cache = _ContextCache(ttl_s=60)
+
+    first = cache.get()
+    second = cache.get()
+
+    assert first is second
+    assert len(fetches) == 1
+    assert cache.stats()["hits"] == 1
+
+
+def test_concurrent_cold_misses_collapse_into_one_fetch(fetches):
+    cache = _ContextCache(ttl_s=60)
+    results = []
+
+    threads = [threading.Thread(target=lambda: results.append(cache.get())) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(fetches) == 1
+    assert len({r.version for r in results}) == 1
+    assert cache.stats()["coalesced_waits"] == 7
+
+
+def test_stale_context_is_served_while_refreshing(fetches):
+    cache = _ContextCache(ttl_s=0.01)
+    first = cache.get()
+    time.sleep(0.02)
+
+    stale = cache.get()
+
+    assert stale is first
+    assert cache.stats()["stale_served"] == 1
+    time.sleep(0.1)
+    assert len(fetches) == 2
+    assert cache.get().version == 2
+
+
+def test_zero_ttl_fetches_every_time(fetches):
+    cache = _ContextCache(ttl_s=0)
+
+    cache.get()
+    cache.get()
+
+    assert len(fetches) == 2
+
+
+def test_failed_cold_fetch_raises(monkeypatch):
+    def failing_fetch(version):
+        raise ConnectionError("pricing authority unreachable")
+
+    monkeypatch.setattr(pricing_context, "_fetch_from_authority", failing_fetch)
+    cache = _ContextCache(ttl_s=60)
+
+    with pytest.raises(PricingContextUnavailable):
+        cache.get()
+    stats = cache.stats()
+    assert stats["refresh_failures"] == 1
+    assert stats["last_error"] == "pricing authority unreachable"
+
+
+def test_stats_report_age_and_refresh_latency(fetches):
+    cache = _ContextCache(ttl_s=60)
+    cache.refresh()
+
+    stats = cache.stats()
+
+    assert stats["version"] == 1
+    assert stats["age_ms"] >= 0
+    assert stats["last_refresh_ms"] == 50.0
+    assert stats["refreshing"] is False
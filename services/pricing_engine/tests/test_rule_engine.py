@@ -4,9 +4,49 @@ import os
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
 
+import random
+from dataclasses import replace
+import threading
+
 import pytest
 
-from rule_engine import RULES_COUNT, PricingResult, evaluate
+import rule_engine
+from eval_worker import WORKER_ENV
+from rule_engine import (
+    RULES_COUNT,
+    PricingResult,
+    PricingRule,
+    RequestFacts,
+    _ConditionFilter,
+    _DecisionTable,
+    add_rule,
+    delete_rule,
+    evaluate,
+    evaluate_async,
+    evaluate_batch,
+    get_rule_snapshot,
+    get_ruleset,
+    get_ruleset_stats,
+    replace_rules,
+    rules_from_dicts,
+    session_segment,
+    shutdown_eval_pool,
+    start_eval_pool,
+    update_rule,
+)
+
+_RULES = get_ruleset().rules
+_INDEX = get_ruleset().index
+RULESET_VERSION = get_ruleset().version
+
+
+@pytest.fixture
+def restore_ruleset():
+    """Restore the original ruleset and version history after a test mutates them."""
+    ruleset, history = rule_engine._current, rule_engine._history.copy()
+    yield
+    rule_engine._current = ruleset
+    rule_engine._history = history
 
 
 def test_evaluate_returns_valid_result():
@@ -17,8 +57,9 @@ def test_evaluate_returns_valid_result():
     assert result.base_price == 29.99
     assert isinstance(result.final_price, float)
     assert isinstance(result.discount_pct, float)
-    assert result.rules_evaluated == RULES_COUNT
-    assert isinstance(result.rule_snapshot, list)
+    assert result.rules_evaluated <= RULES_COUNT
+    assert result.ruleset_version == RULESET_VERSION
+    assert len(result.matched_rule_ids) == result.rules_evaluated
 
 
 def test_evaluate_is_deterministic():
@@ -34,7 +75,25 @@ def test_evaluate_is_deterministic():
 def test_rules_evaluated_count():
     result = evaluate(100, 49.99, 100.0)
 
-    assert result.rules_evaluated == RULES_COUNT
+    assert result.rules_evaluated == len(result.matched_rule_ids)
+    assert result.rules_evaluated < RULES_COUNT
+
+
+@pytest.mark.parametrize(
+    "variant_id,cart_total",
+    [(1, 0.0), (1, 250.0), (250, 75.0), (500, 199.99), (501, 10.0), (750, 120.0), (1000, 300.0)],
+)
+def test_index_matches_linear_scan(variant_id, cart_total):
+    expected = [
+        r for r in _RULES
+        if r.variant_range[0] <= variant_id <= r.variant_range[1] and cart_total >= r.cart_min
+    ]
+    best = max(expected, key=lambda r: r.priority) if expected else None
+
+    result = evaluate(variant_id, 10.0, cart_total)
+
+    assert result.rule_matched == (best.rule_id if best else None)
+    assert sorted(result.matched_rule_ids) == [r.rule_id for r in expected]
 
 
 def test_unknown_variant_returns_base_price():
@@ -44,7 +103,7 @@ def test_unknown_variant_returns_base_price():
     assert result.final_price == result.base_price
     assert result.discount_pct == 0.0
     assert result.rule_matched is None
-    assert result.rule_snapshot == []
+    assert len(result.matched_rule_ids) == 0
 
 
 def test_zero_price():
@@ -52,3 +111,472 @@ def test_zero_price():
 
     assert result.final_price == 0.0
     assert result.base_price == 0.0
+
+
+def test_compiled_table_matches_index():
+    table = _DecisionTable(_RULES, _INDEX)
+
+    for variant_id in (0, 1, 137, 500, 501, 999, 1000, 1001):
+        for cart_total in (0.0, 25.0, 99.5, 150.0, 199.99, 500.0):
+            expected = evaluate(variant_id, 10.0, cart_total)
+            winner = table.lookup(variant_id, cart_total)
+            assert (winner.rule_id if winner else None) == expected.rule_matched
+
+
+def test_compiled_table_stats():
+    stats = _DecisionTable(_RULES, _INDEX).stats()
+
+    assert stats["segments"] > 0
+    assert stats["steps"] > 0
+    assert stats["build_ms"] >= 0
+    assert stats["memory_kb"] > 0
+
+
+def test_ruleset_stats_default_mode():
+    stats = get_ruleset_stats()
+
+    assert stats["rules_count"] == RULES_COUNT
+    assert stats["compiled"] is False
+    assert stats["decision_table"] is None
+
+
+def test_evaluate_batch_matches_evaluate():
+    items = [(v, 19.99, c) for v in (1, 250, 500, 501, 1000, 99999) for c in (0.0, 80.0, 199.99)]
+
+    results = evaluate_batch(items)
+
+    assert len(results) == len(items)
+    for (variant_id, base_price, cart_total), result in zip(items, results):
+        expected = evaluate(variant_id, base_price, cart_total)
+        assert result.variant_id == variant_id
+        assert result.rule_matched == expected.rule_matched
+        assert result.final_price == expected.final_price
+        assert sorted(result.matched_rule_ids) == sorted(expected.matched_rule_ids)
+        assert result.rules_evaluated == RULES_COUNT
+
+
+def test_evaluate_batch_chunks_large_batches(monkeypatch):
+    import rule_engine
+
+    monkeypatch.setattr(rule_engine, "BATCH_MAX_CELLS", RULES_COUNT * 2)
+    items = [(v, 10.0, 100.0) for v in range(1, 8)]
+
+    results = evaluate_batch(items)
+
+    assert [r.rule_matched for r in results] == [evaluate(*item).rule_matched for item in items]
+
+
+def test_evaluate_batch_matches_evaluate_with_negative_priorities(restore_ruleset):
+    replace_rules([
+        PricingRule(rule_id=0, variant_range=(1, 10), cart_min=0.0, discount_pct=0.1, priority=-5),
+        PricingRule(rule_id=1, variant_range=(20, 30), cart_min=0.0, discount_pct=0.2, priority=1),
+        PricingRule(rule_id=2, variant_range=(5, 25), cart_min=0.0, discount_pct=0.3, priority=-2**63 + 1),
+    ])
+    items = [(v, 100.0, 0.0) for v in (0, 5, 7, 15, 25, 40)]
+
+    results = evaluate_batch(items)
+
+    assert [r.rule_matched for r in results] == [evaluate(*item).rule_matched for item in items]
+    assert [r.rule_matched for r in results] == [None, 0, 0, 2, 1, None]
+    assert results[1].final_price == 90.0
+
+
+def test_get_rule_snapshot_rebuilds_matched_rules():
+    result = evaluate(300, 25.0, 150.0)
+
+    snapshot = get_rule_snapshot(result.matched_rule_ids, result.ruleset_version)
+
+    assert [s["rule_id"] for s in snapshot] == sorted(result.matched_rule_ids)
+    assert all(s["variant_range"][0] <= 300 <= s["variant_range"][1] for s in snapshot)
+    assert all(s["cart_min"] <= 150.0 for s in snapshot)
+
+
+def test_get_rule_snapshot_unknown_version():
+    with pytest.raises(KeyError):
+        get_rule_snapshot([1, 2], RULESET_VERSION + 1)
+
+
+@pytest.mark.asyncio
+async def test_evaluate_async_matches_evaluate():
+    expected = evaluate(321, 45.0, 120.0)
+
+    result = await evaluate_async(321, 45.0, 120.0)
+
+    assert result.rule_matched == expected.rule_matched
+    assert result.final_price == expected.final_price
+    assert sorted(result.matched_rule_ids) == sorted(expected.matched_rule_ids)
+
+
+@pytest.mark.asyncio
+async def test_evaluate_async_in_process_pool():
+    expected = evaluate(654, 12.5, 90.0)
+
+    start_eval_pool(workers=1)
+    try:
+        result = await evaluate_async(654, 12.5, 90.0)
+    finally:
+        shutdown_eval_pool()
+
+    assert result.rule_matched == expected.rule_matched
+    assert result.final_price == expected.final_price
+    assert sorted(result.matched_rule_ids) == sorted(expected.matched_rule_ids)
+
+
+def test_eval_workers_skip_the_import_time_build():
+    start_eval_pool(workers=1)
+    try:
+        worker_flag = rule_engine._POOL.submit(os.getenv, WORKER_ENV).result()
+        worker_version = rule_engine._POOL.submit(rule_engine._warm_worker).result()
+    finally:
+        shutdown_eval_pool()
+
+    assert worker_flag == "1"
+    assert WORKER_ENV not in os.environ
+    assert worker_version == get_ruleset().version
+
+
+@pytest.mark.asyncio
+async def test_evaluate_async_without_pool_runs_off_the_event_loop(monkeypatch):
+    threads = []
+    match = rule_engine._match
+
+    def recording_match(*args):
+        threads.append(threading.current_thread())
+        return match(*args)
+
+    monkeypatch.setattr(rule_engine, "_match", recording_match)
+
+    result = await evaluate_async(321, 45.0, 120.0)
+
+    assert result.rule_matched == evaluate(321, 45.0, 120.0).rule_matched
+    assert threads and threads[0] is not threading.main_thread()
+
+
+@pytest.mark.asyncio
+async def test_rule_change_refreshes_the_pool_in_the_background(restore_ruleset):
+    rule = PricingRule(rule_id=10_000_009, variant_range=(40, 45), cart_min=0.0, discount_pct=0.5, priority=1000)
+    start_eval_pool(workers=1)
+    try:
+        refreshes = []
+        started = rule_engine._start_pool
+        with pytest.MonkeyPatch.context() as mp:
+            mp.setattr(rule_engine, "_start_pool", lambda *a: refreshes.append(a) or started(*a))
+            version = add_rule(rule)
+            # The admin change returns before the new pool is up; until then
+            # evaluations match against the new version in this process.
+            assert (await evaluate_async(42, 100.0, 500.0)).rule_matched == rule.rule_id
+            refresh = rule_engine._pool_refresh
+            if refresh is not None:
+                refresh.join()
+
+        assert rule_engine._POOL_VERSION == version
+        assert [a[1].version for a in refreshes] == [version]
+        pooled = await evaluate_async(42, 100.0, 500.0)
+    finally:
+        shutdown_eval_pool()
+
+    assert pooled.rule_matched == rule.rule_id
+    assert pooled.ruleset_version == version
+
+
+def test_add_rule_swaps_in_new_version(restore_ruleset):
+    before = evaluate(42, 100.0, 500.0)
+    rule = PricingRule(rule_id=10_000_001, variant_range=(40, 45), cart_min=0.0, discount_pct=0.5, priority=1000)
+
+    version = add_rule(rule)
+
+    after = evaluate(42, 100.0, 500.0)
+    assert version == before.ruleset_version + 1
+    assert after.ruleset_version == version
+    assert after.rule_matched == rule.rule_id
+    assert after.final_price == pytest.approx(50.0)
+    assert evaluate(46, 100.0, 500.0).rule_matched != rule.rule_id
+    # Decisions made against the previous version can still be explained.
+    assert len(get_rule_snapshot(before.matched_rule_ids, before.ruleset_version)) == before.rules_evaluated
+
+
+def test_update_and_delete_rule(restore_ruleset):
+    rule = PricingRule(rule_id=10_000_002, variant_range=(7, 7), cart_min=0.0, discount_pct=0.1, priority=1000)
+    add_rule(rule)
+
+    update_rule(PricingRule(rule_id=rule.rule_id, variant_range=(8, 8), cart_min=0.0, discount_pct=0.2, priority=1000))
+    assert evaluate(7, 10.0, 300.0).rule_matched != rule.rule_id
+    assert evaluate(8, 10.0, 300.0).discount_pct == pytest.approx(0.2)
+
+    delete_rule(rule.rule_id)
+    assert evaluate(8, 10.0, 300.0).rule_matched != rule.rule_id
+    with pytest.raises(KeyError):
+        delete_rule(rule.rule_id)
+
+
+def test_add_duplicate_rule_rejected(restore_ruleset):
+    with pytest.raises(ValueError):
+        add_rule(
+            PricingRule(rule_id=_RULES[0].rule_id, variant_range=(1, 2), cart_min=0.0, discount_pct=0.1, priority=1)
+        )
+
+
+def test_incremental_index_matches_full_rebuild(restore_ruleset):
+    rng = random.Random(7)
+    for n in range(50):
+        low = rng.randint(1, 900)
+        add_rule(
+            PricingRule(
+                rule_id=20_000_000 + n,
+                variant_range=(low, low + rng.randint(0, 100)),
+                cart_min=rng.uniform(0, 200),
+                discount_pct=rng.uniform(0, 0.3),
+                priority=rng.randint(1, 200),
+            )
+        )
+    for rule in _RULES[:50]:
+        delete_rule(rule.rule_id)
+
+    incremental = get_ruleset()
+    rebuilt = rule_engine.Ruleset.build(incremental.rules, version=0)
+    for variant_id in range(0, 1001, 37):
+        for cart_total in (0.0, 60.0, 130.0, 250.0):
+            ids_a, best_a = incremental.index.lookup(variant_id, cart_total)
+            ids_b, best_b = rebuilt.index.lookup(variant_id, cart_total)
+            assert sorted(ids_a) == sorted(ids_b)
+            assert best_a is best_b
+
+
+def test_incremental_table_matches_full_compile(restore_ruleset):
+    ruleset = get_ruleset()
+    table = _DecisionTable(ruleset.rules, ruleset.index)
+    added = PricingRule(rule_id=30_000_000, variant_range=(100, 180), cart_min=20.0, discount_pct=0.25, priority=150)
+    removed = _RULES[3]
+
+    index = ruleset.index.with_changes([added], [removed], ruleset.rules_by_id)
+    updated = table.with_changes(index, [added.variant_range, removed.variant_range])
+    rules = [r for r in ruleset.rules if r.rule_id != removed.rule_id] + [added]
+    compiled = _DecisionTable(rules, index)
+
+    for variant_id in range(0, 1001, 13):
+        for cart_total in (0.0, 25.0, 100.0, 199.0):
+            assert updated.lookup(variant_id, cart_total) is compiled.lookup(variant_id, cart_total)
+
+
+def test_replace_rules(restore_ruleset):
+    version = replace_rules([PricingRule(rule_id=1, variant_range=(1, 10), cart_min=0.0, discount_pct=0.1, priority=1)])
+
+    assert get_ruleset_stats()["rules_count"] == 1
+    assert get_ruleset_stats()["ruleset_version"] == version
+    assert evaluate(5, 10.0, 0.0).rule_matched == 1
+    assert evaluate(11, 10.0, 0.0).rule_matched is None
+
+
+def _conditional_rules(count):
+    rng = random.Random(7)
+    rules = []
+    for i in range(count):
+        low = rng.randint(1, 50)
+        conditions = {}
+        if rng.random() < 0.3:
+            conditions["active_from"] = rng.choice([None, 1000.0, 2000.0])
+            conditions["active_until"] = rng.choice([None, 3000.0])
+        if rng.random() < 0.3:
+            conditions["session_segments"] = frozenset(rng.sample(range(64), 8))
+        if rng.random() < 0.3:
+            conditions["min_quantity"] = rng.choice([2, 5, 10])
+        if rng.random() < 0.3:
+            conditions["taxon_ids"] = frozenset(rng.sample(range(1, 10), 2))
+        rules.append(PricingRule(
+            rule_id=i, variant_range=(low, rng.randint(low, 100)), cart_min=rng.uniform(0.0, 100.0),
+            discount_pct=rng.uniform(0.0, 0.3), priority=rng.randint(1, 20), **conditions,
+        ))
+    return rules
+
+
+def _applies(rule, variant_id, cart_total, facts):
+    low, high = rule.variant_range
+    return (
+        low <= variant_id <= high
+        and cart_total >= rule.cart_min
+        and (rule.active_from is None or rule.active_from <= facts.timestamp)
+        and (rule.active_until is None or facts.timestamp < rule.active_until)
+        and (rule.session_segments is None
+             or (facts.session_id is not None and session_segment(facts.session_id) in rule.session_segments))
+        and facts.quantity >= rule.min_quantity
+        and (rule.taxon_ids is None or bool(rule.taxon_ids & set(facts.taxon_ids)))
+    )
+
+
+def test_conditional_rules_match_linear_scan(restore_ruleset):
+    rules = _conditional_rules(400)
+    replace_rules(rules)
+    rng = random.Random(11)
+    cases = [
+        (rng.randint(1, 100), rng.uniform(0.0, 120.0), RequestFacts(
+            session_id=rng.choice([None, "s-1", "s-2", "s-3"]),
+            quantity=rng.choice([1, 2, 5, 12]),
+            taxon_ids=tuple(rng.sample(range(1, 10), rng.randint(0, 3))),
+            timestamp=rng.choice([500.0, 1500.0, 2500.0, 3500.0]),
+        ))
+        for _ in range(200)
+    ]
+
+    batch = evaluate_batch([(v, 10.0, c) for v, c, _ in cases], [f for _, _, f in cases])
+    for (variant_id, cart_total, facts), batched in zip(cases, batch):
+        expected = [r for r in rules if _applies(r, variant_id, cart_total, facts)]
+        best = max(expected, key=lambda r: (r.priority, -r.rule_id)) if expected else None
+        result = evaluate(variant_id, 10.0, cart_total, facts)
+
+        assert result.rule_matched == (best.rule_id if best else None)
+        assert sorted(result.matched_rule_ids) == [r.rule_id for r in expected]
+        assert batched.rule_matched == result.rule_matched
+
+
+def test_condition_filter_changes_match_a_fresh_build():
+    rules = _conditional_rules(300)
+    rng = random.Random(5)
+    live = {rule.rule_id: rule for rule in rules[:200]}
+    pending = rules[200:]
+    conditions = original = _ConditionFilter(list(live.values()))
+    initial = _ConditionFilter(list(live.values()))
+
+    for _ in range(40):
+        removed = rng.sample(sorted(live.values(), key=lambda r: r.rule_id), 3)
+        added = [pending.pop(), pending.pop(), replace(removed[0], priority=removed[0].priority + 7)]
+        conditions = conditions.with_changes(added, removed)
+        for rule in removed:
+            del live[rule.rule_id]
+        live.update((rule.rule_id, rule) for rule in added)
+
+    fresh = _ConditionFilter(list(live.values()))
+    assert len(conditions) == len(fresh) == len(live)
+    # Bits freed by removals are reused, so the filter is no wider than the rules it has held at once.
+    assert len(conditions._slots) == 200
+    for _ in range(300):
+        variant_id, cart_total = rng.randint(1, 100), rng.uniform(0.0, 120.0)
+        facts = RequestFacts(
+            session_id=rng.choice([None, "s-1", "s-2"]),
+            quantity=rng.choice([1, 2, 5, 12]),
+            taxon_ids=tuple(rng.sample(range(1, 10), rng.randint(0, 3))),
+            timestamp=rng.choice([500.0, 1500.0, 2500.0, 3500.0]),
+        )
+        ids, best = conditions.lookup(variant_id, cart_total, facts)
+        expected_ids, expected_best = fresh.lookup(variant_id, cart_total, facts)
+        assert sorted(ids) == sorted(expected_ids)
+        assert best == expected_best
+        # Earlier versions are left untouched for evaluations still using them.
+        assert original.lookup(variant_id, cart_total, facts) == initial.lookup(variant_id, cart_total, facts)
+
+
+def test_conditional_rule_changes(restore_ruleset):
+    replace_rules([PricingRule(rule_id=1, variant_range=(1, 10), cart_min=0.0, discount_pct=0.1, priority=1)])
+    vip = PricingRule(rule_id=2, variant_range=(1, 10), cart_min=0.0, discount_pct=0.3, priority=5,
+                      session_segments=frozenset({session_segment("vip")}))
+    facts = RequestFacts(session_id="vip")
+
+    add_rule(vip)
+    assert evaluate(5, 10.0, 0.0, facts).rule_matched == 2
+    assert evaluate(5, 10.0, 0.0).rule_matched == 1
+    assert get_ruleset_stats()["conditional_rules"] == 1
+
+    update_rule(PricingRule(rule_id=2, variant_range=(1, 10), cart_min=0.0, discount_pct=0.3, priority=5))
+    assert evaluate(5, 10.0, 0.0).rule_matched == 2
+    assert get_ruleset_stats()["conditional_rules"] == 0
+
+    delete_rule(2)
+    assert evaluate(5, 10.0, 0.0, facts).rule_matched == 1
+
+
+def test_conditional_rule_snapshot_round_trips(restore_ruleset):
+    rule = PricingRule(rule_id=3, variant_range=(1, 10), cart_min=0.0, discount_pct=0.1, priority=1,
+                       active_until=5000.0, min_quantity=3, taxon_ids=frozenset({4, 2}))
+    version = replace_rules([rule])
+
+    [snapshot] = get_rule_snapshot([3], version)
+
+    assert snapshot["taxon_ids"] == [2, 4]
+    assert "session_segments" not in snapshot
+    assert rules_from_dicts([snapshot]) == [rule]
+
+
+@pytest.mark.parametrize(
+    "conditions",
+    [{"active_from": 10.0, "active_until": 5.0}, {"session_segments": frozenset({64})}, {"min_quantity": 0}],
+)
+def test_invalid_conditions_rejected(conditions, restore_ruleset):
+    rule = PricingRule(rule_id=1, variant_range=(1, 10), cart_min=0.0, discount_pct=0.1, priority=1, **conditions)
+
+    with pytest.raises(ValueError):
+        replace_rules([rule])
+
+
+@pytest.mark.parametrize(
+    "fields",
+    [{"variant_range": (-1, 10)}, {"variant_range": (1, 2**31)}, {"rule_id": 2**63},
+     {"priority": 2**63}, {"priority": -2**63}],
+)
+def test_rules_outside_indexed_ranges_rejected(fields, restore_ruleset):
+    rule = PricingRule(**{"rule_id": 1, "variant_range": (1, 10), "cart_min": 0.0, "discount_pct": 0.1,
+                          "priority": 1, **fields})
+
+    with pytest.raises(ValueError):
+        replace_rules([rule])
+
+
+def test_packed_ruleset_matches_in_memory_ruleset(tmp_path):
+    path = str(tmp_path / "rules.bin")
+    rule_engine.PackedRuleset.write(get_ruleset(), path, b"k" * 32)
+
+    packed = rule_engine.PackedRuleset.attach(path)
+
+    assert packed.version == RULESET_VERSION
+    assert len(packed.rules_by_id) == len(_RULES)
+    assert packed.rules_by_id[_RULES[5].rule_id] == _RULES[5]
+    assert -1 not in packed.rules_by_id
+    for variant_id in (0, 1, 250, 500, 501, 999, 1000, 5000):
+        for cart_total in (0.0, 50.0, 150.0, 250.0):
+            ids_a, best_a = packed.index.lookup(variant_id, cart_total)
+            ids_b, best_b = _INDEX.lookup(variant_id, cart_total)
+            assert sorted(ids_a) == sorted(ids_b)
+            assert best_a == best_b
+
+
+def test_shared_ruleset_built_once_then_attached(tmp_path, monkeypatch):
+    path = str(tmp_path / "rules.bin")
+    builds = []
+    real_write = rule_engine.PackedRuleset.write
+
+    def counting_write(ruleset, path, source_key):
+        builds.append(path)
+        real_write(ruleset, path, source_key)
+
+    monkeypatch.setattr(rule_engine.PackedRuleset, "write", staticmethod(counting_write))
+
+    first = rule_engine._load_shared_ruleset(path)
+    second = rule_engine._load_shared_ruleset(path)
+
+    assert len(builds) == 1
+    assert len(first.rules_by_id) == len(second.rules_by_id) == RULES_COUNT
+
+
+def test_packed_ruleset_serves_evaluate_and_batch(tmp_path, restore_ruleset):
+    path = str(tmp_path / "rules.bin")
+    expected = [evaluate(v, 10.0, 120.0) for v in (3, 333, 777)]
+    rule_engine.PackedRuleset.write(get_ruleset(), path, b"k" * 32)
+    rule_engine._current = rule_engine.PackedRuleset.attach(path)
+
+    single = [evaluate(v, 10.0, 120.0) for v in (3, 333, 777)]
+    batch = evaluate_batch([(v, 10.0, 120.0) for v in (3, 333, 777)])
+
+    assert [r.rule_matched for r in single] == [r.rule_matched for r in expected]
+    assert [r.rule_matched for r in batch] == [r.rule_matched for r in expected]
+    assert get_ruleset_stats()["shared"] is True
+
+
+def test_packed_ruleset_refuses_changes(tmp_path, restore_ruleset, monkeypatch):
+    path = str(tmp_path / "rules.bin")
+    rule_engine.PackedRuleset.write(get_ruleset(), path, b"k" * 32)
+    monkeypatch.setattr(rule_engine, "RULES_SHARED_PATH", path)
+    rule_engine._current = rule_engine.PackedRuleset.attach(path)
+
+    with pytest.raises(rule_engine.RulesetReadOnly):
+        delete_rule(_RULES[0].rule_id)
+
+    assert isinstance(get_ruleset(), rule_engine.PackedRuleset)
+    assert len(get_ruleset().rules_by_id) == len(_RULES)